@@ -2,11 +2,17 @@
 # API 层 - REST API 接口 (API Layer - REST Endpoints)
 # ============================================================================
 
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, Response, jsonify, request, session
 from backend.database import Database
 from backend.engine import WorkflowEngine
+from backend.bulk_delete import BulkDeleter
+from backend.config import Config
+from backend.compression import compression_stats
+from backend import analytics
+import base64
+import json
 import secrets
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # 创建 Blueprint
 api = Blueprint('api', __name__, url_prefix='/api')
@@ -15,13 +21,98 @@ api = Blueprint('api', __name__, url_prefix='/api')
 db = None
 engine = None
 registry = None
+deleter = None
+archive = None
+profiler = None
 
-def init_api(database: Database, workflow_engine: WorkflowEngine, agent_registry=None):
+def init_api(database: Database, workflow_engine: WorkflowEngine, agent_registry=None, bulk_deleter=None,
+             execution_archive=None, sql_profiler=None):
     """初始化 API 层"""
-    global db, engine, registry
+    global db, engine, registry, deleter, archive, profiler
     db = database
+    archive = execution_archive
+    profiler = sql_profiler
     engine = workflow_engine
     registry = agent_registry
+    # 未注入时使用未启动的删除器（全部同步删除）
+    deleter = bulk_deleter or BulkDeleter(database)
+
+def _delete_response(job, message, **extra):
+    """删除结果：后台执行的返回 202 和任务信息"""
+    if job['status'] in ('pending', 'running'):
+        return jsonify({'success': True, 'message': '删除任务已转入后台执行', 'job': job, **extra}), 202
+    if job['status'] == 'failed':
+        return jsonify({'success': False, 'error': job['error'], 'job': job, **extra}), 500
+    return jsonify({'success': True, 'message': message, 'job': job, **extra}), 200
+
+def _fold_workflow_constants(workflow_id):
+    """工作流保存/发布后在后台执行常量折叠（不阻塞响应，失败不影响保存本身）"""
+    try:
+        engine.schedule_fold_constants(workflow_id)
+    except Exception as e:
+        print(f"[常量折叠] ⚠️ 工作流 #{workflow_id} 折叠失败: {e}")
+
+# ============================================================================
+# 列表分页与字段投影
+# ============================================================================
+# 列表接口可选参数：limit + cursor 为游标分页（下一页游标放在 X-Next-Cursor 响应头，
+# 响应体仍是数组）；fields=a,b,c 只返回指定字段。不传时行为与原来一致。
+
+MAX_PAGE_SIZE = 1000
+
+def _encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def _matches_type(value, expected):
+    # bool 是 int 的子类，游标中的 true/false 不当作 id
+    return isinstance(value, expected) and not (expected is int and isinstance(value, bool))
+
+def _decode_cursor(cursor, shape=int):
+    """解码游标并校验结构：shape 为单个类型（如 id 游标的 int）或类型元组（对应定长数组）"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('无效的分页游标')
+    if isinstance(shape, tuple):
+        valid = isinstance(value, list) and len(value) == len(shape) and \
+            all(_matches_type(item, expected) for item, expected in zip(value, shape))
+    else:
+        valid = _matches_type(value, shape)
+    if not valid:
+        raise ValueError('无效的分页游标')
+    return value
+
+def _page_args(shape=int):
+    """解析 limit/cursor；返回 (limit, 游标内容)，未分页时 limit 为 None"""
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    elif cursor:
+        limit = 100
+    return limit, (_decode_cursor(cursor, shape) if cursor else None)
+
+def _fields_arg():
+    fields = request.args.get('fields')
+    return [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+
+def _project(items, fields):
+    if not fields:
+        return items
+    return [{key: item[key] for key in fields if key in item} for item in items]
+
+def _paginate(items, limit, cursor_of):
+    """items 按 limit + 1 条查询；多出的一条表示还有下一页"""
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, _encode_cursor(cursor_of(items[-1]))
+
+def _list_response(items, next_cursor, fields=None):
+    response = jsonify(_project(items, fields))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
 # ============================================================================
 # Agent API
@@ -29,11 +120,25 @@ def init_api(database: Database, workflow_engine: WorkflowEngine, agent_registry
 
 @api.route('/agents', methods=['GET'])
 def get_agents():
-    """获取所有 Agent"""
+    """获取所有 Agent（附带延迟百分位；支持 category 过滤、游标分页和 fields 投影）"""
     try:
+        limit, cursor = _page_args()
         with db.session_scope() as db_session:
-            agents = db.get_all_agents(db_session)
-            return jsonify(agents), 200
+            agents = db.get_all_agents(
+                db_session,
+                limit=limit + 1 if limit else None,
+                after_id=cursor,
+                category=request.args.get('category')
+            )
+        agents, next_cursor = _paginate(agents, limit, lambda a: a['id'])
+        
+        fields = _fields_arg()
+        if not fields or 'latency' in fields:
+            for agent in agents:
+                agent['latency'] = engine.executor.stats.latency(agent['name'])
+        return _list_response(agents, next_cursor, fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -49,16 +154,40 @@ def get_community_data():
     try:
         include_external = request.args.get('include_external', 'true').lower() == 'true'
         use_mock = request.args.get('use_mock', 'true').lower() == 'true'
-        
-        # 获取本地数据
+        category = request.args.get('category')
+        fields = _fields_arg()
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+        agents_cursor = request.args.get('agents_cursor')
+        workflows_cursor = request.args.get('workflows_cursor')
+        
+        # 获取本地数据（Agent 和工作流各自独立分页）
         with db.session_scope() as db_session:
-            local_agents = db.get_all_agents(db_session)
-            local_workflows = db.get_all_workflows(db_session)
+            local_agents = db.get_all_agents(
+                db_session,
+                limit=limit + 1 if limit else None,
+                after_id=_decode_cursor(agents_cursor) if agents_cursor else None,
+                category=category
+            )
+            local_workflows = db.get_all_workflows(
+                db_session,
+                limit=limit + 1 if limit else None,
+                after_id=_decode_cursor(workflows_cursor) if workflows_cursor else None,
+                category=category,
+                status=request.args.get('status')
+            )
+        local_agents, next_agents = _paginate(local_agents, limit, lambda a: a['id'])
+        local_workflows, next_workflows = _paginate(local_workflows, limit, lambda w: w['id'])
         
         result = {
             'local': {
-                'agents': local_agents,
-                'workflows': local_workflows
+                'agents': _project(local_agents, fields),
+                'workflows': _project(local_workflows, fields),
+                'next_cursor': {
+                    'agents': next_agents,
+                    'workflows': next_workflows
+                }
             },
             'external': {
                 'agents': [],
@@ -78,6 +207,8 @@ def get_community_data():
         
         return jsonify(result), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -102,6 +233,12 @@ def create_agent():
                 'category': '用户创建',
                 'author': '用户'
             }
+            if data.get('entry_point'):
+                metadata['entry_point'] = data['entry_point']
+            if data.get('pure'):
+                metadata['pure'] = True
+            if data.get('batch_entry_point'):
+                metadata['batch_entry_point'] = data['batch_entry_point']
             
             db.add_or_update_agent(
                 session=db_session,
@@ -127,23 +264,88 @@ def get_agent(name):
         with db.session_scope() as db_session:
             agent = db.get_agent(db_session, name)
             if agent:
+                agent['latency'] = engine.executor.stats.latency(name)
                 return jsonify(agent), 200
             else:
                 return jsonify({'error': 'Agent not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/agents/<name>/canary', methods=['GET', 'POST', 'DELETE'])
+def manage_agent_canary(name):
+    """Agent 灰度发布：GET 查看对比报告，POST 启动，DELETE 回滚"""
+    try:
+        canary = engine.executor.canary
+        if canary is None:
+            return jsonify({'error': '灰度发布未启用'}), 400
+        
+        if request.method == 'GET':
+            report = canary.report(name)
+            if report is None:
+                # 没有进行中的灰度时返回最近一次结束的记录
+                with db.session_scope() as db_session:
+                    record = db.get_agent_canary(db_session, name)
+                if record is None:
+                    return jsonify({'error': '该 Agent 没有灰度发布记录'}), 404
+                report = record['report'] or {}
+                report.update({'agent_name': name, 'status': record['status'], 'reason': record['reason']})
+            return jsonify(report), 200
+        
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            if not data.get('version'):
+                return jsonify({'error': '缺少必填字段：version'}), 400
+            report = canary.start(
+                name, int(data['version']),
+                weight=float(data.get('weight', Config.CANARY_WEIGHT)),
+                p95_regression=float(data.get('p95_regression', Config.CANARY_P95_REGRESSION)),
+                min_samples=int(data.get('min_samples', Config.CANARY_MIN_SAMPLES))
+            )
+            return jsonify(report), 201
+        
+        report = canary.rollback(name)
+        if report is None:
+            return jsonify({'error': '该 Agent 没有进行中的灰度发布'}), 404
+        return jsonify({'message': '已回滚到稳定版本', 'report': report}), 200
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/agents/<name>/canary/promote', methods=['POST'])
+def promote_agent_canary(name):
+    """灰度版本转正"""
+    try:
+        canary = engine.executor.canary
+        report = canary.promote(name) if canary else None
+        if report is None:
+            return jsonify({'error': '该 Agent 没有进行中的灰度发布'}), 404
+        return jsonify({'message': '灰度版本已转正', 'report': report}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============================================================================
 # 工作流 API
 # ============================================================================
 
 @api.route('/workflows', methods=['GET'])
 def get_workflows():
-    """获取所有工作流"""
+    """获取所有工作流（支持 category/status 过滤、游标分页和 fields 投影）"""
     try:
+        limit, cursor = _page_args()
         with db.session_scope() as db_session:
-            workflows = db.get_all_workflows(db_session)
-            return jsonify(workflows), 200
+            workflows = db.get_all_workflows(
+                db_session,
+                limit=limit + 1 if limit else None,
+                after_id=cursor,
+                category=request.args.get('category'),
+                status=request.args.get('status')
+            )
+        workflows, next_cursor = _paginate(workflows, limit, lambda w: w['id'])
+        return _list_response(workflows, next_cursor, _fields_arg())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -181,6 +383,8 @@ def create_workflow():
                 trigger_type=data.get('trigger_type', 'manual')
             )
         
+        _fold_workflow_constants(workflow_id)
+        
         return jsonify({'workflow_id': workflow_id, 'message': 'Workflow created'}), 201
     
     except Exception as e:
@@ -237,12 +441,15 @@ def manage_workflow(workflow_id):
                     workflow.category = data['category']
                 if 'status' in data:
                     workflow.status = data['status']
-                
-                print(f"[更新工作流] ✅ 工作流 #{workflow_id} 更新成功")
-                return jsonify({
-                    'message': '工作流更新成功',
-                    'workflow_id': workflow_id
-                }), 200
+            
+            if 'workflow_definition' in data:
+                _fold_workflow_constants(workflow_id)
+            
+            print(f"[更新工作流] ✅ 工作流 #{workflow_id} 更新成功")
+            return jsonify({
+                'message': '工作流更新成功',
+                'workflow_id': workflow_id
+            }), 200
                 
         except Exception as e:
             print(f"[更新工作流] ❌ 更新失败: {e}")
@@ -251,25 +458,13 @@ def manage_workflow(workflow_id):
             return jsonify({'error': str(e)}), 500
     
     elif request.method == 'DELETE':
-        # 删除工作流
+        # 删除工作流（连同执行记录、日志和 API Key，分块集合删除）
         try:
-            with db.session_scope() as db_session:
-                workflow = db_session.query(Workflow).filter_by(id=workflow_id).first()
-                if workflow:
-                    # 先删除所有关联的执行记录（解决外键约束问题）
-                    executions = db_session.query(WorkflowExecution).filter_by(workflow_id=workflow_id).all()
-                    for execution in executions:
-                        db_session.delete(execution)
-                    
-                    print(f"[删除工作流] 已删除 {len(executions)} 条执行记录")
-                    
-                    # 然后删除工作流本身
-                    db_session.delete(workflow)
-                    
-                    print(f"[删除工作流] 成功删除工作流 #{workflow_id}: {workflow.name}")
-                    return jsonify({'message': f'工作流 #{workflow_id} 删除成功'}), 200
-                else:
-                    return jsonify({'error': '工作流不存在'}), 404
+            job = deleter.delete_workflows([workflow_id])
+            if job['missing']:
+                return jsonify({'error': '工作流不存在'}), 404
+            print(f"[删除工作流] 工作流 #{workflow_id}: {job['status']}，已删除 {job['deleted_rows']} 行")
+            return _delete_response(job, f'工作流 #{workflow_id} 删除成功')
         except Exception as e:
             print(f"[删除工作流] ❌ 删除失败: {e}")
             import traceback
@@ -301,14 +496,37 @@ def execute_workflow(workflow_id):
 
 @api.route('/executions/<int:execution_id>', methods=['GET'])
 def get_execution(execution_id):
-    """获取执行记录"""
+    """获取执行记录（大输出默认以 Blob 引用返回，resolve_blobs=true 时展开；已归档的从归档读取）"""
     try:
         with db.session_scope() as db_session:
             execution = db.get_workflow_execution(db_session, execution_id)
-            if execution:
-                return jsonify(execution), 200
-            else:
-                return jsonify({'error': 'Execution not found'}), 404
+            if not execution and archive is not None:
+                execution = archive.get_execution(db_session, execution_id)
+        if not execution:
+            return jsonify({'error': 'Execution not found'}), 404
+        
+        blob_store = engine.executor.blob_store
+        if blob_store and request.args.get('resolve_blobs', 'false').lower() == 'true':
+            for key in ('output_data', 'execution_graph'):
+                execution[key] = blob_store.resolve(execution[key])
+        return jsonify(execution), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/blobs/<blob_hash>', methods=['GET'])
+def get_blob(blob_hash):
+    """按内容哈希读取 Blob（执行记录和日志中的 {"$blob": ...} 引用）"""
+    try:
+        blob_store = engine.executor.blob_store
+        data = blob_store.read(blob_hash) if blob_store else None
+        if data is None:
+            return jsonify({'error': 'Blob not found'}), 404
+        
+        response = Response(data, mimetype='application/json')
+        # 内容寻址，同一哈希的内容永远不变
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers['ETag'] = blob_hash
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -321,12 +539,119 @@ def get_logs():
     """获取日志"""
     try:
         agent_name = request.args.get('agent_name')
-        limit = request.args.get('limit', 100, type=int)
+        limit = max(1, min(request.args.get('limit', 100, type=int), MAX_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        before = None
+        if cursor:
+            timestamp, log_id = _decode_cursor(cursor, (str, int))
+            before = (datetime.fromisoformat(timestamp), log_id)
+        
+        fields = _fields_arg()
+        with db.session_scope() as db_session:
+            logs = db.get_logs(
+                db_session,
+                agent_name=agent_name,
+                limit=limit + 1,
+                before=before,
+                log_type=request.args.get('log_type'),
+                fields=fields
+            )
+        logs, next_cursor = _paginate(logs, limit, lambda log: [log['timestamp'], log['id']])
+        return _list_response(logs, next_cursor, fields)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/logs/rollups', methods=['GET'])
+def get_log_rollups():
+    """获取按小时/天汇总的日志统计（原始日志过期删除后仍保留）"""
+    try:
+        period = request.args.get('period', 'hour')
+        if period not in ('hour', 'day'):
+            return jsonify({'error': 'period 只能是 hour 或 day'}), 400
+        
+        since = request.args.get('since')
+        until = request.args.get('until')
+        
+        with db.session_scope() as db_session:
+            rollups = db.get_log_rollups(
+                db_session,
+                period=period,
+                agent_name=request.args.get('agent_name'),
+                since=datetime.fromisoformat(since) if since else None,
+                until=datetime.fromisoformat(until) if until else None,
+                limit=request.args.get('limit', 500, type=int)
+            )
+            return jsonify(rollups), 200
+    
+    except ValueError as e:
+        return jsonify({'error': f'时间格式错误: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============================================================================
+# 分析 API
+# ============================================================================
+
+@api.route('/analytics/logs', methods=['GET'])
+def get_log_analytics():
+    """日志分析：[since, until) 内整体和各 Agent 的次数、错误率、耗时分位数，以及按 bucket 分桶的吞吐量序列。
+    默认最近 days=7 天；percentiles=50,95,99；source=rollups 时读取日志汇总（无分位数）"""
+    try:
+        until = request.args.get('until')
+        until = datetime.fromisoformat(until) if until else datetime.utcnow()
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else until - timedelta(days=request.args.get('days', 7, type=float))
+        percentiles = request.args.get('percentiles')
+        percentiles = [float(q) for q in percentiles.split(',') if q.strip()] if percentiles else analytics.DEFAULT_PERCENTILES
         
         with db.session_scope() as db_session:
-            logs = db.get_logs(db_session, agent_name=agent_name, limit=limit)
-            return jsonify(logs), 200
+            result = db.get_log_analytics(
+                db_session,
+                since,
+                until,
+                bucket=request.args.get('bucket', 'hour'),
+                percentiles=percentiles,
+                agent_name=request.args.get('agent_name'),
+                log_type=request.args.get('log_type'),
+                source=request.args.get('source', 'logs')
+            )
+        return jsonify(result), 200
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============================================================================
+# 搜索 API
+# ============================================================================
+
+@api.route('/search', methods=['GET'])
+def search_catalog():
+    """全文搜索：q 为关键词，kinds=agent,workflow,chat 限定类型（对话只搜索当前用户的会话）；
+    结果按相关度排序，limit + cursor 分页（下一页游标在 X-Next-Cursor 响应头）"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': '缺少搜索关键词 q'}), 400
+        kinds = [kind.strip() for kind in request.args.get('kinds', 'agent,workflow,chat').split(',') if kind.strip()]
+        
+        limit, cursor = _page_args()
+        limit = limit or 20
+        offset = cursor or 0
+        if offset < 0:
+            raise ValueError('无效的分页游标')
+        with db.session_scope() as db_session:
+            results = db.search(db_session, query, kinds=kinds, user_id=session.get('user_id'),
+                                limit=limit + 1, offset=offset)
+        results, next_cursor = _paginate(results, limit, lambda _: offset + limit)
+        return _list_response(results, next_cursor, _fields_arg())
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -336,20 +661,25 @@ def get_logs():
 
 @api.route('/stats', methods=['GET'])
 def get_stats():
-    """获取统计数据"""
+    """获取统计数据（读取增量维护的计数，不扫描 Agent/工作流表）"""
     try:
         with db.session_scope() as db_session:
-            agents = db.get_all_agents(db_session)
-            workflows = db.get_all_workflows(db_session)
-            
-            total_executions = sum(w.get('total_executions', 0) for w in workflows)
-            
-            return jsonify({
-                'agent_count': len(agents),
-                'workflow_count': len(workflows),
-                'total_executions': total_executions,
-                'avg_success_rate': sum(a.get('success_rate', 0) for a in agents) / len(agents) if agents else 0
-            }), 200
+            counters = db.get_stat_counters(db_session)
+        
+        agent_count = int(counters['agent_count'])
+        workflow_count = int(counters['workflow_count'])
+        stats = {
+            'agent_count': agent_count,
+            'workflow_count': workflow_count,
+            'total_executions': int(counters['total_executions']),
+            'avg_success_rate': counters['agent_success_rate_sum'] / agent_count if agent_count else 0,
+            'workflow_avg_success_rate': counters['workflow_success_rate_sum'] / workflow_count if workflow_count else 0,
+            'compression': compression_stats.snapshot()
+        }
+        # 用户数只对管理员返回
+        if session.get('role') == 'admin':
+            stats['user_count'] = int(counters['user_count'])
+        return jsonify(stats), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -501,10 +831,21 @@ def list_users():
         return jsonify({'error': '权限不足'}), 403
     
     try:
+        limit, cursor = _page_args()
+        status = request.args.get('status')
         with db.session_scope() as db_session:
-            users = db.get_all_users(db_session)
-            return jsonify(users), 200
+            users = db.get_all_users(
+                db_session,
+                limit=limit + 1 if limit else None,
+                after_id=cursor,
+                role=request.args.get('role'),
+                is_active={'active': True, 'inactive': False}.get(status)
+            )
+        users, next_cursor = _paginate(users, limit, lambda u: u['id'])
+        return _list_response(users, next_cursor, _fields_arg())
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -519,19 +860,51 @@ def list_users():
 
 @api.route('/agents/<string:agent_name>', methods=['DELETE'])
 def delete_agent(agent_name):
-    """删除 Agent"""
+    """删除 Agent（连同版本和日志）"""
     try:
-        from backend.models import AIAgent
-        with db.session_scope() as db_session:
-            agent = db_session.query(AIAgent).filter_by(name=agent_name).first()
-            if agent:
-                db_session.delete(agent)
-                return jsonify({'message': f'Agent {agent_name} 删除成功'}), 200
-            else:
-                return jsonify({'error': 'Agent 不存在'}), 404
+        job = deleter.delete_agents([agent_name])
+        if job['missing']:
+            return jsonify({'error': 'Agent 不存在'}), 404
+        if registry is not None:
+            registry.agents.pop(agent_name, None)
+        return _delete_response(job, f'Agent {agent_name} 删除成功')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ============================================================================
+# 调试 API
+# ============================================================================
+
+@api.route('/debug/sql', methods=['GET', 'DELETE'])
+def debug_sql():
+    """每个请求的 SQL 条数/耗时和按接口的累计统计（管理员功能）"""
+    if session.get('role') != 'admin':
+        return jsonify({'error': '权限不足'}), 403
+    if profiler is None:
+        return jsonify({'error': 'SQL 分析未开启（AGENTFLOW_SQL_PROFILE）'}), 404
+    
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify({'success': True}), 200
+    
+    return jsonify({
+        'n_plus_one_threshold': profiler.n_plus_one_threshold,
+        'endpoints': profiler.endpoints(),
+        'recent': profiler.recent(request.args.get('limit', 50, type=int))
+    }), 200
+
+# ============================================================================
+# 删除任务 API
+# ============================================================================
+
+@api.route('/delete-jobs/<string:job_id>', methods=['GET'])
+def get_delete_job(job_id):
+    """查询后台删除任务进度"""
+    job = deleter.get_job(job_id)
+    if not job:
+        return jsonify({'error': '删除任务不存在'}), 404
+    return jsonify(job), 200
+
 # ============================================================================
 # AI 对话 API
 # ============================================================================
@@ -589,7 +962,10 @@ def create_from_chat():
                                 'agent_type': agent_data.get('type', 'processor'),
                                 'description': agent_data.get('description', ''),
                                 'category': agent_data.get('category', '其他'),
-                                'icon': agent_data.get('icon', '🤖')
+                                'icon': agent_data.get('icon', '🤖'),
+                                'entry_point': agent_data.get('entry_point'),
+                                'pure': bool(agent_data.get('pure')),
+                                'batch_entry_point': agent_data.get('batch_entry_point')
                             },
                             dependencies=[],
                             triggers=[],
@@ -604,7 +980,10 @@ def create_from_chat():
                             description=agent_data.get('description', ''),
                             code=agent_data['code'],
                             category=agent_data.get('category', '其他'),
-                            icon=agent_data.get('icon', '🤖')
+                            icon=agent_data.get('icon', '🤖'),
+                            entry_point=agent_data.get('entry_point'),
+                            pure=bool(agent_data.get('pure')),
+                            batch_entry_point=agent_data.get('batch_entry_point')
                         )
                         
                         created_agents.append({
@@ -687,6 +1066,9 @@ def create_from_chat():
                     print(f"  ❌ 创建失败: {e}")
                     raise Exception(f"创建工作流失败: {str(e)}")
         
+        if created_workflow:
+            _fold_workflow_constants(created_workflow['id'])
+        
         print(f"\n{'='*60}")
         print(f"✅ 全部创建完成！")
         print(f"  Agents: {len(created_agents)}")
@@ -1249,40 +1631,16 @@ def batch_delete_agents():
         if not agent_names:
             return jsonify({'error': '没有选择要删除的Agent'}), 400
         
-        deleted_count = 0
-        failed = []
-        
-        for agent_name in agent_names:
-            try:
-                print(f"[批量删除Agent] 正在删除: {agent_name}")
-                
-                # 从registry中删除（如果存在）
-                if agent_name in registry.agents:
-                    del registry.agents[agent_name]
-                    print(f"[批量删除Agent] 从registry删除: {agent_name}")
-                
-                # 从数据库中删除
-                with db.session_scope() as db_session:
-                    db.delete_agent(db_session, agent_name)
-                    print(f"[批量删除Agent] 从数据库删除: {agent_name}")
-                
-                deleted_count += 1
-                print(f"[批量删除Agent] ✅ 成功删除: {agent_name}")
-                
-            except Exception as e:
-                print(f"[批量删除Agent] ❌ 删除失败: {agent_name}, 错误: {e}")
-                import traceback
-                traceback.print_exc()
-                failed.append({'name': agent_name, 'error': str(e)})
+        job = deleter.delete_agents(agent_names)
+        for agent_name in job['targets']:
+            if registry is not None:
+                registry.agents.pop(agent_name, None)
         
-        print(f"[批量删除Agent] 完成！成功: {deleted_count}, 失败: {len(failed)}")
+        failed = [{'name': name, 'error': 'Agent 不存在'} for name in job['missing']]
+        print(f"[批量删除Agent] {job['status']}！Agent: {len(job['targets'])}, 不存在: {len(failed)}")
         
-        return jsonify({
-            'success': True,
-            'message': f'成功删除 {deleted_count} 个Agent',
-            'deleted': deleted_count,
-            'failed': failed
-        }), 200
+        return _delete_response(job, f"成功删除 {len(job['targets'])} 个Agent",
+                                deleted=len(job['targets']), failed=failed)
     except Exception as e:
         print(f"[批量删除Agent] 请求处理异常: {e}")
         import traceback
@@ -1294,7 +1652,6 @@ def batch_delete_agents():
 def batch_delete_workflows():
     """批量删除Workflows"""
     try:
-        from backend.models import Workflow, WorkflowExecution
         data = request.get_json()
         workflow_ids = data.get('workflows', [])
         
@@ -1303,35 +1660,12 @@ def batch_delete_workflows():
         
         print(f"[批量删除工作流] 收到删除请求，工作流IDs: {workflow_ids}")
         
-        deleted_count = 0
-        failed = []
-        
-        for workflow_id in workflow_ids:
-            try:
-                with db.session_scope() as db_session:
-                    workflow = db_session.query(Workflow).filter_by(id=workflow_id).first()
-                    if workflow:
-                        # 🔥 先删除执行记录
-                        executions = db_session.query(WorkflowExecution).filter_by(workflow_id=workflow_id).all()
-                        for execution in executions:
-                            db_session.delete(execution)
-                        
-                        # 再删除工作流
-                        db_session.delete(workflow)
-                        deleted_count += 1
-                        print(f"[批量删除工作流] ✅ 成功删除 #{workflow_id}")
-                    else:
-                        failed.append({'id': workflow_id, 'error': '工作流不存在'})
-            except Exception as e:
-                print(f"[批量删除工作流] ❌ 删除 #{workflow_id} 失败: {e}")
-                failed.append({'id': workflow_id, 'error': str(e)})
+        job = deleter.delete_workflows([int(workflow_id) for workflow_id in workflow_ids])
+        failed = [{'id': workflow_id, 'error': '工作流不存在'} for workflow_id in job['missing']]
+        print(f"[批量删除工作流] {job['status']}！工作流: {len(job['targets'])}, 不存在: {len(failed)}")
         
-        return jsonify({
-            'success': True,
-            'message': f'成功删除 {deleted_count} 个工作流',
-            'deleted': deleted_count,
-            'failed': failed
-        }), 200
+        return _delete_response(job, f"成功删除 {len(job['targets'])} 个工作流",
+                                deleted=len(job['targets']), failed=failed)
     except Exception as e:
         print(f"[批量删除工作流] ❌ 批量操作失败: {e}")
         import traceback
@@ -1376,6 +1710,8 @@ def publish_workflow_api(workflow_id):
         
         print(f"[API发布] 为工作流 #{workflow_id} 生成API Key: {api_key[:10]}...")
         
+        _fold_workflow_constants(workflow_id)
+        
         return jsonify({
             'success': True,
             'api_key': api_key,
@@ -1481,7 +1817,7 @@ def public_execute_workflow():
             }), 401
         
         with db.session_scope() as db_session:
-            key_record = db_session.query(WorkflowAPIKey).filter_by(
+            key_record = db_session.query(WorkflowAPIKey.id, WorkflowAPIKey.workflow_id).filter_by(
                 api_key=api_key,
                 is_active=True
             ).first()
@@ -1496,9 +1832,7 @@ def public_execute_workflow():
             workflow_id = key_record.workflow_id
             
             # 更新调用次数和最后使用时间
-            key_record.calls_count += 1
-            key_record.last_used = datetime.utcnow()
-            db_session.commit()
+            db.record_api_key_call(db_session, key_record.id)
         
         # 2. 获取输入数据
         input_data = request.get_json() or {}
@@ -1545,10 +1879,23 @@ def upgrade_agents_to_ai():
     try:
         data = request.get_json() or {}
         agent_names = data.get('agents', [])
+        # 指定 canary_weight 时以新版本灰度发布，而不是直接替换活跃版本的代码
+        canary_weight = data.get('canary_weight')
         
         if not agent_names:
             return jsonify({'success': False, 'error': '未指定要升级的Agent'}), 400
         
+        # 灰度参数在生成新版本之前校验，参数错误时不留下未激活的孤立版本
+        if canary_weight is not None:
+            try:
+                canary_weight = float(canary_weight)
+                p95_regression = float(data.get('p95_regression', Config.CANARY_P95_REGRESSION))
+                min_samples = int(data.get('min_samples', Config.CANARY_MIN_SAMPLES))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': '灰度参数格式错误'}), 400
+            if not 0 < canary_weight < 1:
+                return jsonify({'success': False, 'error': 'canary_weight 必须在 0 和 1 之间'}), 400
+        
         print(f"\n[🚀 通用AI升级] 收到升级请求，Agent列表: {agent_names}")
         
         # 获取LLM服务
@@ -1654,6 +2001,7 @@ def upgrade_agents_to_ai():
         # 执行升级
         upgraded = []
         failed = []
+        canary_targets = []
         
         from backend.models import AIAgent, AgentVersion
         
@@ -1686,13 +2034,35 @@ def upgrade_agents_to_ai():
                         input_params=active_version.input_parameters or {}
                     )
                     
+                    old_metadata = active_version.agent_metadata or {}
+                    
+                    if canary_weight:
+                        # 4. 新增未激活版本，稍后作为灰度版本分流
+                        canary_version = AgentVersion(
+                            agent=agent,
+                            version=len(agent.versions) + 1,
+                            code=ai_code,
+                            agent_metadata={
+                                **old_metadata,
+                                'ai_powered': True,
+                                'upgraded_at': datetime.now().isoformat()
+                            },
+                            is_active=False,
+                            input_parameters=active_version.input_parameters or [],
+                            output_parameters=active_version.output_parameters or []
+                        )
+                        session.add(canary_version)
+                        session.flush()
+                        canary_targets.append((agent_name, canary_version.version))
+                        print(f"[🚀 通用AI升级] {agent_name} 已生成灰度版本 v{canary_version.version}")
+                        continue
+                    
                     # 4. 更新代码
                     active_version.code = ai_code
                     
                     # 5. 标记为AI驱动（创建新字典确保SQLAlchemy检测到变化）
                     from sqlalchemy.orm.attributes import flag_modified
                     
-                    old_metadata = active_version.agent_metadata or {}
                     active_version.agent_metadata = {
                         **old_metadata,
                         'ai_powered': True,
@@ -1711,12 +2081,27 @@ def upgrade_agents_to_ai():
                     traceback.print_exc()
                     failed.append({'name': agent_name, 'error': str(e)})
         
+        # 6. 灰度模式：新版本提交后按权重分流
+        canaries = []
+        for agent_name, version in canary_targets:
+            try:
+                canaries.append(engine.executor.canary.start(
+                    agent_name, version,
+                    weight=canary_weight,
+                    p95_regression=p95_regression,
+                    min_samples=min_samples
+                ))
+                upgraded.append(agent_name)
+            except Exception as e:
+                failed.append({'name': agent_name, 'error': f'启动灰度失败: {e}'})
+        
         print(f"\n[Agent升级] 完成！成功: {len(upgraded)}, 失败: {len(failed)}")
         
         return jsonify({
             'success': True,
             'upgraded': upgraded,
             'failed': failed,
+            'canaries': canaries,
             'message': f'成功升级 {len(upgraded)} 个Agent为AI驱动版本'
         }), 200
         
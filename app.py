@@ -8,6 +8,7 @@
 # ============================================================================
 
 from flask import Flask, render_template, redirect, session, url_for, request
+import atexit
 import sys
 import os
 
@@ -19,8 +20,18 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 # ============================================================================
 
 # Backend 层
+from backend.config import Config
 from backend.database import Database
 from backend.engine import AgentRegistry, AgentExecutor, WorkflowEngine, LLMService
+from backend.batching import MicroBatcher
+from backend.agent_stats import AgentStatsAggregator
+from backend.canary import CanaryRouter
+from backend.log_sink import LogSink
+from backend.log_retention import LogCompactor, parse_retention
+from backend.blob_store import BlobStore, BlobGarbageCollector
+from backend.bulk_delete import BulkDeleter
+from backend.archive import ExecutionArchive
+from backend.sql_profiler import SQLProfiler
 
 # API 层
 from api.routes import api, init_api
@@ -46,7 +57,11 @@ print("="*60)
 
 # 1. 初始化数据库 (Backend)
 print("\n[1/4] 初始化数据库...")
-db = Database('sqlite:///agentflow.db')
+db = Database(Config.DATABASE_URL, profile=Config.DB_PROFILE, execution_db_path=Config.EXECUTION_DATABASE_URL)
+sql_profiler = None
+if Config.SQL_PROFILE:
+    sql_profiler = SQLProfiler(db.engines, n_plus_one_threshold=Config.SQL_N_PLUS_ONE_THRESHOLD,
+                               history=Config.SQL_PROFILE_HISTORY)
 
 # 2. 初始化 Agent 注册中心 (Backend)
 print("[2/4] 初始化 Agent 注册中心...")
@@ -77,12 +92,52 @@ register_default_tools()
 print("  ✓ 工具系统已初始化")
 
 # 4. 初始化执行引擎 (Backend)
-executor = AgentExecutor(db, registry, llm_service)
-engine = WorkflowEngine(db, executor)
+batcher = MicroBatcher(max_batch_size=Config.BATCH_MAX_SIZE, max_wait_ms=Config.BATCH_MAX_WAIT_MS)
+agent_stats = AgentStatsAggregator(db, flush_interval=Config.STATS_FLUSH_INTERVAL)
+agent_stats.start()
+atexit.register(agent_stats.close)
+canary = CanaryRouter(db, registry)
+canary.load()
+log_sink = None
+if Config.LOG_ASYNC:
+    log_sink = LogSink(db, batch_size=Config.LOG_BATCH_SIZE, flush_interval_ms=Config.LOG_FLUSH_INTERVAL_MS,
+                       max_queue=Config.LOG_QUEUE_SIZE)
+    log_sink.start()
+    atexit.register(log_sink.close)
+blob_store = None
+if Config.BLOB_MIN_BYTES > 0:
+    blob_store = BlobStore(Config.BLOB_STORE_DIR, min_bytes=Config.BLOB_MIN_BYTES)
+    blob_gc = BlobGarbageCollector(db, blob_store, interval=Config.BLOB_GC_INTERVAL, grace=Config.BLOB_GC_GRACE)
+    blob_gc.start()
+    atexit.register(blob_gc.close)
+archive = ExecutionArchive(db, root=Config.ARCHIVE_DIR, after_days=Config.ARCHIVE_AFTER_DAYS,
+                           interval=Config.ARCHIVE_INTERVAL, chunk_size=Config.ARCHIVE_CHUNK_SIZE,
+                           blob_store=blob_store)
+archive.start()
+atexit.register(archive.close)
+log_compactor = LogCompactor(
+    db,
+    retention=parse_retention(Config.LOG_RETENTION),
+    default_days=Config.LOG_RETENTION_DEFAULT_DAYS,
+    hourly_rollup_days=Config.LOG_ROLLUP_HOURLY_DAYS,
+    interval=Config.LOG_COMPACT_INTERVAL,
+    chunk_size=Config.LOG_COMPACT_CHUNK_SIZE,
+    archive=archive if Config.ARCHIVE_LOGS else None
+)
+log_compactor.start()
+atexit.register(log_compactor.close)
+executor = AgentExecutor(db, registry, llm_service, batcher=batcher, stats=agent_stats,
+                         profile_resources=Config.PROFILE_AGENTS, canary=canary, log_sink=log_sink,
+                         blob_store=blob_store)
+engine = WorkflowEngine(db, executor, fold_timeout=Config.FOLD_TIMEOUT)
+deleter = BulkDeleter(db, chunk_size=Config.BULK_DELETE_CHUNK_SIZE, background_rows=Config.BULK_DELETE_BACKGROUND_ROWS,
+                      archive=archive, canary=canary, job_ttl=Config.BULK_DELETE_JOB_TTL)
+deleter.start()
+atexit.register(deleter.close)
 
 # 5. 初始化 API 层 (API)
 print("[4/4] 初始化 API 层...")
-init_api(db, engine, registry)  # 传递 registry 参数
+init_api(db, engine, registry, deleter, archive, sql_profiler)  # 传递 registry 参数
 app.register_blueprint(api)
 
 # 6. 加载预置 Agent（已禁用，避免自动创建多余智能体）
@@ -106,6 +161,33 @@ def log_request():
     print(f"\n🔔 [Flask请求] {request.method} {request.path}", flush=True)
     sys.stdout.flush()
 
+@app.before_request
+def begin_unit_of_work():
+    """请求内的数据库操作复用同一个 Session 和连接"""
+    if Config.DB_UNIT_OF_WORK and request.endpoint != 'static':
+        db.begin_unit_of_work()
+
+@app.teardown_request
+def end_unit_of_work(error=None):
+    db.end_unit_of_work(error)
+
+@app.before_request
+def begin_sql_profile():
+    """开始统计本次请求的 SQL"""
+    if sql_profiler is not None and request.endpoint != 'static':
+        rule = request.url_rule.rule if request.url_rule else request.path
+        sql_profiler.begin(f"{request.method} {rule}")
+
+@app.after_request
+def end_sql_profile(response):
+    """把本次请求的 SQL 条数和耗时写入响应头（仅管理员或调试模式可见）"""
+    if sql_profiler is not None:
+        summary = sql_profiler.end(response.status_code)
+        if summary is not None and (app.debug or session.get('role') == 'admin'):
+            response.headers['X-SQL-Queries'] = str(summary['queries'])
+            response.headers['X-SQL-Time-Ms'] = f"{summary['time_ms']:.1f}"
+    return response
+
 @app.route('/')
 def index():
     """主工作台"""
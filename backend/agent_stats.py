@@ -0,0 +1,199 @@
+# ============================================================================
+# 后端层 - Agent 执行统计 (Backend - Agent Statistics)
+# ============================================================================
+# 每次节点调用先记录到内存中的计数器和延迟直方图，再由后台线程定期
+# 以一次批量 UPDATE 合并进 ai_agents 表，避免每次调用都写数据库。
+# ============================================================================
+
+from typing import Dict, Any, Optional
+from sqlalchemy import bindparam, func, select
+import bisect
+import math
+import threading
+
+from backend.models import AIAgent
+from backend import stat_counters
+
+
+# 直方图桶上界：1ms 起按 1.2 倍递增到 1 小时以上
+_MIN_SECONDS = 0.001
+_GROWTH = 1.2
+_BUCKET_BOUNDS = [_MIN_SECONDS * (_GROWTH ** i) for i in range(int(math.log(3600 / _MIN_SECONDS, _GROWTH)) + 2)]
+
+
+class LatencyHistogram:
+    """对数分桶延迟直方图（1ms ~ 1h，相邻桶上界比例约1.2），用于估算百分位"""
+    
+    BOUNDS = _BUCKET_BOUNDS
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0
+        self.max_value = 0.0
+    
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.total += 1
+        if seconds > self.max_value:
+            self.max_value = seconds
+    
+    def merge(self, other: 'LatencyHistogram'):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+        self.max_value = max(self.max_value, other.max_value)
+    
+    def percentile(self, q: float) -> Optional[float]:
+        """返回第 q 百分位（0-100）所在桶的上界，超过最大桶时返回观测到的最大值"""
+        if self.total == 0:
+            return None
+        rank = max(1, math.ceil(self.total * q / 100.0))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if i >= len(self.BOUNDS):
+                    return self.max_value
+                return min(self.BOUNDS[i], self.max_value)
+        return self.max_value
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'samples': self.total,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max_value if self.total else None
+        }
+
+
+class _AgentCounters:
+    __slots__ = ('calls', 'successes', 'time_sum', 'histogram',
+                 'pending_calls', 'pending_successes', 'pending_time')
+    
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.time_sum = 0.0
+        self.histogram = LatencyHistogram()
+        self.pending_calls = 0
+        self.pending_successes = 0
+        self.pending_time = 0.0
+
+
+class AgentStatsAggregator:
+    """Agent 执行统计聚合器（进程内，线程安全）"""
+    
+    def __init__(self, db, flush_interval: float = 30.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._agents: Dict[str, _AgentCounters] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """启动后台定期刷盘线程"""
+        if self._thread is None and self.flush_interval > 0:
+            self._thread = threading.Thread(target=self._flush_loop, name='agent-stats-flush', daemon=True)
+            self._thread.start()
+    
+    def close(self):
+        """停止后台线程并把剩余统计写入数据库"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+    
+    def record(self, agent_name: str, seconds: float, success: bool):
+        """记录一次节点调用"""
+        with self._lock:
+            counters = self._agents.get(agent_name)
+            if counters is None:
+                counters = self._agents[agent_name] = _AgentCounters()
+            counters.calls += 1
+            counters.time_sum += seconds
+            counters.histogram.record(seconds)
+            counters.pending_calls += 1
+            counters.pending_time += seconds
+            if success:
+                counters.successes += 1
+                counters.pending_successes += 1
+    
+    def latency(self, agent_name: str) -> Dict[str, Any]:
+        """单个Agent的延迟百分位（自进程启动以来）"""
+        with self._lock:
+            counters = self._agents.get(agent_name)
+            if counters is None:
+                return LatencyHistogram().summary()
+            return counters.histogram.summary()
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """所有Agent的内存统计快照"""
+        with self._lock:
+            return {
+                name: {
+                    'calls': c.calls,
+                    'success_rate': c.successes / c.calls * 100 if c.calls else 0,
+                    'avg_execution_time': c.time_sum / c.calls if c.calls else 0,
+                    'latency': c.histogram.summary()
+                } for name, c in self._agents.items()
+            }
+    
+    def flush(self) -> int:
+        """把自上次刷盘以来的增量以一次批量 UPDATE 合并到 ai_agents 表"""
+        with self._lock:
+            rows = []
+            for name, c in self._agents.items():
+                if c.pending_calls:
+                    rows.append({
+                        'b_name': name,
+                        'b_calls': c.pending_calls,
+                        'b_successes': c.pending_successes,
+                        'b_time': c.pending_time
+                    })
+                    c.pending_calls = 0
+                    c.pending_successes = 0
+                    c.pending_time = 0.0
+        
+        if not rows:
+            return 0
+        
+        table = AIAgent.__table__
+        total = func.coalesce(table.c.total_executions, 0)
+        new_total = total + bindparam('b_calls')
+        stmt = table.update().where(table.c.name == bindparam('b_name')).values(
+            total_executions=new_total,
+            avg_execution_time=(func.coalesce(table.c.avg_execution_time, 0.0) * total + bindparam('b_time')) / new_total,
+            success_rate=(func.coalesce(table.c.success_rate, 0.0) * total / 100.0 + bindparam('b_successes')) * 100.0 / new_total
+        )
+        
+        try:
+            names = [row['b_name'] for row in rows]
+            rate_sum = func.coalesce(func.sum(table.c.success_rate), 0.0)
+            rate_query = select(rate_sum).where(table.c.name.in_(names))
+            with self.db.session_scope() as session:
+                # 同一事务内取更新前后的成功率之和，差值累加到仪表盘计数
+                before = session.execute(rate_query).scalar()
+                session.execute(stmt, rows)
+                after = session.execute(rate_query).scalar()
+                stat_counters.increment(session, 'agent_success_rate_sum', after - before)
+        except Exception as e:
+            print(f"[AgentStats] ⚠️ 统计写入失败，将在下次重试: {e}")
+            self._restore_pending(rows)
+            return 0
+        return len(rows)
+    
+    def _restore_pending(self, rows):
+        with self._lock:
+            for row in rows:
+                c = self._agents.get(row['b_name'])
+                if c is not None:
+                    c.pending_calls += row['b_calls']
+                    c.pending_successes += row['b_successes']
+                    c.pending_time += row['b_time']
+    
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
@@ -82,28 +82,17 @@ class AIToolRegistry:
     def create_agent(self, name: str, code: str, agent_type: str, description: str = '') -> Dict[str, Any]:
         """创建Agent"""
         try:
-            # 执行代码
-            exec_globals = {}
-            exec(code, exec_globals)
-            
-            # 查找函数
-            agent_func = None
-            for func_name, obj in exec_globals.items():
-                if callable(obj) and not func_name.startswith('_'):
-                    agent_func = obj
-                    break
-            
-            if not agent_func:
-                return {'success': False, 'error': '未找到Agent函数'}
-            
-            # 注册Agent
-            self.registry.register_agent(
+            # 注册Agent（由注册中心选择入口函数并预计算调用计划）
+            registered = self.registry.register_agent(
                 name=name,
-                func=agent_func,
+                code=code,
                 agent_type=agent_type,
                 description=description
             )
             
+            if not registered:
+                return {'success': False, 'error': '未找到Agent函数'}
+            
             return {
                 'success': True,
                 'message': f'Agent "{name}" 创建成功',
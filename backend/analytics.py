@@ -0,0 +1,297 @@
+# ============================================================================
+# 后端层 - 日志分析 (Backend - Log Analytics)
+# ============================================================================
+# 按时间范围统计各 Agent 的耗时分位数、错误率和吞吐量时间序列：
+#   - source='logs'：从 logs 表流式读取 agent_name / time_spent / timestamp / log_type
+#     四列，按块转换为 NumPy 数组后整体做分组统计，百万行级别也只需一次请求；
+#   - source='rollups'：读取 log_rollups 小时/天汇总（原始日志过期后仍可查），
+#     汇总只有次数、错误数和耗时总和，不提供分位数。
+# 未安装 numpy 时退回纯 Python 实现，结果相同，只是更慢。
+# 错误按 log_type == 'error' 计；耗时为空的日志计入次数和错误率，不计入耗时统计。
+# ============================================================================
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from datetime import datetime, timedelta
+from sqlalchemy import select
+import math
+
+from backend.models import Log, LogRollup
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BUCKETS = {'minute': 60, 'hour': 3600, 'day': 86400}
+SOURCES = ('logs', 'rollups')
+DEFAULT_PERCENTILES = (50.0, 90.0, 95.0, 99.0)
+# 时间序列最多的分桶数，避免一次请求返回过大的序列
+MAX_BUCKETS = 10000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _floor(value: datetime, seconds: int) -> datetime:
+    return value - timedelta(seconds=(value - _EPOCH).total_seconds() % seconds)
+
+
+def _number(value) -> Optional[float]:
+    """NumPy/Python 数值转为 JSON 可序列化的 float，NaN 转为 None"""
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _percentile_key(q: float) -> str:
+    return f'p{q:g}'
+
+
+def _stats(count, error_count, time_sum, time_count, min_time=None, max_time=None,
+           percentiles: Sequence[float] = (), values: Sequence[Any] = ()) -> Dict[str, Any]:
+    count = int(count)
+    error_count = int(error_count)
+    time_count = int(time_count)
+    item = {
+        'count': count,
+        'error_count': error_count,
+        'error_rate': error_count / count * 100 if count else 0,
+        'avg_time': float(time_sum) / time_count if time_count else None,
+        'min_time': _number(min_time),
+        'max_time': _number(max_time)
+    }
+    for q, value in zip(percentiles, values):
+        item[_percentile_key(q)] = _number(value)
+    return item
+
+
+# ============================================================================
+# 对外接口
+# ============================================================================
+
+def log_analytics(session, since: datetime, until: datetime, bucket: str = 'hour',
+                  percentiles: Sequence[float] = DEFAULT_PERCENTILES, agent_name: Optional[str] = None,
+                  log_type: Optional[str] = None, source: str = 'logs', chunk_size: int = 50000) -> Dict[str, Any]:
+    """统计 [since, until) 内的日志：整体与各 Agent 的次数、错误率、耗时分位数，以及按 bucket 分桶的吞吐量序列"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket 只能是 {', '.join(BUCKETS)}")
+    if source not in SOURCES:
+        raise ValueError(f"source 只能是 {', '.join(SOURCES)}")
+    if until <= since:
+        raise ValueError('until 必须晚于 since')
+    percentiles = [float(q) for q in percentiles]
+    if any(q < 0 or q > 100 for q in percentiles):
+        raise ValueError('分位数必须在 0 到 100 之间')
+
+    bucket_seconds = BUCKETS[bucket]
+    origin = _floor(since, bucket_seconds)
+    buckets = math.ceil((until - origin).total_seconds() / bucket_seconds)
+    if buckets > MAX_BUCKETS:
+        raise ValueError(f'时间范围内的分桶数 {buckets} 超过上限 {MAX_BUCKETS}，请缩小范围或使用更大的 bucket')
+
+    if source == 'rollups':
+        if bucket == 'minute':
+            raise ValueError('汇总数据的最小粒度为 hour')
+        if log_type:
+            raise ValueError('汇总数据不区分 log_type')
+        overall, agents, series, rows = _aggregate_rollups(
+            session, since, until, bucket, agent_name, origin, bucket_seconds, buckets
+        )
+        engine = 'sql'
+        percentiles = []
+    else:
+        query = select(Log.agent_name, Log.time_spent, Log.timestamp, Log.log_type)\
+            .where(Log.timestamp >= since, Log.timestamp < until)
+        if agent_name:
+            query = query.where(Log.agent_name == agent_name)
+        if log_type:
+            query = query.where(Log.log_type == log_type)
+        result = session.execute(query, execution_options={'stream_results': True})
+        aggregate = _aggregate_numpy if np is not None else _aggregate_python
+        overall, agents, series, rows = aggregate(
+            result.partitions(chunk_size), origin, bucket_seconds, buckets, percentiles
+        )
+        engine = 'numpy' if np is not None else 'python'
+
+    return {
+        'source': source,
+        'engine': engine,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'bucket': bucket,
+        'percentiles': [_percentile_key(q) for q in percentiles],
+        'rows': rows,
+        'overall': overall,
+        'agents': sorted(agents, key=lambda item: item['count'], reverse=True),
+        'series': [
+            dict(item, bucket_start=(origin + timedelta(seconds=i * bucket_seconds)).isoformat())
+            for i, item in enumerate(series)
+        ]
+    }
+
+
+# ============================================================================
+# NumPy 实现
+# ============================================================================
+
+def _collect_numpy(chunks: Iterable[Sequence[Any]]):
+    """逐块把行转换为数组：Agent 编号、耗时（空值为 NaN）、时间戳（微秒）、是否错误"""
+    codes: Dict[str, int] = {}
+    agent_parts, time_parts, stamp_parts, error_parts = [], [], [], []
+    for rows in chunks:
+        agents, times, stamps, types = zip(*rows)
+        names, inverse = np.unique(np.array(agents, dtype=object), return_inverse=True)
+        mapping = np.array([codes.setdefault(name, len(codes)) for name in names], dtype=np.int64)
+        agent_parts.append(mapping[inverse.reshape(-1)])
+        time_parts.append(np.array(times, dtype=np.float64))
+        stamp_parts.append(np.array(stamps, dtype='datetime64[us]'))
+        error_parts.append(np.array(types, dtype=object) == 'error')
+
+    if not agent_parts:
+        return [], np.empty(0, np.int64), np.empty(0), np.empty(0, 'datetime64[us]'), np.empty(0, bool)
+    return (list(codes), np.concatenate(agent_parts), np.concatenate(time_parts),
+            np.concatenate(stamp_parts), np.concatenate(error_parts))
+
+
+def _grouped_numpy(codes, groups: int, times, errors, percentiles: Sequence[float]) -> List[Dict[str, Any]]:
+    """按编号分组统计；分位数与 numpy.percentile 默认的线性插值一致"""
+    counts = np.bincount(codes, minlength=groups)
+    error_counts = np.bincount(codes, weights=errors, minlength=groups)
+    valid = ~np.isnan(times)
+    time_counts = np.bincount(codes[valid], minlength=groups)
+    time_sums = np.bincount(codes[valid], weights=times[valid], minlength=groups)
+
+    # 按 (分组, 耗时) 排序：NaN 排在各组末尾，各组的有效耗时位于 [start, start + time_count)
+    ordered = times[np.lexsort((times, codes))]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = time_counts > 0
+    last = len(ordered) - 1
+
+    def _at(positions):
+        positions = np.where(present, positions, 0)
+        low = np.floor(positions).astype(np.int64)
+        high = np.ceil(positions).astype(np.int64)
+        values = ordered[np.clip(low, 0, last)] + \
+            (ordered[np.clip(high, 0, last)] - ordered[np.clip(low, 0, last)]) * (positions - low)
+        return np.where(present, values, np.nan)
+
+    mins = _at(starts.astype(np.float64))
+    maxs = _at((starts + time_counts - 1).astype(np.float64))
+    quantiles = [_at(starts + (time_counts - 1) * q / 100.0) for q in percentiles]
+
+    return [
+        _stats(counts[i], error_counts[i], time_sums[i], time_counts[i], mins[i], maxs[i],
+               percentiles, [values[i] for values in quantiles])
+        for i in range(groups)
+    ]
+
+
+def _aggregate_numpy(chunks, origin: datetime, bucket_seconds: int, buckets: int, percentiles):
+    names, codes, times, stamps, errors = _collect_numpy(chunks)
+    rows = len(codes)
+    if not rows:
+        empty = _stats(0, 0, 0.0, 0, percentiles=percentiles, values=[None] * len(percentiles))
+        return empty, [], [_stats(0, 0, 0.0, 0) for _ in range(buckets)], 0
+
+    overall = _grouped_numpy(np.zeros(rows, dtype=np.int64), 1, times, errors, percentiles)[0]
+    agents = [
+        dict(item, agent_name=name)
+        for name, item in zip(names, _grouped_numpy(codes, len(names), times, errors, percentiles))
+    ]
+
+    offsets = (stamps - np.datetime64(origin, 'us')) // np.timedelta64(bucket_seconds, 's')
+    offsets = np.clip(offsets.astype(np.int64), 0, buckets - 1)
+    valid = ~np.isnan(times)
+    counts = np.bincount(offsets, minlength=buckets)
+    error_counts = np.bincount(offsets, weights=errors, minlength=buckets)
+    time_counts = np.bincount(offsets[valid], minlength=buckets)
+    time_sums = np.bincount(offsets[valid], weights=times[valid], minlength=buckets)
+    series = [_stats(counts[i], error_counts[i], time_sums[i], time_counts[i]) for i in range(buckets)]
+    return overall, agents, series, rows
+
+
+# ============================================================================
+# 纯 Python 实现（未安装 numpy 时）
+# ============================================================================
+
+def _percentile(ordered: Sequence[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100.0
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _summarize(count: int, error_count: int, times: List[float], percentiles) -> Dict[str, Any]:
+    times.sort()
+    return _stats(count, error_count, sum(times), len(times), times[0] if times else None,
+                  times[-1] if times else None, percentiles, [_percentile(times, q) for q in percentiles])
+
+
+def _aggregate_python(chunks, origin: datetime, bucket_seconds: int, buckets: int, percentiles):
+    groups: Dict[str, List[Any]] = {}
+    series = [[0, 0, 0.0, 0] for _ in range(buckets)]
+    all_times: List[float] = []
+    rows = errors = 0
+
+    for chunk in chunks:
+        for agent_name, time_spent, timestamp, log_type in chunk:
+            failed = log_type == 'error'
+            group = groups.setdefault(agent_name, [0, 0, []])
+            offset = min(max(int((timestamp - origin).total_seconds() // bucket_seconds), 0), buckets - 1)
+            point = series[offset]
+            rows += 1
+            group[0] += 1
+            point[0] += 1
+            if failed:
+                errors += 1
+                group[1] += 1
+                point[1] += 1
+            if time_spent is not None:
+                group[2].append(time_spent)
+                all_times.append(time_spent)
+                point[2] += time_spent
+                point[3] += 1
+
+    overall = _summarize(rows, errors, all_times, percentiles)
+    agents = [dict(_summarize(count, error_count, times, percentiles), agent_name=name)
+              for name, (count, error_count, times) in groups.items()]
+    return overall, agents, [_stats(*point) for point in series], rows
+
+
+# ============================================================================
+# 汇总表实现
+# ============================================================================
+
+def _aggregate_rollups(session, since, until, bucket, agent_name, origin, bucket_seconds, buckets):
+    query = select(LogRollup.agent_name, LogRollup.bucket_start, LogRollup.count,
+                   LogRollup.error_count, LogRollup.time_sum)\
+        .where(LogRollup.period == ('day' if bucket == 'day' else 'hour'),
+               LogRollup.bucket_start >= since, LogRollup.bucket_start < until)
+    if agent_name:
+        query = query.where(LogRollup.agent_name == agent_name)
+
+    groups: Dict[str, List[float]] = {}
+    series = [[0, 0, 0.0, 0] for _ in range(buckets)]
+    rows = 0
+    for row in session.execute(query):
+        rows += 1
+        count, error_count, time_sum = row.count or 0, row.error_count or 0, row.time_sum or 0.0
+        group = groups.setdefault(row.agent_name, [0, 0, 0.0])
+        offset = min(max(int((row.bucket_start - origin).total_seconds() // bucket_seconds), 0), buckets - 1)
+        group[0] += count
+        group[1] += error_count
+        group[2] += time_sum
+        point = series[offset]
+        point[0] += count
+        point[1] += error_count
+        # 汇总的耗时总和包含所有日志，平均耗时按次数计算
+        point[2] += time_sum
+        point[3] += count
+
+    totals = [sum(values[i] for values in groups.values()) for i in range(3)]
+    overall = _stats(totals[0], totals[1], totals[2], totals[0])
+    agents = [dict(_stats(count, error_count, time_sum, count), agent_name=name)
+              for name, (count, error_count, time_sum) in groups.items()]
+    return overall, agents, [_stats(*point) for point in series], rows
@@ -0,0 +1,239 @@
+# ============================================================================
+# 后端层 - 冷归档 (Backend - Cold Archive)
+# ============================================================================
+# 超过保留天数的已结束执行记录（连同其日志）移出热表，追加写入
+#   <root>/workflows/<工作流ID>/<YYYY-MM>.ndjson.gz
+# 每条执行记录是一个独立的 gzip 成员（多成员 gzip 仍是合法的 .gz 文件，
+# 可直接 zcat 查看），archived_executions 表记录其所在分段、偏移和长度，
+# 按 ID 查询时只读取并解压这一段。
+# 日志保留清理按 log_type 删除过期原始日志前，先按月追加到日志分段：执行日志写入
+# <root>/workflows/<工作流ID>/logs-<YYYY-MM>.ndjson.gz（删除工作流时连同目录一起删除），
+# 工作流之外写入的日志写入 <root>/logs/<YYYY-MM>.ndjson.gz；执行记录归档时带走剩余的日志。
+# 归档内容中的 Blob 引用会被展开内联，避免归档后被 Blob 垃圾回收删除。
+# 先写文件再在同一事务内写索引、删热数据；事务失败只会在分段中留下无索引的冗余成员。
+# ============================================================================
+
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import undefer_group
+import gzip
+import json
+import os
+import shutil
+import threading
+
+from backend.models import ArchivedExecution, Log, LogRollup, WorkflowExecution
+
+
+def _serialize(row) -> Dict[str, Any]:
+    record = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        record[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+class ExecutionArchive:
+    """执行记录与日志的冷归档"""
+
+    PAYLOAD_FIELDS = ('input_data', 'output_data', 'execution_graph', 'params', 'output')
+
+    def __init__(self, db, root: str = 'archive', after_days: int = 90, interval: float = 86400.0,
+                 chunk_size: int = 500, blob_store=None):
+        self.db = db
+        self.root = root
+        self.after_days = after_days
+        self.interval = interval
+        self.chunk_size = max(1, chunk_size)
+        self.blob_store = blob_store
+        self._stop = threading.Event()
+        self._thread = None
+        # 分段文件只追加，同一进程内的写入串行化
+        self._write_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def start(self):
+        if self._thread is None and self.interval > 0 and self.after_days > 0:
+            self._thread = threading.Thread(target=self._loop, name='execution-archive', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # ========================================================================
+    # 分段文件读写
+    # ========================================================================
+
+    def _append(self, segment: str, members: List[bytes]) -> List[Tuple[int, int]]:
+        """把若干 gzip 成员追加到分段文件，返回每个成员的 (偏移, 长度)"""
+        path = os.path.join(self.root, segment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        positions = []
+        with self._write_lock, open(path, 'ab') as f:
+            offset = f.tell()
+            for member in members:
+                f.write(member)
+                positions.append((offset, len(member)))
+                offset += len(member)
+            f.flush()
+            os.fsync(f.fileno())
+        return positions
+
+    def _read(self, segment: str, offset: int, length: int) -> Dict[str, Any]:
+        with open(os.path.join(self.root, segment), 'rb') as f:
+            f.seek(offset)
+            return json.loads(gzip.decompress(f.read(length)).decode('utf-8'))
+
+    def _inline_blobs(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        if self.blob_store is not None:
+            for key in self.PAYLOAD_FIELDS:
+                if record.get(key) is not None:
+                    record[key] = self.blob_store.resolve(record[key])
+        return record
+
+    def _encode(self, record: Dict[str, Any]) -> bytes:
+        return json.dumps(self._inline_blobs(record), ensure_ascii=False).encode('utf-8') + b'\n'
+
+    # ========================================================================
+    # 归档
+    # ========================================================================
+
+    def run_once(self, now: datetime = None) -> Dict[str, int]:
+        if self.after_days <= 0:
+            return {'executions': 0, 'logs': 0}
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.after_days)
+        with self.db.session_scope() as session:
+            last_hour = session.query(func.max(LogRollup.bucket_start)).filter(LogRollup.period == 'hour').scalar()
+        if last_hour is not None:
+            # 随执行记录一起移走的日志必须已经汇总过，否则日志汇总会缺数据
+            cutoff = min(cutoff, last_hour + timedelta(hours=1))
+        executions, logs = 0, 0
+        while not self._stop.is_set():
+            archived, archived_logs = self._archive_chunk(cutoff)
+            executions += archived
+            logs += archived_logs
+            if archived < self.chunk_size:
+                break
+        if executions:
+            print(f"[Archive] 归档 {executions} 条执行记录、{logs} 条日志")
+        return {'executions': executions, 'logs': logs}
+
+    def _archive_chunk(self, cutoff: datetime) -> Tuple[int, int]:
+        with self.db.session_scope() as session:
+            executions = session.query(WorkflowExecution)\
+                .options(undefer_group('payload'))\
+                .filter(WorkflowExecution.started_at < cutoff,
+                        WorkflowExecution.status.in_(['completed', 'failed']))\
+                .order_by(WorkflowExecution.id)\
+                .limit(self.chunk_size).all()
+            if not executions:
+                return 0, 0
+            ids = [execution.id for execution in executions]
+
+            logs_by_execution: Dict[int, List[Dict[str, Any]]] = {}
+            log_ids = []
+            for log in session.query(Log).options(undefer_group('payload'))\
+                    .filter(Log.workflow_execution_id.in_(ids)).order_by(Log.id):
+                logs_by_execution.setdefault(log.workflow_execution_id, []).append(self._log_record(log))
+                log_ids.append(log.id)
+
+            segments: Dict[str, List[WorkflowExecution]] = {}
+            for execution in executions:
+                month = execution.started_at.strftime('%Y-%m')
+                segments.setdefault(f'workflows/{execution.workflow_id}/{month}.ndjson.gz', []).append(execution)
+
+            index_rows = []
+            for segment, items in segments.items():
+                members = []
+                for execution in items:
+                    record = _serialize(execution)
+                    record['logs'] = logs_by_execution.get(execution.id, [])
+                    members.append(gzip.compress(self._encode(record)))
+                for execution, (offset, length) in zip(items, self._append(segment, members)):
+                    index_rows.append({
+                        'id': execution.id,
+                        'workflow_id': execution.workflow_id,
+                        'status': execution.status,
+                        'started_at': execution.started_at,
+                        'segment': segment,
+                        'byte_offset': offset,
+                        'byte_length': length,
+                        'log_count': len(logs_by_execution.get(execution.id, [])),
+                        'archived_at': datetime.utcnow()
+                    })
+
+            # 重复归档（上次事务失败）时以新写入的成员为准
+            session.query(ArchivedExecution).filter(ArchivedExecution.id.in_(ids)).delete(synchronize_session=False)
+            session.execute(ArchivedExecution.__table__.insert(), index_rows)
+            if log_ids:
+                self._unlink_logs(session, log_ids)
+                session.query(Log).filter(Log.id.in_(log_ids)).delete(synchronize_session=False)
+            session.query(WorkflowExecution).filter(WorkflowExecution.id.in_(ids)).delete(synchronize_session=False)
+            session.expunge_all()
+        return len(ids), len(log_ids)
+
+    def _log_record(self, log: Log) -> Dict[str, Any]:
+        return self._inline_blobs(_serialize(log))
+
+    def _unlink_logs(self, session, ids: List[int]):
+        session.query(Log).filter(Log.parent_log_id.in_(ids))\
+            .update({Log.parent_log_id: None}, synchronize_session=False)
+        session.query(Log).filter(Log.triggered_by_log_id.in_(ids))\
+            .update({Log.triggered_by_log_id: None}, synchronize_session=False)
+
+    def archive_logs(self, session, ids: List[int]) -> int:
+        """日志保留清理删除前调用：把这些日志按月追加到日志分段（调用方负责删除）。
+        执行日志写入所属工作流目录下的 logs-<YYYY-MM> 分段（删除工作流时一并清除），
+        工作流之外写入的日志写入 logs/<YYYY-MM>"""
+        logs = session.query(Log).options(undefer_group('payload')).filter(Log.id.in_(ids)).order_by(Log.id).all()
+        execution_ids = {log.workflow_execution_id for log in logs if log.workflow_execution_id is not None}
+        workflow_of: Dict[int, int] = {}
+        if execution_ids:
+            workflow_of.update(session.query(WorkflowExecution.id, WorkflowExecution.workflow_id)
+                               .filter(WorkflowExecution.id.in_(execution_ids)))
+            missing = execution_ids - set(workflow_of)
+            if missing:
+                workflow_of.update(session.query(ArchivedExecution.id, ArchivedExecution.workflow_id)
+                                   .filter(ArchivedExecution.id.in_(missing)))
+
+        segments: Dict[str, List[bytes]] = {}
+        for log in logs:
+            month = log.timestamp.strftime('%Y-%m')
+            workflow_id = workflow_of.get(log.workflow_execution_id)
+            segment = f'workflows/{workflow_id}/logs-{month}.ndjson.gz' if workflow_id is not None \
+                else f'logs/{month}.ndjson.gz'
+            segments.setdefault(segment, []).append(self._encode(_serialize(log)))
+        for segment, lines in segments.items():
+            # 一批日志压成一个 gzip 成员，比逐条压缩的压缩率高得多
+            self._append(segment, [gzip.compress(b''.join(lines))])
+        return len(logs)
+
+    # ========================================================================
+    # 查询与清理
+    # ========================================================================
+
+    def get_execution(self, session, execution_id: int) -> Optional[Dict[str, Any]]:
+        """按 ID 读取已归档的执行记录（含日志），不存在时返回 None"""
+        entry = session.query(ArchivedExecution).filter_by(id=execution_id).first()
+        if entry is None:
+            return None
+        record = self._read(entry.segment, entry.byte_offset, entry.byte_length)
+        record['archived'] = True
+        record['archived_at'] = entry.archived_at.isoformat() if entry.archived_at else None
+        return record
+
+    def drop_workflow(self, workflow_id: int):
+        """删除工作流的全部归档分段（索引行由调用方删除）"""
+        with self._write_lock:
+            shutil.rmtree(os.path.join(self.root, 'workflows', str(workflow_id)), ignore_errors=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[Archive] ⚠️ 归档失败: {e}")
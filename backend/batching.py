@@ -0,0 +1,99 @@
+# ============================================================================
+# 后端层 - Agent 动态微批处理 (Backend - Micro Batching)
+# ============================================================================
+# Agent 可以额外提供一个批量入口（默认约定为 `<入口函数名>_batch`），
+# 接收输入列表并返回等长的结果列表。执行器会把并发执行中对同一 Agent 的调用
+# 在一个很短的等待窗口内合并，一次性调用批量入口，再把结果分发回各个调用方。
+# ============================================================================
+
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+import threading
+import queue
+import time
+
+
+class MicroBatcher:
+    """跨执行的动态微批处理器"""
+    
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 10.0):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queues: Dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, agent_name: str, batch_func: Callable, item: Any) -> Future:
+        """提交一次调用，返回 Future；结果由批处理线程回填"""
+        future = Future()
+        self._get_queue(agent_name).put((batch_func, item, future))
+        return future
+    
+    def _get_queue(self, agent_name: str) -> queue.Queue:
+        pending = self._queues.get(agent_name)
+        if pending is not None:
+            return pending
+        
+        with self._lock:
+            pending = self._queues.get(agent_name)
+            if pending is None:
+                pending = queue.Queue()
+                self._queues[agent_name] = pending
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(agent_name, pending),
+                    name=f'agent-batch-{agent_name}',
+                    daemon=True
+                )
+                worker.start()
+        return pending
+    
+    def _worker_loop(self, agent_name: str, pending: queue.Queue):
+        """攒批：拿到第一个请求后最多再等待 max_wait 秒或凑满 max_batch_size"""
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            # 重新注册的 Agent 可能换了批量入口，按函数分组调用
+            groups: Dict[int, List] = {}
+            for entry in batch:
+                groups.setdefault(id(entry[0]), []).append(entry)
+            
+            for entries in groups.values():
+                self._run_batch(agent_name, entries)
+    
+    def _run_batch(self, agent_name: str, entries: List):
+        batch_func = entries[0][0]
+        futures, items = [], []
+        for _, item, future in entries:
+            if future.set_running_or_notify_cancel():
+                futures.append(future)
+                items.append(item)
+        if not futures:
+            return
+        
+        try:
+            results = batch_func(items)
+            results = list(results) if results is not None else []
+            if len(results) != len(items):
+                raise ValueError(
+                    f"Agent '{agent_name}' 批量入口返回 {len(results)} 个结果，期望 {len(items)} 个"
+                )
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        
+        if len(items) > 1:
+            print(f"[MicroBatcher] Agent '{agent_name}' 合并执行 {len(items)} 个调用")
+        
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,194 @@
+# ============================================================================
+# 后端层 - 内容寻址 Blob 存储 (Backend - Blob Store)
+# ============================================================================
+# 超过阈值的节点输出以 JSON 写入 <root>/<sha256前两位>/<sha256> 文件，
+# 数据库中只保存引用 {"$blob": "<sha256>", "size": <字节数>}。相同内容只存一份，
+# 多次执行、执行图、上下文和日志共享同一个文件。
+# 垃圾回收：扫描 logs 和 workflow_executions 中的引用（标记），
+# 删除未被引用且超过宽限期的文件（清除）。
+# ============================================================================
+
+from typing import Any, Dict, Optional, Set
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from backend.models import Log, WorkflowExecution
+
+
+BLOB_KEY = '$blob'
+_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and BLOB_KEY in value and len(value) <= 2
+
+
+class BlobStore:
+    """内容寻址的磁盘 Blob 存储"""
+
+    def __init__(self, root: str = 'blobs', min_bytes: int = 64 * 1024):
+        self.root = root
+        self.min_bytes = min_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash)
+
+    def put(self, data: bytes) -> str:
+        """写入内容并返回 sha256；已存在时不重复写入"""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(blob_hash)
+        if os.path.exists(path):
+            # 刷新修改时间，避免刚被复用的旧 Blob 在本轮垃圾回收中被删除
+            try:
+                os.utime(path)
+                return blob_hash
+            except FileNotFoundError:
+                pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，并发写入同一内容也不会读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_hash
+
+    def read(self, blob_hash: str) -> Optional[bytes]:
+        """读取原始 JSON 字节；不存在时返回 None"""
+        if not _HASH_PATTERN.match(blob_hash or ''):
+            return None
+        try:
+            with open(self._path(blob_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def externalize(self, value: Any) -> Any:
+        """序列化后不小于阈值的值写入 Blob 存储并返回引用，否则原样返回"""
+        if value is None or is_blob_ref(value) or self.min_bytes <= 0:
+            return value
+        try:
+            data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        except (TypeError, ValueError):
+            return value
+        if len(data) < self.min_bytes:
+            return value
+        return {BLOB_KEY: self.put(data), 'size': len(data)}
+
+    def resolve(self, value: Any) -> Any:
+        """递归展开值中的 Blob 引用（按需读取文件）"""
+        if is_blob_ref(value):
+            data = self.read(value[BLOB_KEY])
+            return json.loads(data.decode('utf-8')) if data is not None else value
+        if isinstance(value, dict):
+            return {key: self.resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        return value
+
+    def iter_hashes(self):
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if _HASH_PATTERN.match(name):
+                    yield name, os.path.join(directory, name)
+
+    def stats(self) -> Dict[str, Any]:
+        count, size = 0, 0
+        for _, path in self.iter_hashes():
+            count += 1
+            size += os.path.getsize(path)
+        return {'blobs': count, 'bytes': size}
+
+
+def _collect_refs(value: Any, refs: Set[str]):
+    if is_blob_ref(value):
+        refs.add(value[BLOB_KEY])
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_refs(item, refs)
+
+
+class BlobGarbageCollector:
+    """Blob 标记-清除垃圾回收"""
+
+    # 引用 Blob 的列；后续新增引用位置时在此登记
+    REFERENCE_COLUMNS = [
+        Log.params,
+        Log.output,
+        WorkflowExecution.output_data,
+        WorkflowExecution.execution_graph,
+    ]
+
+    def __init__(self, db, store: BlobStore, interval: float = 86400.0, grace: float = 3600.0):
+        self.db = db
+        self.store = store
+        self.interval = interval
+        # 新写入的 Blob 在引用行提交前可能暂时无人引用，宽限期内不删除
+        self.grace = grace
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='blob-gc', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def mark(self) -> Set[str]:
+        refs: Set[str] = set()
+        with self.db.session_scope() as session:
+            for column in self.REFERENCE_COLUMNS:
+                for (value,) in session.query(column).filter(column.isnot(None)).yield_per(500):
+                    _collect_refs(value, refs)
+        return refs
+
+    def run_once(self) -> Dict[str, int]:
+        """执行一次回收，返回删除的文件数和释放的字节数"""
+        refs = self.mark()
+        cutoff = time.time() - self.grace
+        removed, freed = 0, 0
+        for blob_hash, path in self.store.iter_hashes():
+            if blob_hash in refs:
+                continue
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+
+        if removed:
+            print(f"[BlobGC] 删除 {removed} 个未引用的 Blob，释放 {freed / 1024:.1f} KB")
+        return {'removed': removed, 'freed_bytes': freed, 'referenced': len(refs)}
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[BlobGC] ⚠️ 垃圾回收失败: {e}")
@@ -0,0 +1,245 @@
+# ============================================================================
+# 后端层 - 批量删除 (Backend - Bulk Delete)
+# ============================================================================
+# Agent 和工作流连同其历史（版本、灰度记录、执行记录、日志、API Key、冷归档）
+# 以 DELETE ... WHERE id IN (...) 分块删除，每块一个短事务，不加载 ORM 对象，
+# 也不会长时间持有写锁。预计删除行数超过阈值的请求转入后台线程执行，
+# 调用方通过任务 ID 查询进度；已结束的任务保留 job_ttl 秒后清除。
+# 集合删除不触发 ORM 事件，仪表盘计数在删除父行的同一事务内手动扣减。
+# ============================================================================
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+import itertools
+import queue
+import threading
+
+from backend.models import (
+    AIAgent, AgentVersion, AgentCanary, Workflow, WorkflowExecution, WorkflowAPIKey,
+    FoldedNodeOutput, ArchivedExecution, Log, agent_dependency, agent_version_imports, agent_version_tools
+)
+from backend import stat_counters
+
+
+def _chunks(values: List[Any], size: int):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class BulkDeleter:
+    """分块集合删除，大删除转后台执行"""
+
+    def __init__(self, db, chunk_size: int = 1000, background_rows: int = 10000, archive=None,
+                 canary=None, job_ttl: float = 3600.0):
+        self.db = db
+        self.archive = archive
+        # 删除 Agent 时同时结束其进行中的灰度（灰度记录随 Agent 一起删除）
+        self.canary = canary
+        self.chunk_size = chunk_size
+        self.background_rows = background_rows
+        self.job_ttl = job_ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name='bulk-delete', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # ========================================================================
+    # 对外接口：小删除同步执行，大删除返回后台任务
+    # ========================================================================
+
+    def delete_agents(self, names: List[str]) -> Dict[str, Any]:
+        with self.db.session_scope() as session:
+            rows = session.execute(select(AIAgent.id, AIAgent.name).where(AIAgent.name.in_(names))).all()
+            agent_ids = [row.id for row in rows]
+            found = [row.name for row in rows]
+            estimate = self._count(session, AgentVersion.id, AgentVersion.agent_id.in_(agent_ids)) + \
+                self._count(session, Log.id, Log.agent_name.in_(found))
+        missing = [name for name in names if name not in found]
+        return self._run('agents', found, missing, estimate, lambda job: self._delete_agents(agent_ids, found, job))
+
+    def delete_workflows(self, workflow_ids: List[int]) -> Dict[str, Any]:
+        with self.db.session_scope() as session:
+            found = [row[0] for row in session.execute(select(Workflow.id).where(Workflow.id.in_(workflow_ids)))]
+            executions = select(WorkflowExecution.id).where(WorkflowExecution.workflow_id.in_(found))
+            estimate = self._count(session, WorkflowExecution.id, WorkflowExecution.workflow_id.in_(found)) + \
+                self._count(session, Log.id, Log.workflow_execution_id.in_(executions))
+        missing = [workflow_id for workflow_id in workflow_ids if workflow_id not in found]
+        return self._run('workflows', found, missing, estimate, lambda job: self._delete_workflows(found, job))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    # ========================================================================
+    # 任务调度
+    # ========================================================================
+
+    def _count(self, session, column, criterion) -> int:
+        return session.execute(select(func.count(column)).where(criterion)).scalar() or 0
+
+    def _run(self, kind, targets, missing, estimate, action) -> Dict[str, Any]:
+        job = {
+            'id': f'del-{next(self._job_ids)}',
+            'kind': kind,
+            'targets': targets,
+            'missing': missing,
+            'estimated_rows': estimate,
+            'deleted_rows': 0,
+            'status': 'pending',
+            'error': None,
+            'created_at': datetime.utcnow().isoformat(),
+            'finished_at': None
+        }
+        if not targets:
+            job['status'] = 'completed'
+            return job
+
+        background = self._thread is not None and estimate > self.background_rows
+        with self._lock:
+            self._prune_jobs()
+            self._jobs[job['id']] = job
+        if background:
+            print(f"[BulkDelete] 预计删除 {estimate} 行，转入后台任务 {job['id']}")
+            self._queue.put((job, action))
+        else:
+            self._execute(job, action)
+        return self.get_job(job['id'])
+
+    def _execute(self, job, action):
+        self._update(job, status='running')
+        try:
+            action(job)
+            self._update(job, status='completed')
+        except Exception as e:
+            print(f"[BulkDelete] ❌ 任务 {job['id']} 失败: {e}")
+            self._update(job, status='failed', error=str(e))
+        finally:
+            self._update(job, finished_at=datetime.utcnow().isoformat())
+
+    def _prune_jobs(self):
+        """清除结束超过 job_ttl 秒的任务（调用方持有 _lock）"""
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.job_ttl)).isoformat()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and job['finished_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+
+    def _progress(self, job, rows):
+        with self._lock:
+            job['deleted_rows'] += rows
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._execute(*item)
+
+    # ========================================================================
+    # 删除实现
+    # ========================================================================
+
+    def _delete_logs(self, criterion, job) -> int:
+        """分块删除满足条件的日志，先解除其他日志对它们的引用"""
+        deleted = 0
+        while True:
+            with self.db.session_scope() as session:
+                ids = [row[0] for row in session.execute(select(Log.id).where(criterion).limit(self.chunk_size))]
+                if not ids:
+                    break
+                session.query(Log).filter(Log.parent_log_id.in_(ids))\
+                    .update({Log.parent_log_id: None}, synchronize_session=False)
+                session.query(Log).filter(Log.triggered_by_log_id.in_(ids))\
+                    .update({Log.triggered_by_log_id: None}, synchronize_session=False)
+                session.query(Log).filter(Log.id.in_(ids)).delete(synchronize_session=False)
+            deleted += len(ids)
+            self._progress(job, len(ids))
+            if len(ids) < self.chunk_size:
+                break
+        return deleted
+
+    def _delete_agents(self, agent_ids: List[int], names: List[str], job):
+        if self.canary is not None:
+            for name in names:
+                self.canary.discard(name)
+        self._delete_logs(Log.agent_name.in_(names), job)
+
+        for chunk in _chunks(agent_ids, self.chunk_size):
+            with self.db.session_scope() as session:
+                versions = select(AgentVersion.id).where(AgentVersion.agent_id.in_(chunk))
+                session.query(AIAgent).filter(AIAgent.id.in_(chunk))\
+                    .update({AIAgent.active_version_id: None}, synchronize_session=False)
+                for table in (agent_version_imports, agent_version_tools, agent_dependency):
+                    session.execute(table.delete().where(table.c.agent_version_id.in_(versions)))
+                session.execute(agent_dependency.delete().where(agent_dependency.c.dependency_id.in_(chunk)))
+                session.query(AgentCanary).filter(AgentCanary.agent_id.in_(chunk)).delete(synchronize_session=False)
+                rows = session.query(AgentVersion).filter(AgentVersion.agent_id.in_(chunk))\
+                    .delete(synchronize_session=False)
+
+                count, rate_sum = session.execute(
+                    select(func.count(AIAgent.id), func.coalesce(func.sum(AIAgent.success_rate), 0.0))
+                    .where(AIAgent.id.in_(chunk))
+                ).one()
+                rows += session.query(AIAgent).filter(AIAgent.id.in_(chunk)).delete(synchronize_session=False)
+                stat_counters.increment(session, 'agent_count', -count)
+                stat_counters.increment(session, 'agent_success_rate_sum', -rate_sum)
+            self._progress(job, rows)
+
+    def _delete_workflows(self, workflow_ids: List[int], job):
+        for workflow_id in workflow_ids:
+            # 执行记录及其日志按块删除，每块一个事务
+            while True:
+                with self.db.session_scope() as session:
+                    execution_ids = [row[0] for row in session.execute(
+                        select(WorkflowExecution.id)
+                        .where(WorkflowExecution.workflow_id == workflow_id)
+                        .limit(self.chunk_size)
+                    )]
+                if not execution_ids:
+                    break
+                self._delete_logs(Log.workflow_execution_id.in_(execution_ids), job)
+                with self.db.session_scope() as session:
+                    rows = session.query(WorkflowExecution).filter(WorkflowExecution.id.in_(execution_ids))\
+                        .delete(synchronize_session=False)
+                self._progress(job, rows)
+
+        for chunk in _chunks(workflow_ids, self.chunk_size):
+            with self.db.session_scope() as session:
+                rows = session.query(WorkflowAPIKey).filter(WorkflowAPIKey.workflow_id.in_(chunk))\
+                    .delete(synchronize_session=False)
+                rows += session.query(FoldedNodeOutput).filter(FoldedNodeOutput.workflow_id.in_(chunk))\
+                    .delete(synchronize_session=False)
+                rows += session.query(ArchivedExecution).filter(ArchivedExecution.workflow_id.in_(chunk))\
+                    .delete(synchronize_session=False)
+
+                stats = session.execute(
+                    select(Workflow.success_count, Workflow.total_executions).where(Workflow.id.in_(chunk))
+                ).all()
+                rows += session.query(Workflow).filter(Workflow.id.in_(chunk)).delete(synchronize_session=False)
+                stat_counters.increment(session, 'workflow_count', -len(stats))
+                stat_counters.increment(session, 'total_executions', -sum(total or 0 for _, total in stats))
+                stat_counters.increment(session, 'workflow_success_rate_sum', -sum(
+                    stat_counters.workflow_success_rate(success or 0, total or 0) for success, total in stats
+                ))
+            self._progress(job, rows)
+            if self.archive is not None:
+                for workflow_id in chunk:
+                    self.archive.drop_workflow(workflow_id)
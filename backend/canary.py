@@ -0,0 +1,205 @@
+# ============================================================================
+# 后端层 - Agent 灰度发布 (Backend - Canary Routing)
+# ============================================================================
+# 同一 Agent 的两个版本按权重分流：活跃版本为稳定版，指定版本为灰度版。
+# 两个版本分别统计延迟、错误率和 token 成本；灰度版 p95 相对稳定版
+# 退化超过阈值时自动回滚。
+# ============================================================================
+
+from typing import Dict, Any, Optional, Tuple
+import random
+import threading
+
+from backend.agent_stats import LatencyHistogram
+
+
+class _VariantStats:
+    """单个版本的对比统计"""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.calls = 0
+        self.errors = 0
+        self.tokens = 0
+        self.cost = 0.0
+
+    def record(self, seconds: float, success: bool, tokens: int = 0, cost: float = 0.0):
+        self.histogram.record(seconds)
+        self.calls += 1
+        if not success:
+            self.errors += 1
+        self.tokens += tokens
+        self.cost += cost
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'error_rate': self.errors / self.calls * 100 if self.calls else 0,
+            'latency': self.histogram.summary(),
+            'tokens_used': self.tokens,
+            'cost': self.cost,
+            'avg_cost': self.cost / self.calls if self.calls else 0
+        }
+
+
+class _CanaryState:
+    def __init__(self, config: Dict[str, Any], canary_entry: Dict):
+        self.config = config
+        self.canary_entry = canary_entry
+        self.stats = {'stable': _VariantStats(), 'canary': _VariantStats()}
+
+
+def extract_usage(result: Any) -> Tuple[int, float]:
+    """从Agent结果中提取 token 用量与成本（兼容 LLMService 与 DeepSeek 的返回格式）"""
+    if not isinstance(result, dict):
+        return 0, 0.0
+    tokens = result.get('tokens_used')
+    if tokens is None and isinstance(result.get('usage'), dict):
+        tokens = result['usage'].get('total_tokens')
+    try:
+        return int(tokens or 0), float(result.get('cost') or 0.0)
+    except (TypeError, ValueError):
+        return 0, 0.0
+
+
+class CanaryRouter:
+    """Agent 版本灰度路由器"""
+
+    def __init__(self, db, registry):
+        self.db = db
+        self.registry = registry
+        self._canaries: Dict[str, _CanaryState] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """启动时恢复进行中的灰度发布（统计从零开始）"""
+        try:
+            with self.db.session_scope() as session:
+                running = self.db.get_running_canaries(session)
+        except Exception as e:
+            print(f"[Canary] ⚠️ 加载灰度发布失败: {e}")
+            return
+
+        for config in running:
+            try:
+                self._activate(config)
+                print(f"[Canary] 恢复灰度: {config['agent_name']} v{config['canary_version']} ({config['weight']*100:.0f}%)")
+            except Exception as e:
+                print(f"[Canary] ⚠️ 恢复 {config['agent_name']} 灰度失败: {e}")
+
+    def start(self, agent_name: str, canary_version: int, weight: float = 0.1,
+              p95_regression: float = 0.2, min_samples: int = 50) -> Dict[str, Any]:
+        """启动灰度发布"""
+        if not 0 < weight < 1:
+            raise ValueError("weight 必须在 0 和 1 之间")
+
+        with self.db.session_scope() as session:
+            config = self.db.start_agent_canary(
+                session, agent_name, canary_version,
+                weight=weight, p95_regression=p95_regression, min_samples=min_samples
+            )
+        self._activate(config)
+        print(f"[Canary] 启动灰度: {agent_name} v{canary_version} ({weight*100:.0f}%)")
+        return self.report(agent_name)
+
+    def _activate(self, config: Dict[str, Any]):
+        stable = self.registry.get_agent(config['agent_name']) or {}
+        canary_entry = self.registry.build_agent_entry(
+            name=config['agent_name'],
+            code=config['canary_code'],
+            agent_type=stable.get('agent_type', 'processor'),
+            description=stable.get('description', ''),
+            category=stable.get('category', '其他'),
+            icon=stable.get('icon', '🤖'),
+            metadata=config['canary_metadata']
+        )
+        with self._lock:
+            self._canaries[config['agent_name']] = _CanaryState(config, canary_entry)
+
+    def route(self, agent_name: str, agent: Dict) -> Tuple[Dict, Optional[str]]:
+        """按权重选择本次调用的版本，返回 (Agent条目, 'stable'/'canary'/None)"""
+        state = self._canaries.get(agent_name)
+        if state is None:
+            return agent, None
+        if random.random() < state.config['weight']:
+            return state.canary_entry, 'canary'
+        return agent, 'stable'
+
+    def record(self, agent_name: str, variant: Optional[str], seconds: float, success: bool, result: Any = None):
+        """记录一次调用结果，并检查灰度版是否需要回滚"""
+        if variant is None:
+            return
+        tokens, cost = extract_usage(result)
+
+        with self._lock:
+            state = self._canaries.get(agent_name)
+            if state is None:
+                return
+            state.stats[variant].record(seconds, success, tokens, cost)
+            regression = self._check_regression(state)
+
+        if regression:
+            self.rollback(agent_name, reason=regression)
+
+    def _check_regression(self, state: _CanaryState) -> Optional[str]:
+        stable = state.stats['stable'].histogram
+        canary = state.stats['canary'].histogram
+        min_samples = state.config['min_samples'] or 1
+        if stable.total < min_samples or canary.total < min_samples:
+            return None
+
+        stable_p95 = stable.percentile(95)
+        canary_p95 = canary.percentile(95)
+        limit = stable_p95 * (1 + state.config['p95_regression'])
+        if canary_p95 > limit:
+            return (f"灰度版 p95 {canary_p95 * 1000:.1f}ms 超过稳定版 p95 {stable_p95 * 1000:.1f}ms "
+                    f"的 {(1 + state.config['p95_regression']) * 100:.0f}%")
+        return None
+
+    def report(self, agent_name: str) -> Optional[Dict[str, Any]]:
+        """灰度对比报告（进行中的灰度返回实时统计）"""
+        with self._lock:
+            state = self._canaries.get(agent_name)
+            if state is None:
+                return None
+            config = state.config
+            return {
+                'agent_name': agent_name,
+                'status': 'running',
+                'weight': config['weight'],
+                'p95_regression': config['p95_regression'],
+                'min_samples': config['min_samples'],
+                'stable': {'version': config['stable_version'], **state.stats['stable'].summary()},
+                'canary': {'version': config['canary_version'], **state.stats['canary'].summary()}
+            }
+
+    def rollback(self, agent_name: str, reason: str = '手动回滚') -> Optional[Dict[str, Any]]:
+        """停止灰度，流量全部回到稳定版"""
+        report = self.report(agent_name)
+        with self._lock:
+            if self._canaries.pop(agent_name, None) is None:
+                return None
+
+        with self.db.session_scope() as session:
+            self.db.end_agent_canary(session, agent_name, 'rolled_back', reason=reason, report=report)
+        print(f"[Canary] ⚠️ 回滚 {agent_name}: {reason}")
+        return report
+
+    def discard(self, agent_name: str) -> bool:
+        """丢弃灰度状态，不写灰度记录（Agent 删除时灰度记录随之删除）"""
+        with self._lock:
+            return self._canaries.pop(agent_name, None) is not None
+
+    def promote(self, agent_name: str) -> Optional[Dict[str, Any]]:
+        """灰度版转正：切换为活跃版本并接管全部流量"""
+        report = self.report(agent_name)
+        with self._lock:
+            state = self._canaries.pop(agent_name, None)
+        if state is None:
+            return None
+
+        with self.db.session_scope() as session:
+            self.db.end_agent_canary(session, agent_name, 'promoted', reason='手动转正', report=report)
+        self.registry.agents[agent_name] = state.canary_entry
+        print(f"[Canary] ✅ {agent_name} v{state.config['canary_version']} 已转正")
+        return report
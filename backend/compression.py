@@ -0,0 +1,118 @@
+# ============================================================================
+# 后端层 - 压缩 JSON 列 (Backend - Compressed JSON Column)
+# ============================================================================
+# CompressedJSON 替代大字段上的 JSON 列：序列化后超过阈值的值以
+# 魔数前缀 + zlib/zstd 压缩后的字节存储，小值直接存 JSON 字节。
+# 读取时兼容迁移前以 JSON 文本存储的旧数据。
+# ============================================================================
+
+from typing import Any, Dict
+from sqlalchemy.types import TypeDecorator, LargeBinary
+from sqlalchemy.dialects import mysql
+import json
+import threading
+import zlib
+
+from backend.config import Config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# 魔数以 \x00 开头，不可能是合法 JSON 文本的开头
+ZLIB_MAGIC = b'\x00zl1'
+ZSTD_MAGIC = b'\x00zs1'
+
+
+class CompressionStats:
+    """本进程写入的压缩统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = 0
+        self.compressed_values = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def record(self, raw_size: int, stored_size: int, compressed: bool):
+        with self._lock:
+            self.values += 1
+            self.raw_bytes += raw_size
+            self.stored_bytes += stored_size
+            if compressed:
+                self.compressed_values += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'codec': 'zstd' if zstandard is not None and Config.JSON_COMPRESS_CODEC == 'zstd' else 'zlib',
+                'values': self.values,
+                'compressed_values': self.compressed_values,
+                'raw_bytes': self.raw_bytes,
+                'stored_bytes': self.stored_bytes,
+                'ratio': self.raw_bytes / self.stored_bytes if self.stored_bytes else 1.0
+            }
+
+
+compression_stats = CompressionStats()
+
+
+def compress_json(value: Any) -> bytes:
+    """序列化并按阈值压缩"""
+    raw = json.dumps(value, ensure_ascii=False).encode('utf-8')
+    if len(raw) < Config.JSON_COMPRESS_MIN_BYTES:
+        compression_stats.record(len(raw), len(raw), False)
+        return raw
+
+    if zstandard is not None and Config.JSON_COMPRESS_CODEC == 'zstd':
+        payload = ZSTD_MAGIC + zstandard.ZstdCompressor(level=Config.JSON_COMPRESS_LEVEL).compress(raw)
+    else:
+        payload = ZLIB_MAGIC + zlib.compress(raw, Config.JSON_COMPRESS_LEVEL)
+
+    # 压缩后反而更大（已压缩过的内容）时直接存原文
+    if len(payload) >= len(raw):
+        compression_stats.record(len(raw), len(raw), False)
+        return raw
+    compression_stats.record(len(raw), len(payload), True)
+    return payload
+
+
+def decompress_json(stored: Any) -> Any:
+    """解压并反序列化；兼容 JSON 文本（迁移前的旧数据）"""
+    if stored is None:
+        return None
+    if isinstance(stored, str):
+        return json.loads(stored)
+
+    stored = bytes(stored)
+    if stored.startswith(ZLIB_MAGIC):
+        return json.loads(zlib.decompress(stored[len(ZLIB_MAGIC):]).decode('utf-8'))
+    if stored.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("数据以 zstd 压缩，但未安装 zstandard 库")
+        return json.loads(zstandard.ZstdDecompressor().decompress(stored[len(ZSTD_MAGIC):]).decode('utf-8'))
+    return json.loads(stored.decode('utf-8'))
+
+
+class CompressedJSON(TypeDecorator):
+    """超过阈值自动压缩的 JSON 列类型"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        # MySQL 的 BLOB 上限 64KB，大字段需要 LONGBLOB
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(mysql.LONGBLOB())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_json(value)
+
+    def result_processor(self, dialect, coltype):
+        # 不走 LargeBinary 的结果处理：迁移前的行在 SQLite 中是 TEXT，驱动返回 str
+        return decompress_json
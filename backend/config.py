@@ -0,0 +1,142 @@
+# ============================================================================
+# 后端层 - 系统配置 (Backend - Config)
+# ============================================================================
+# 所有配置项均可通过环境变量覆盖，例如：
+#   export AGENTFLOW_BATCH_MAX_SIZE=64
+# ============================================================================
+
+import os
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class Config:
+    """AgentFlow 配置"""
+    
+    # 数据库连接；profile='production' 时启用下方的 SQLite PRAGMA / 连接池配置，'basic' 为 SQLAlchemy 默认行为
+    DATABASE_URL = _env_str('AGENTFLOW_DATABASE_URL', 'sqlite:///agentflow.db')
+    DB_PROFILE = _env_str('AGENTFLOW_DB_PROFILE', 'production')
+    # 执行历史数据库：执行记录、日志、日志汇总和归档索引使用独立的数据库（如 sqlite:///agentflow_executions.db），
+    # 执行期间的大量写入不阻塞 Agent/工作流的读取；留空则与 DATABASE_URL 共用同一个库
+    EXECUTION_DATABASE_URL = _env_str('AGENTFLOW_EXECUTION_DATABASE_URL', '')
+    
+    # SQLite：WAL + synchronous=NORMAL，busy_timeout 避免并发写入直接报 "database is locked"
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('AGENTFLOW_SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_MMAP_SIZE = _env_int('AGENTFLOW_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = _env_int('AGENTFLOW_SQLITE_CACHE_SIZE_KB', 64 * 1024)
+    
+    # 连接池（PostgreSQL 等服务端数据库；SQLite 文件库也使用 POOL_SIZE/MAX_OVERFLOW）
+    DB_POOL_SIZE = _env_int('AGENTFLOW_DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = _env_int('AGENTFLOW_DB_MAX_OVERFLOW', 20)
+    DB_POOL_PRE_PING = _env_bool('AGENTFLOW_DB_POOL_PRE_PING', True)
+    DB_POOL_RECYCLE = _env_int('AGENTFLOW_DB_POOL_RECYCLE', 1800)
+    
+    # Agent 动态微批处理：同一Agent的并发调用在等待窗口内合并为一次批量调用
+    BATCH_MAX_SIZE = _env_int('AGENTFLOW_BATCH_MAX_SIZE', 32)
+    BATCH_MAX_WAIT_MS = _env_float('AGENTFLOW_BATCH_MAX_WAIT_MS', 10.0)
+    
+    # 常量折叠：保存/发布后在后台直接调用纯函数 Agent 求值，单个节点超过该秒数即放弃折叠
+    FOLD_TIMEOUT = _env_float('AGENTFLOW_FOLD_TIMEOUT', 5.0)
+    
+    # Agent 执行统计：内存聚合后定期批量写入数据库的间隔（秒）
+    STATS_FLUSH_INTERVAL = _env_float('AGENTFLOW_STATS_FLUSH_INTERVAL', 30.0)
+    
+    # Agent 资源统计（线程CPU时间、进程级 tracemalloc 峰值内存、输出大小），默认关闭
+    PROFILE_AGENTS = _env_bool('AGENTFLOW_PROFILE_AGENTS', False)
+    
+    # Agent 灰度发布默认参数：灰度流量比例、p95 延迟允许退化比例、自动回滚前每个版本的最少样本数
+    CANARY_WEIGHT = _env_float('AGENTFLOW_CANARY_WEIGHT', 0.1)
+    CANARY_P95_REGRESSION = _env_float('AGENTFLOW_CANARY_P95_REGRESSION', 0.2)
+    CANARY_MIN_SAMPLES = _env_int('AGENTFLOW_CANARY_MIN_SAMPLES', 50)
+    
+    # 节点日志异步批量写入：每攒够 LOG_BATCH_SIZE 条或每隔 LOG_FLUSH_INTERVAL_MS 毫秒写一次库
+    LOG_ASYNC = _env_bool('AGENTFLOW_LOG_ASYNC', True)
+    LOG_BATCH_SIZE = _env_int('AGENTFLOW_LOG_BATCH_SIZE', 200)
+    LOG_FLUSH_INTERVAL_MS = _env_float('AGENTFLOW_LOG_FLUSH_INTERVAL_MS', 200.0)
+    LOG_QUEUE_SIZE = _env_int('AGENTFLOW_LOG_QUEUE_SIZE', 10000)
+    # 日志 id 由各进程从 id_sequences 表按号段预留（多进程部署不冲突），每次预留的个数
+    LOG_ID_BLOCK_SIZE = _env_int('AGENTFLOW_LOG_ID_BLOCK_SIZE', 1000)
+    
+    # 日志保留：按 log_type 配置保留天数（<=0 表示永久保留），未配置的类型使用默认天数；
+    # 原始日志删除前先汇总进 log_rollups，小时汇总保留 LOG_ROLLUP_HOURLY_DAYS 天，天汇总永久保留
+    LOG_RETENTION = _env_str('AGENTFLOW_LOG_RETENTION', 'info:7,error:30')
+    LOG_RETENTION_DEFAULT_DAYS = _env_int('AGENTFLOW_LOG_RETENTION_DEFAULT_DAYS', 30)
+    LOG_ROLLUP_HOURLY_DAYS = _env_int('AGENTFLOW_LOG_ROLLUP_HOURLY_DAYS', 90)
+    LOG_COMPACT_INTERVAL = _env_float('AGENTFLOW_LOG_COMPACT_INTERVAL', 3600.0)
+    LOG_COMPACT_CHUNK_SIZE = _env_int('AGENTFLOW_LOG_COMPACT_CHUNK_SIZE', 1000)
+    
+    # 大字段 JSON 压缩（Log.params/output、执行记录的输入输出和执行图）：
+    # 序列化后不小于阈值才压缩；codec 为 zlib 或 zstd（需安装 zstandard，未安装时回退 zlib）
+    JSON_COMPRESS_MIN_BYTES = _env_int('AGENTFLOW_JSON_COMPRESS_MIN_BYTES', 1024)
+    JSON_COMPRESS_CODEC = _env_str('AGENTFLOW_JSON_COMPRESS_CODEC', 'zstd')
+    JSON_COMPRESS_LEVEL = _env_int('AGENTFLOW_JSON_COMPRESS_LEVEL', 6)
+    
+    # 大输出 Blob 存储：序列化后不小于阈值的节点输出写入磁盘（按 sha256 去重），数据库只存引用；
+    # 阈值 <=0 时关闭。垃圾回收删除未被引用且超过宽限期的 Blob
+    BLOB_STORE_DIR = _env_str('AGENTFLOW_BLOB_STORE_DIR', 'blobs')
+    BLOB_MIN_BYTES = _env_int('AGENTFLOW_BLOB_MIN_BYTES', 64 * 1024)
+    BLOB_GC_INTERVAL = _env_float('AGENTFLOW_BLOB_GC_INTERVAL', 86400.0)
+    BLOB_GC_GRACE = _env_float('AGENTFLOW_BLOB_GC_GRACE', 3600.0)
+    
+    # 批量删除：按 BULK_DELETE_CHUNK_SIZE 行一个事务分块删除；
+    # 预计删除行数（版本、执行记录、日志）超过 BULK_DELETE_BACKGROUND_ROWS 时转入后台任务；
+    # 已结束的删除任务保留 BULK_DELETE_JOB_TTL 秒供查询进度
+    BULK_DELETE_CHUNK_SIZE = _env_int('AGENTFLOW_BULK_DELETE_CHUNK_SIZE', 1000)
+    BULK_DELETE_BACKGROUND_ROWS = _env_int('AGENTFLOW_BULK_DELETE_BACKGROUND_ROWS', 10000)
+    BULK_DELETE_JOB_TTL = _env_float('AGENTFLOW_BULK_DELETE_JOB_TTL', 3600.0)
+    
+    # 冷归档：开始时间超过 ARCHIVE_AFTER_DAYS 天的已结束执行记录（连同日志）移入
+    # ARCHIVE_DIR 下按工作流、按月分段的 gzip NDJSON 文件（<=0 关闭）；
+    # ARCHIVE_LOGS 开启时日志保留清理删除的日志也先写入归档（执行日志写入所属工作流的归档目录）
+    ARCHIVE_DIR = _env_str('AGENTFLOW_ARCHIVE_DIR', 'archive')
+    ARCHIVE_AFTER_DAYS = _env_int('AGENTFLOW_ARCHIVE_AFTER_DAYS', 90)
+    ARCHIVE_LOGS = _env_bool('AGENTFLOW_ARCHIVE_LOGS', True)
+    ARCHIVE_INTERVAL = _env_float('AGENTFLOW_ARCHIVE_INTERVAL', 86400.0)
+    ARCHIVE_CHUNK_SIZE = _env_int('AGENTFLOW_ARCHIVE_CHUNK_SIZE', 500)
+    
+    # SQL 分析（默认关闭）：统计每个请求的 SQL 条数和耗时，管理员请求或调试模式下写入
+    # X-SQL-Queries / X-SQL-Time-Ms 响应头；同一语句在一个请求内重复超过 SQL_N_PLUS_ONE_THRESHOLD 次时打印 N+1 警告
+    SQL_PROFILE = _env_bool('AGENTFLOW_SQL_PROFILE', False)
+    SQL_N_PLUS_ONE_THRESHOLD = _env_int('AGENTFLOW_SQL_N_PLUS_ONE_THRESHOLD', 10)
+    SQL_PROFILE_HISTORY = _env_int('AGENTFLOW_SQL_PROFILE_HISTORY', 100)
+    
+    # 请求级工作单元：一个 HTTP 请求内的多个 session_scope 复用同一个 Session 和连接
+    DB_UNIT_OF_WORK = _env_bool('AGENTFLOW_DB_UNIT_OF_WORK', True)
+    
+    # 密钥缓存：解密后的密钥缓存在进程内存中，本进程写入时立即失效；
+    # SECRET_CACHE_TTL 秒后过期以感知其他进程的写入（<=0 表示不过期）
+    SECRET_CACHE = _env_bool('AGENTFLOW_SECRET_CACHE', True)
+    SECRET_CACHE_TTL = _env_float('AGENTFLOW_SECRET_CACHE_TTL', 300.0)
+    
+    # 日志分析：从 logs 表流式读取时每块的行数（安装 numpy 时按块转换为数组）
+    ANALYTICS_CHUNK_SIZE = _env_int('AGENTFLOW_ANALYTICS_CHUNK_SIZE', 50000)
+    
+    # DeepSeek HTTP 连接池：各线程的 Session 共享连接池，keep-alive 复用连接；
+    # 连接失败和 429/503 最多重试 LLM_HTTP_RETRIES 次（指数退避，遵循 Retry-After）；502/504 不重试，避免重复提交 POST
+    LLM_HTTP_POOL_CONNECTIONS = _env_int('AGENTFLOW_LLM_HTTP_POOL_CONNECTIONS', 4)
+    LLM_HTTP_POOL_MAXSIZE = _env_int('AGENTFLOW_LLM_HTTP_POOL_MAXSIZE', 20)
+    LLM_HTTP_RETRIES = _env_int('AGENTFLOW_LLM_HTTP_RETRIES', 2)
+    LLM_HTTP_RETRY_BACKOFF = _env_float('AGENTFLOW_LLM_HTTP_RETRY_BACKOFF', 0.5)
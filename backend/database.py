@@ -2,43 +2,346 @@
 # 后端层 - 数据访问层 (Backend - Database)
 # ============================================================================
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import create_engine, event, inspect, select, text, func, and_, or_, JSON
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session, joinedload, load_only
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateTable
 from contextlib import contextmanager
-from backend.models import Base, AIAgent, AgentVersion, Workflow, WorkflowExecution, AgentTool, Import, Log, SecretKey, User, fernet
+from backend.config import Config
+from backend.compression import CompressedJSON
+from backend.models import Base, AIAgent, AgentVersion, Workflow, WorkflowExecution, WorkflowAPIKey, AgentTool, Import, Log, SecretKey, User, FoldedNodeOutput, AgentCanary, LogRollup, ArchivedExecution, fernet
+from backend import stat_counters
+from backend import search as fulltext
+from backend import analytics
+from backend.secret_cache import SecretCache, is_missing
+from backend.id_blocks import IdBlockAllocator
 from datetime import datetime
 import json
+import threading
+
+# 高频写入的执行历史表；配置 EXECUTION_DATABASE_URL 后放在独立的数据库中
+EXECUTION_MODELS = (WorkflowExecution, Log, LogRollup, ArchivedExecution)
+EXECUTION_TABLES = frozenset(model.__tablename__ for model in EXECUTION_MODELS)
+# 拆分前写入主库的执行历史每次搬移的行数
+_MOVE_CHUNK_SIZE = 1000
 
 class Database:
     """数据库操作类 - DAO层"""
     
-    def __init__(self, db_path='sqlite:///agentflow.db'):
-        self.engine = create_engine(db_path, echo=False)
-        Base.metadata.create_all(self.engine)
-        self.Session = scoped_session(sessionmaker(bind=self.engine))
-        print(f"✓ 数据库初始化成功: {db_path}")
+    def __init__(self, db_path=None, profile=None, execution_db_path=None):
+        db_path = db_path or Config.DATABASE_URL
+        if execution_db_path is None:
+            execution_db_path = Config.EXECUTION_DATABASE_URL
+        self.profile = profile or Config.DB_PROFILE
+        self.engine = self._create_engine(db_path, self.profile)
+        # 执行历史（执行记录、日志、汇总、归档索引）可放在独立数据库中（SQLite 下为独立文件和 WAL），
+        # 执行产生的大量写入不再与 Agent/工作流/对话的读写争用同一把文件锁
+        if execution_db_path and execution_db_path != db_path:
+            self.execution_engine = self._create_engine(execution_db_path, self.profile)
+        else:
+            self.execution_engine = self.engine
+        self._create_tables()
+        self._migrate_schema()
+        self._move_execution_history()
+        self._backfill_active_versions()
+        self._backfill_execution_time_totals()
+        stat_counters.ensure(self.engine)
+        self.search_tokenizer = fulltext.ensure_search_index(self.engine)
+        self.secret_cache = SecretCache(ttl=Config.SECRET_CACHE_TTL) if Config.SECRET_CACHE else None
+        # 执行历史表的 ORM 查询、Core 语句按表路由到执行库，其余表使用主库
+        binds = {model: self.execution_engine for model in EXECUTION_MODELS} if self.split_execution else {}
+        self.Session = scoped_session(sessionmaker(bind=self.engine, binds=binds))
+        # 当前线程的工作单元状态（见 unit_of_work）
+        self._local = threading.local()
+        # 日志 id 按号段预留：异步写入的日志入队时即可确定 id，多进程不冲突
+        self.log_ids = IdBlockAllocator(self.engine, 'logs', Log.id, id_engine=self.execution_engine,
+                                        block_size=Config.LOG_ID_BLOCK_SIZE)
+        print(f"✓ 数据库初始化成功: {db_path} (profile: {self.profile})")
+        if self.split_execution:
+            print(f"  ✓ 执行历史数据库: {execution_db_path}")
+    
+    @property
+    def split_execution(self):
+        """执行历史是否使用独立的数据库"""
+        return self.execution_engine is not self.engine
+    
+    @property
+    def engines(self):
+        """所有 Engine（主库在前），供需要监听引擎事件的组件使用"""
+        return [self.engine, self.execution_engine] if self.split_execution else [self.engine]
+    
+    def _table_groups(self):
+        """(engine, 表列表) 分组：未拆分时所有表都在主库"""
+        tables = Base.metadata.sorted_tables
+        if not self.split_execution:
+            return [(self.engine, tables)]
+        return [
+            (self.engine, [table for table in tables if table.name not in EXECUTION_TABLES]),
+            (self.execution_engine, [table for table in tables if table.name in EXECUTION_TABLES])
+        ]
+    
+    def _create_engine(self, db_path, profile):
+        """按存储引擎配置创建 Engine；profile='basic' 时保持 SQLAlchemy 默认行为"""
+        if profile == 'basic':
+            return create_engine(db_path, echo=False)
+        
+        url = make_url(db_path)
+        if url.get_backend_name() != 'sqlite':
+            # PostgreSQL/MySQL：连接池大小、溢出、取用前探活和定期回收
+            return create_engine(
+                db_path,
+                echo=False,
+                pool_size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_MAX_OVERFLOW,
+                pool_pre_ping=Config.DB_POOL_PRE_PING,
+                pool_recycle=Config.DB_POOL_RECYCLE
+            )
+        
+        in_memory = url.database in (None, '', ':memory:')
+        if in_memory:
+            engine = create_engine(db_path, echo=False)
+        else:
+            # 文件库使用连接池复用连接，PRAGMA 和页缓存不必每次重建
+            engine = create_engine(
+                db_path,
+                echo=False,
+                poolclass=QueuePool,
+                pool_size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_MAX_OVERFLOW,
+                connect_args={'check_same_thread': False, 'timeout': Config.SQLITE_BUSY_TIMEOUT_MS / 1000.0}
+            )
+        
+        @event.listens_for(engine, 'connect')
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not in_memory:
+                # WAL：读不阻塞写，写不阻塞读；NORMAL 在 WAL 下只在检查点 fsync
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=NORMAL')
+                cursor.execute(f'PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}')
+            cursor.execute(f'PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}')
+            cursor.execute(f'PRAGMA cache_size=-{Config.SQLITE_CACHE_SIZE_KB}')
+            cursor.close()
+        
+        return engine
+    
+    def _create_tables(self):
+        """创建缺失的表；执行库中不创建指向主库表的外键（跨库外键无法建立）"""
+        for engine, tables in self._table_groups():
+            if engine is self.engine:
+                Base.metadata.create_all(engine, tables=tables)
+                continue
+            inspector = inspect(engine)
+            with engine.begin() as conn:
+                for table in tables:
+                    if inspector.has_table(table.name):
+                        continue
+                    local_keys = [key for key in table.foreign_key_constraints
+                                  if key.referred_table.name in EXECUTION_TABLES]
+                    conn.execute(CreateTable(table, include_foreign_key_constraints=local_keys))
+                    for index in table.indexes:
+                        index.create(bind=conn)
+    
+    def _migrate_schema(self):
+        """幂等的启动迁移：为已有数据库文件补齐模型中新增的列和索引"""
+        for engine, tables in self._table_groups():
+            inspector = inspect(engine)
+            for table in tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    with engine.begin() as conn:
+                        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    print(f"  ✓ 迁移: {table.name} 新增列 {column.name}")
+                
+                # 已有的 JSON 列改为压缩 JSON（二进制）存储；SQLite 按值存储类型，无需改表
+                if engine.dialect.name != 'sqlite':
+                    self._migrate_compressed_columns(engine, inspector, table)
+                
+                # create_all 只为新建的表创建索引，已有表的新索引在这里补齐
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing_indexes:
+                        continue
+                    index.create(bind=engine, checkfirst=True)
+                    print(f"  ✓ 迁移: {table.name} 新增索引 {index.name}")
+    
+    def _migrate_compressed_columns(self, engine, inspector, table):
+        """把服务端数据库中仍为 JSON 类型的列转换为 CompressedJSON 的二进制类型，原有内容按 UTF-8 保留"""
+        current = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if not isinstance(column.type, CompressedJSON) or not isinstance(current.get(column.name), JSON):
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                if engine.dialect.name == 'postgresql':
+                    conn.execute(text(
+                        f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type} '
+                        f"USING convert_to({column.name}::text, 'UTF8')"
+                    ))
+                else:
+                    conn.execute(text(f'ALTER TABLE {table.name} MODIFY COLUMN {column.name} {column_type}'))
+            print(f"  ✓ 迁移: {table.name}.{column.name} 改为压缩存储")
+    
+    def _move_execution_history(self):
+        """启用执行库前写入主库的执行历史按 id 分块复制到执行库，全部复制完成后从主库删除。
+        复制跳过执行库中已有的 id，中途中断后重启可继续"""
+        if not self.split_execution:
+            return
+        inspector = inspect(self.engine)
+        legacy = [table for table in Base.metadata.sorted_tables
+                  if table.name in EXECUTION_TABLES and inspector.has_table(table.name)]
+        moved = {}
+        for table in legacy:
+            # 旧表可能缺少后来新增的列，只复制两边都有的列
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            columns = [column for column in table.columns if column.name in present]
+            last_id = 0
+            while True:
+                with self.engine.connect() as source:
+                    rows = [dict(row._mapping) for row in source.execute(
+                        select(*columns).where(table.c.id > last_id).order_by(table.c.id).limit(_MOVE_CHUNK_SIZE)
+                    )]
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                with self.execution_engine.begin() as target:
+                    copied = {row[0] for row in target.execute(
+                        select(table.c.id).where(table.c.id.in_([row['id'] for row in rows]))
+                    )}
+                    fresh = [row for row in rows if row['id'] not in copied]
+                    if fresh:
+                        target.execute(table.insert(), fresh)
+                moved[table.name] = moved.get(table.name, 0) + len(rows)
+        if not moved:
+            return
+        # 按依赖的逆序删除（日志引用执行记录）
+        with self.engine.begin() as conn:
+            for table in reversed(legacy):
+                conn.execute(table.delete())
+        for name, count in moved.items():
+            print(f"  ✓ 迁移: {name} 的 {count} 行已移到执行历史数据库")
+    
+    def _backfill_active_versions(self):
+        """为迁移前创建的 Agent 回填 active_version_id（取 is_active 的最新版本）"""
+        with self.engine.begin() as conn:
+            result = conn.execute(text(
+                'UPDATE ai_agents SET active_version_id = ('
+                '  SELECT v.id FROM agent_versions v'
+                '  WHERE v.agent_id = ai_agents.id AND v.is_active = :active'
+                '  ORDER BY v.version DESC LIMIT 1'
+                ') WHERE active_version_id IS NULL'
+            ), {'active': True})
+        if result.rowcount:
+            print(f"  ✓ 迁移: 回填 {result.rowcount} 个 Agent 的活跃版本")
+    
+    def _backfill_execution_time_totals(self):
+        """为迁移前的工作流由平均执行时间回填累计执行时间"""
+        with self.engine.begin() as conn:
+            result = conn.execute(text(
+                'UPDATE workflows SET total_execution_time = '
+                '  COALESCE(avg_execution_time, 0) * COALESCE(total_executions, 0) '
+                'WHERE total_execution_time IS NULL'
+            ))
+        if result.rowcount:
+            print(f"  ✓ 迁移: 回填 {result.rowcount} 个工作流的累计执行时间")
     
     @contextmanager
     def session_scope(self):
-        """提供事务作用域的上下文管理器"""
+        """提供事务作用域的上下文管理器（工作单元内复用同一个 Session，退出时只提交）"""
         session = self.Session()
         try:
             yield session
             session.commit()
-        except SQLAlchemyError as e:
+        except Exception as e:
             session.rollback()
             raise e
+        finally:
+            if getattr(self._local, 'uow', None) is None:
+                self.Session.remove()
+    
+    # ========================================================================
+    # 工作单元：一个请求/一次工作流执行内复用同一个 Session
+    # ========================================================================
+    
+    def begin_unit_of_work(self, hold_connection=True):
+        """开始当前线程的工作单元，之后的 session_scope 复用同一个 Session（嵌套时只计数）。
+        hold_connection=True 时整个工作单元绑定同一个连接；长时间运行的工作单元
+        （如工作流执行）应传 False，提交后把连接还给连接池。
+        嵌套在持有连接的工作单元内的 hold_connection=False 工作单元会先提交并归还外层连接，
+        期间每次提交后释放连接，结束时再为外层重新绑定连接"""
+        state = getattr(self._local, 'uow', None)
+        if state is not None:
+            state['depth'] += 1
+            if not hold_connection and state['connection'] is not None:
+                self._close_session(state['connection'])
+                state['connection'] = None
+                state['released_at'] = state['depth']
+            return
+        # 丢弃线程上残留的 Session，才能以新的绑定创建
+        self.Session.remove()
+        connection = self.engine.connect() if hold_connection else None
+        if connection is not None:
+            self.Session(bind=connection)
+        self._local.uow = {'depth': 1, 'connection': connection, 'released_at': None}
+    
+    def end_unit_of_work(self, error=None):
+        """结束工作单元：提交剩余改动（出错时回滚），关闭 Session 并归还连接"""
+        state = getattr(self._local, 'uow', None)
+        if state is None:
+            return
+        state['depth'] -= 1
+        if state['depth'] > 0:
+            if state['released_at'] == state['depth'] + 1:
+                # 嵌套的不持有连接的工作单元结束，外层恢复持有连接
+                self._close_session(None, error)
+                state['connection'] = self.engine.connect()
+                state['released_at'] = None
+                self.Session(bind=state['connection'])
+            return
+        self._local.uow = None
+        self._close_session(state['connection'], error)
+    
+    def _close_session(self, connection, error=None):
+        """提交（出错时回滚）当前线程的 Session 后关闭，并把连接还给连接池"""
+        session = self.Session()
+        try:
+            if error is None:
+                session.commit()
+            else:
+                session.rollback()
+        except Exception as e:
+            session.rollback()
+            print(f"⚠️ 工作单元提交失败，已回滚: {e}")
         finally:
             self.Session.remove()
+            if connection is not None:
+                connection.close()
+    
+    @contextmanager
+    def unit_of_work(self, hold_connection=True):
+        """工作单元上下文管理器，见 begin_unit_of_work"""
+        self.begin_unit_of_work(hold_connection)
+        try:
+            yield self.Session()
+        except Exception as e:
+            self.end_unit_of_work(e)
+            raise
+        else:
+            self.end_unit_of_work()
     
     # ========================================================================
     # Agent 相关操作
     # ========================================================================
     
     def add_or_update_agent(self, session, name, code, metadata, dependencies, triggers, 
-                           input_parameters, output_parameters, imports=None):
-        """添加或更新 Agent"""
+                           input_parameters, output_parameters, imports=None, activate=True):
+        """添加或更新 Agent（activate=False 时只新增版本，不切换活跃版本，用于灰度发布）"""
         agent = session.query(AIAgent).filter_by(name=name).first()
         
         if not agent:
@@ -73,7 +376,7 @@ class Database:
             version=len(agent.versions) + 1,
             code=code,
             agent_metadata=metadata or {},
-            is_active=True,
+            is_active=activate,
             input_parameters=input_parameters or [],
             output_parameters=output_parameters or [],
             imports=import_objects,
@@ -89,22 +392,120 @@ class Database:
                     version.dependencies.append(dep_agent)
         
         # 停用旧版本
-        for v in agent.versions:
-            if v != version:
-                v.is_active = False
+        if activate:
+            for v in agent.versions:
+                if v != version:
+                    v.is_active = False
+            agent.active_version = version
         
         return agent.id
     
-    def get_agent(self, session, name):
-        """获取 Agent"""
-        agent = session.query(AIAgent).filter_by(name=name).first()
+    # ========================================================================
+    # Agent 灰度发布
+    # ========================================================================
+    
+    def _canary_to_dict(self, canary):
+        return {
+            'id': canary.id,
+            'agent_name': canary.agent.name,
+            'stable_version': canary.stable_version.version,
+            'stable_code': canary.stable_version.code,
+            'stable_metadata': canary.stable_version.agent_metadata or {},
+            'canary_version': canary.canary_version.version,
+            'canary_code': canary.canary_version.code,
+            'canary_metadata': canary.canary_version.agent_metadata or {},
+            'weight': canary.weight,
+            'p95_regression': canary.p95_regression,
+            'min_samples': canary.min_samples,
+            'status': canary.status,
+            'reason': canary.reason,
+            'report': canary.report,
+            'created_date': canary.created_date.isoformat() if canary.created_date else None,
+            'ended_date': canary.ended_date.isoformat() if canary.ended_date else None
+        }
+    
+    def start_agent_canary(self, session, agent_name, canary_version, weight=0.1,
+                           p95_regression=0.2, min_samples=50):
+        """为 Agent 启动灰度发布：活跃版本为稳定版，canary_version 按 weight 分流"""
+        agent = session.query(AIAgent).filter_by(name=agent_name).first()
         if not agent:
+            raise ValueError(f"Agent '{agent_name}' 不存在")
+        
+        stable = agent.active_version
+        canary = session.query(AgentVersion).filter_by(agent_id=agent.id, version=canary_version).first()
+        if not stable:
+            raise ValueError(f"Agent '{agent_name}' 没有活跃版本")
+        if not canary:
+            raise ValueError(f"Agent '{agent_name}' 不存在版本 v{canary_version}")
+        if canary.id == stable.id:
+            raise ValueError("灰度版本不能与当前活跃版本相同")
+        
+        # 同一 Agent 同时只保留一个进行中的灰度
+        for running in session.query(AgentCanary).filter_by(agent_id=agent.id, status='running').all():
+            running.status = 'rolled_back'
+            running.reason = '被新的灰度发布替换'
+            running.ended_date = datetime.utcnow()
+        
+        record = AgentCanary(
+            agent=agent,
+            stable_version=stable,
+            canary_version=canary,
+            weight=weight,
+            p95_regression=p95_regression,
+            min_samples=min_samples,
+            status='running'
+        )
+        session.add(record)
+        session.flush()
+        return self._canary_to_dict(record)
+    
+    def get_running_canaries(self, session):
+        """获取所有进行中的灰度发布"""
+        canaries = session.query(AgentCanary).filter_by(status='running').all()
+        return [self._canary_to_dict(c) for c in canaries]
+    
+    def get_agent_canary(self, session, agent_name):
+        """获取 Agent 最近一次灰度发布记录"""
+        canary = session.query(AgentCanary).join(AIAgent, AgentCanary.agent_id == AIAgent.id)\
+            .filter(AIAgent.name == agent_name)\
+            .order_by(AgentCanary.id.desc())\
+            .first()
+        return self._canary_to_dict(canary) if canary else None
+    
+    def end_agent_canary(self, session, agent_name, status, reason=None, report=None):
+        """结束灰度发布；status='promoted' 时把灰度版本切换为活跃版本"""
+        canary = session.query(AgentCanary).join(AIAgent, AgentCanary.agent_id == AIAgent.id)\
+            .filter(AIAgent.name == agent_name, AgentCanary.status == 'running')\
+            .first()
+        if not canary:
             return None
         
-        active_version = session.query(AgentVersion)\
-            .filter_by(agent_id=agent.id, is_active=True)\
+        canary.status = status
+        canary.reason = reason
+        canary.report = report
+        canary.ended_date = datetime.utcnow()
+        
+        if status == 'promoted':
+            for v in canary.agent.versions:
+                v.is_active = (v.id == canary.canary_version_id)
+            canary.agent.active_version_id = canary.canary_version_id
+        
+        session.flush()
+        return self._canary_to_dict(canary)
+    
+    def get_agent(self, session, name):
+        """获取 Agent（活跃版本随 Agent 一起 JOIN 加载，依赖和导入各一次批量查询）"""
+        agent = session.query(AIAgent)\
+            .options(
+                joinedload(AIAgent.active_version).selectinload(AgentVersion.dependencies),
+                joinedload(AIAgent.active_version).selectinload(AgentVersion.imports)
+            )\
+            .filter_by(name=name)\
             .first()
+        if not agent:
+            return None
         
+        active_version = agent.active_version
         if not active_version:
             return None
         
@@ -123,40 +524,66 @@ class Database:
             'prompt_template': agent.prompt_template,
             'category': agent.category,
             'icon': agent.icon,
-            'description': agent.description
+            'description': agent.description,
+            'total_executions': agent.total_executions,
+            'success_rate': agent.success_rate,
+            'avg_execution_time': agent.avg_execution_time
         }
     
-    def get_all_agents(self, session):
-        """获取所有 Agent"""
-        agents = session.query(AIAgent).all()
-        result = []
+    def get_all_agents(self, session, limit=None, after_id=None, category=None):
+        """获取所有 Agent（一次 JOIN 查询，只取列表需要的列；after_id/limit 为按 id 的游标分页）"""
+        query = session.query(
+            AIAgent.id, AIAgent.name, AIAgent.agent_type, AIAgent.category, AIAgent.icon,
+            AIAgent.description, AgentVersion.version, AIAgent.total_executions,
+            AIAgent.success_rate, AIAgent.avg_execution_time
+        ).join(AgentVersion, AIAgent.active_version_id == AgentVersion.id)
         
-        for agent in agents:
-            active_version = session.query(AgentVersion)\
-                .filter_by(agent_id=agent.id, is_active=True)\
-                .first()
-            
-            if active_version:
-                result.append({
-                    'id': agent.id,
-                    'name': agent.name,
-                    'agent_type': agent.agent_type,
-                    'category': agent.category,
-                    'icon': agent.icon,
-                    'description': agent.description,
-                    'version': active_version.version,
-                    'total_executions': agent.total_executions,
-                    'success_rate': agent.success_rate,
-                    'avg_execution_time': agent.avg_execution_time
-                })
+        if category:
+            query = query.filter(AIAgent.category == category)
+        if after_id is not None:
+            query = query.filter(AIAgent.id > after_id)
         
-        return result
+        rows = query.order_by(AIAgent.id).limit(limit).all()
+        
+        return [{
+            'id': row.id,
+            'name': row.name,
+            'agent_type': row.agent_type,
+            'category': row.category,
+            'icon': row.icon,
+            'description': row.description,
+            'version': row.version,
+            'total_executions': row.total_executions,
+            'success_rate': row.success_rate,
+            'avg_execution_time': row.avg_execution_time
+        } for row in rows]
+    
+    def get_agent_definitions(self, session):
+        """获取所有 Agent 的活跃版本代码和元数据（注册中心启动加载用，一次 JOIN 查询）"""
+        rows = session.query(
+            AIAgent.name, AIAgent.agent_type, AIAgent.category, AIAgent.icon, AIAgent.description,
+            AgentVersion.code, AgentVersion.agent_metadata
+        ).join(AgentVersion, AIAgent.active_version_id == AgentVersion.id)\
+            .order_by(AIAgent.id)\
+            .all()
+        
+        return [{
+            'name': row.name,
+            'agent_type': row.agent_type,
+            'category': row.category,
+            'icon': row.icon,
+            'description': row.description,
+            'code': row.code,
+            'metadata': row.agent_metadata
+        } for row in rows]
     
     def delete_agent(self, session, agent_name):
         """删除Agent及其所有版本"""
         agent = session.query(AIAgent).filter_by(name=agent_name).first()
         if agent:
-            # 删除所有版本
+            # 先解除活跃版本指针，再删除所有版本
+            agent.active_version_id = None
+            session.flush()
             session.query(AgentVersion).filter_by(agent_id=agent.id).delete()
             # 删除Agent
             session.delete(agent)
@@ -206,9 +633,21 @@ class Database:
             'last_executed': workflow.last_executed
         }
     
-    def get_all_workflows(self, session):
-        """获取所有工作流"""
-        workflows = session.query(Workflow).all()
+    def get_all_workflows(self, session, limit=None, after_id=None, category=None, status=None):
+        """获取所有工作流（after_id/limit 为按 id 的游标分页）"""
+        query = session.query(Workflow).options(load_only(
+            Workflow.id, Workflow.name, Workflow.description, Workflow.category, Workflow.status,
+            Workflow.total_executions, Workflow.success_count, Workflow.created_date
+        ))
+        
+        if category:
+            query = query.filter(Workflow.category == category)
+        if status:
+            query = query.filter(Workflow.status == status)
+        if after_id is not None:
+            query = query.filter(Workflow.id > after_id)
+        
+        workflows = query.order_by(Workflow.id).limit(limit).all()
         return [{
             'id': w.id,
             'name': w.name,
@@ -234,44 +673,81 @@ class Database:
         return execution.id
     
     def update_workflow_execution(self, session, execution_id, **kwargs):
-        """更新工作流执行记录"""
-        execution = session.query(WorkflowExecution).filter_by(id=execution_id).first()
-        if execution:
-            # 保存旧状态
-            old_status = execution.status
-            
-            # 更新执行记录
-            for key, value in kwargs.items():
-                if hasattr(execution, key):
-                    setattr(execution, key, value)
-            
-            # 更新工作流统计数据（只在状态第一次变为completed或failed时更新，避免重复计数）
-            new_status = kwargs.get('status')
-            workflow = session.query(Workflow).filter_by(id=execution.workflow_id).first()
-            
-            # 关键：只在状态从running变为completed或failed时才更新统计
-            if (workflow and 
-                new_status in ['completed', 'failed'] and 
-                old_status not in ['completed', 'failed']):
-                
-                workflow.total_executions += 1
-                workflow.last_executed = kwargs.get('completed_at', datetime.utcnow())
-                
-                if new_status == 'completed':
-                    workflow.success_count += 1
-                elif new_status == 'failed':
-                    workflow.fail_count += 1
-                
-                # 更新平均执行时间
-                exec_time = kwargs.get('execution_time')
-                if exec_time:
-                    if workflow.avg_execution_time == 0:
-                        workflow.avg_execution_time = exec_time
-                    else:
-                        workflow.avg_execution_time = (
-                            (workflow.avg_execution_time * (workflow.total_executions - 1) + exec_time) 
-                            / workflow.total_executions
-                        )
+        """更新工作流执行记录（状态转换和统计累加都是单条原子 UPDATE，并发执行不丢计数）"""
+        table = WorkflowExecution.__table__
+        values = {key: value for key, value in kwargs.items() if key in table.c}
+        if not values:
+            return
+        
+        # 只在状态第一次变为completed或failed时更新统计，避免重复计数：
+        # 条件 UPDATE 保证并发的多个调用方中只有一个完成状态转换
+        new_status = values.get('status')
+        if new_status in ('completed', 'failed'):
+            result = session.execute(
+                table.update()
+                .where(table.c.id == execution_id)
+                .where(or_(table.c.status.is_(None), table.c.status.notin_(['completed', 'failed'])))
+                .values(**values)
+            )
+            if result.rowcount:
+                self._record_workflow_execution(session, execution_id, new_status, values)
+                return
+        
+        session.execute(table.update().where(table.c.id == execution_id).values(**values))
+    
+    def _record_workflow_execution(self, session, execution_id, status, values):
+        """把一次完成的执行原子地累加到工作流统计和仪表盘计数"""
+        workflow_id = session.execute(
+            select(WorkflowExecution.workflow_id).where(WorkflowExecution.id == execution_id)
+        ).scalar()
+        if workflow_id is None:
+            return
+        
+        table = Workflow.__table__
+        succeeded = 1 if status == 'completed' else 0
+        total = func.coalesce(table.c.total_executions, 0) + 1
+        time_sum = func.coalesce(table.c.total_execution_time, 0.0) + (values.get('execution_time') or 0.0)
+        # avg_execution_time 放在最前：MySQL 按顺序赋值，后面的表达式会读到已更新的列
+        result = session.execute(
+            table.update().where(table.c.id == workflow_id).ordered_values(
+                (table.c.avg_execution_time, time_sum / total),
+                (table.c.total_execution_time, time_sum),
+                (table.c.total_executions, total),
+                (table.c.success_count, func.coalesce(table.c.success_count, 0) + succeeded),
+                (table.c.fail_count, func.coalesce(table.c.fail_count, 0) + (1 - succeeded)),
+                (table.c.last_executed, values.get('completed_at') or datetime.utcnow()),
+            )
+        )
+        if not result.rowcount:
+            return
+        
+        # 同步仪表盘计数：成功率差值由更新后的行推算，不依赖更新前读到的旧值
+        row = session.execute(
+            select(table.c.success_count, table.c.total_executions).where(table.c.id == workflow_id)
+        ).one()
+        new_rate = stat_counters.workflow_success_rate(row.success_count, row.total_executions)
+        old_rate = stat_counters.workflow_success_rate(row.success_count - succeeded, row.total_executions - 1)
+        stat_counters.increment(session, 'total_executions', 1)
+        stat_counters.increment(session, 'workflow_success_rate_sum', new_rate - old_rate)
+    
+    def record_api_key_call(self, session, key_id):
+        """原子地累加 API Key 调用次数"""
+        table = WorkflowAPIKey.__table__
+        session.execute(
+            table.update().where(table.c.id == key_id).values(
+                calls_count=func.coalesce(table.c.calls_count, 0) + 1,
+                last_used=datetime.utcnow()
+            )
+        )
+    
+    def search(self, session, query, kinds=fulltext.KINDS, user_id=None, limit=20, offset=0):
+        """全文搜索 Agent、工作流和对话消息（按相关度排序）"""
+        return fulltext.search(session, query, self.search_tokenizer, kinds=kinds,
+                               user_id=user_id, limit=limit, offset=offset)
+    
+    def get_stat_counters(self, session):
+        """读取仪表盘统计计数（O(1)，不扫描 Agent/工作流表）"""
+        return stat_counters.read(session)
     
     def get_workflow_execution(self, session, execution_id):
         """获取工作流执行记录"""
@@ -294,23 +770,56 @@ class Database:
             'cost': execution.cost
         }
     
+    # ========================================================================
+    # 常量折叠相关操作
+    # ========================================================================
+    
+    def replace_folded_outputs(self, session, workflow_id, entries):
+        """替换工作流的常量折叠结果"""
+        session.query(FoldedNodeOutput).filter_by(workflow_id=workflow_id).delete()
+        for entry in entries:
+            session.add(FoldedNodeOutput(
+                workflow_id=workflow_id,
+                agent_name=entry['agent_name'],
+                params_hash=entry['params_hash'],
+                agent_fingerprint=entry['agent_fingerprint'],
+                output=entry['output']
+            ))
+        session.flush()
+    
+    def get_folded_outputs(self, session, workflow_id):
+        """获取工作流的常量折叠结果，按 (agent_name, params_hash) 索引"""
+        rows = session.query(FoldedNodeOutput).filter_by(workflow_id=workflow_id).all()
+        return {
+            (row.agent_name, row.params_hash): {
+                'agent_fingerprint': row.agent_fingerprint,
+                'output': row.output
+            } for row in rows
+        }
+    
     # ========================================================================
     # 日志相关操作
     # ========================================================================
     
     def add_log(self, session, agent_name, message, timestamp, params, output, 
-                time_spent, parent_log_id=None, triggered_by_log_id=None, log_type='info'):
-        """添加日志"""
+                time_spent, parent_log_id=None, triggered_by_log_id=None, log_type='info',
+                cpu_time=None, peak_memory=None, output_size=None, workflow_execution_id=None):
+        """添加日志（工作流节点的日志关联到所属的执行记录）"""
         if isinstance(timestamp, str):
             timestamp = datetime.fromisoformat(timestamp)
         
         new_log = Log(
+            id=self.allocate_log_id(),
+            workflow_execution_id=workflow_execution_id,
             agent_name=agent_name,
             message=message,
             timestamp=timestamp,
             params=params,
             output=output,
             time_spent=time_spent,
+            cpu_time=cpu_time,
+            peak_memory=peak_memory,
+            output_size=output_size,
             parent_log_id=parent_log_id,
             triggered_by_log_id=triggered_by_log_id,
             log_type=log_type
@@ -319,32 +828,75 @@ class Database:
         session.flush()
         return new_log.id
     
-    def get_logs(self, session, agent_name=None, limit=100):
-        """获取日志"""
-        query = session.query(Log)
+    def allocate_log_id(self):
+        """分配日志 id（所有日志写入都经由号段分配，不使用数据库自增）"""
+        return self.log_ids.allocate()
+    
+    # get_logs 可投影的字段（params/output 为大字段，未请求时不从数据库读取）
+    LOG_FIELDS = ('id', 'agent_name', 'message', 'timestamp', 'params', 'output', 'time_spent',
+                  'cpu_time', 'peak_memory', 'output_size', 'log_type')
+    
+    def get_logs(self, session, agent_name=None, limit=100, before=None, log_type=None, fields=None):
+        """获取日志（按时间倒序；before=(timestamp, id) 为游标，fields 为需要返回的字段）"""
+        fields = [f for f in (fields or self.LOG_FIELDS) if f in self.LOG_FIELDS]
+        columns = {'id', 'timestamp', *fields}
+        query = session.query(Log).options(load_only(*[getattr(Log, name) for name in columns]))
         
         if agent_name:
             query = query.filter(Log.agent_name == agent_name)
+        if log_type:
+            query = query.filter(Log.log_type == log_type)
+        if before is not None:
+            before_timestamp, before_id = before
+            query = query.filter(or_(
+                Log.timestamp < before_timestamp,
+                and_(Log.timestamp == before_timestamp, Log.id < before_id)
+            ))
+        
+        logs = query.order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit).all()
+        
+        result = []
+        for log in logs:
+            item = {name: getattr(log, name) for name in columns}
+            item['timestamp'] = log.timestamp.isoformat() if log.timestamp else None
+            result.append(item)
+        return result
+    
+    def get_log_rollups(self, session, period='hour', agent_name=None, since=None, until=None, limit=500):
+        """获取按小时/天汇总的日志统计"""
+        query = session.query(LogRollup).filter(LogRollup.period == period)
+        
+        if agent_name:
+            query = query.filter(LogRollup.agent_name == agent_name)
+        if since:
+            query = query.filter(LogRollup.bucket_start >= since)
+        if until:
+            query = query.filter(LogRollup.bucket_start < until)
         
-        logs = query.order_by(Log.timestamp.desc()).limit(limit).all()
+        rollups = query.order_by(LogRollup.bucket_start.desc(), LogRollup.agent_name).limit(limit).all()
         
         return [{
-            'id': log.id,
-            'agent_name': log.agent_name,
-            'message': log.message,
-            'timestamp': log.timestamp.isoformat() if log.timestamp else None,
-            'params': log.params,
-            'output': log.output,
-            'time_spent': log.time_spent,
-            'log_type': log.log_type
-        } for log in logs]
+            'period': r.period,
+            'bucket_start': r.bucket_start.isoformat(),
+            'agent_name': r.agent_name,
+            'count': r.count,
+            'error_count': r.error_count,
+            'success_rate': (r.count - r.error_count) / r.count * 100 if r.count else 0,
+            'time_sum': r.time_sum,
+            'avg_execution_time': r.time_sum / r.count if r.count else 0
+        } for r in rollups]
+    
+    def get_log_analytics(self, session, since, until, **options):
+        """按时间范围统计日志的耗时分位数、错误率和吞吐量序列（见 backend/analytics.py）"""
+        options.setdefault('chunk_size', Config.ANALYTICS_CHUNK_SIZE)
+        return analytics.log_analytics(session, since, until, **options)
     
     # ========================================================================
     # 密钥相关操作
     # ========================================================================
     
-    def add_secret_key(self, session, key_name, key_value):
-        """添加密钥"""
+    def set_secret_key(self, session, key_name, key_value):
+        """添加或更新密钥（明文，自动加密），并使密钥缓存失效"""
         key = session.query(SecretKey).filter_by(name=key_name).first()
         
         if key:
@@ -353,11 +905,43 @@ class Database:
             key = SecretKey(name=key_name)
             key.value = key_value
             session.add(key)
+        session.flush()
+        
+        if self.secret_cache is not None:
+            # 立即失效一次；事务提交或回滚后再失效一次，提交前读到旧值（或回滚前读到未提交的新值）
+            # 的读取方写回缓存的值不会保留到 TTL 过期
+            self.secret_cache.invalidate()
+            event.listen(session, 'after_commit', self.secret_cache.invalidate, once=True)
+            event.listen(session, 'after_soft_rollback', self.secret_cache.invalidate, once=True)
+    
+    # 兼容旧接口名
+    add_secret_key = set_secret_key
     
     def get_secret_key(self, session, key_name):
-        """获取密钥"""
+        """获取密钥（明文）；优先读取进程内缓存，未命中时查询并解密"""
+        if self.secret_cache is not None:
+            cached = self.secret_cache.get(key_name)
+            if not is_missing(cached):
+                return cached
+        return self._load_secret(session, key_name)
+    
+    def get_cached_secret(self, key_name):
+        """按名称读取密钥，缓存命中时不打开数据库会话"""
+        if self.secret_cache is not None:
+            cached = self.secret_cache.get(key_name)
+            if not is_missing(cached):
+                return cached
+        with self.session_scope() as session:
+            return self._load_secret(session, key_name)
+    
+    def _load_secret(self, session, key_name):
+        # 查询前记下版本号，期间有写入时不缓存读到的值
+        version = self.secret_cache.version if self.secret_cache is not None else None
         key = session.query(SecretKey).filter_by(name=key_name).first()
-        return key.value if key else None
+        value = key.value if key else None
+        if self.secret_cache is not None:
+            self.secret_cache.put(key_name, value, version)
+        return value
     
     def get_all_secret_keys(self, session):
         """获取所有密钥名称"""
@@ -390,9 +974,18 @@ class Database:
         if user:
             user.last_login = datetime.utcnow()
     
-    def get_all_users(self, session):
-        """获取所有用户"""
-        users = session.query(User).all()
+    def get_all_users(self, session, limit=None, after_id=None, role=None, is_active=None):
+        """获取所有用户（after_id/limit 为按 id 的游标分页）"""
+        query = session.query(User)
+        
+        if role:
+            query = query.filter(User.role == role)
+        if is_active is not None:
+            query = query.filter(User.is_active == is_active)
+        if after_id is not None:
+            query = query.filter(User.id > after_id)
+        
+        users = query.order_by(User.id).limit(limit).all()
         return [{
             'id': u.id,
             'username': u.username,
@@ -472,51 +1065,3 @@ class Database:
         session.query(ChatMessage).filter_by(session_id=session_id).delete()
         # 再删除会话
         session.query(ChatSession).filter_by(id=session_id).delete()
-    
-    # ========================================================================
-    # 密钥管理操作
-    # ========================================================================
-    
-    def set_secret_key(self, session, key_name, key_value):
-        """
-        设置密钥
-        
-        Args:
-            session: 数据库会话
-            key_name: 密钥名称
-            key_value: 密钥值（明文，会自动加密）
-        """
-        from .models import SecretKey
-        
-        # 查找是否已存在（注意模型中使用的是name字段）
-        secret = session.query(SecretKey).filter_by(name=key_name).first()
-        
-        if secret:
-            # 更新现有密钥（注意模型中使用的是value属性）
-            secret.value = key_value
-        else:
-            # 创建新密钥
-            secret = SecretKey(name=key_name)
-            secret.value = key_value
-            session.add(secret)
-        
-        session.flush()
-    
-    def get_secret_key(self, session, key_name):
-        """
-        获取密钥
-        
-        Args:
-            session: 数据库会话
-            key_name: 密钥名称
-            
-        Returns:
-            str: 密钥值（明文），如果不存在返回None
-        """
-        from .models import SecretKey
-        
-        secret = session.query(SecretKey).filter_by(name=key_name).first()
-        if secret:
-            return secret.value
-        return None
-
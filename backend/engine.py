@@ -4,10 +4,178 @@
 
 from typing import List, Dict, Any, Callable, Optional
 from datetime import datetime
+import hashlib
 import inspect
 import json
+import queue
+import threading
 import time
 import traceback
+import tracemalloc
+
+from backend.agent_stats import AgentStatsAggregator
+from backend.log_sink import LogSink
+from backend.blob_store import BlobStore
+from backend.batching import MicroBatcher
+
+# ============================================================================
+# Agent 调用计划
+# ============================================================================
+
+class AgentBindingError(TypeError):
+    """Agent 参数绑定失败（参数缺失或多余）"""
+    pass
+
+
+class AgentCallPlan:
+    """
+    Agent 调用计划 - 注册时根据入口函数签名预先计算参数绑定方式
+    
+    执行时只做字典查找，不再逐次调用 inspect；错误参数在提交线程池之前即被拦截。
+    遵循 input_data 约定：函数声明了 input_data 参数而调用方未显式提供时，
+    其余参数整体打包为 input_data 传入。
+    """
+    
+    def __init__(self, func: Callable, agent_name: str = None):
+        self.func = func
+        self.agent_name = agent_name or getattr(func, '__name__', 'agent')
+        self.positional_only = []
+        self.keyword_names = set()
+        self.required = []
+        self.defaults = {}
+        self.accepts_var_kwargs = False
+        
+        for param_name, param in inspect.signature(func).parameters.items():
+            if param.kind == inspect.Parameter.VAR_KEYWORD:
+                self.accepts_var_kwargs = True
+                continue
+            if param.kind == inspect.Parameter.VAR_POSITIONAL:
+                continue
+            if param.kind == inspect.Parameter.POSITIONAL_ONLY:
+                self.positional_only.append(param_name)
+            self.keyword_names.add(param_name)
+            if param.default is inspect.Parameter.empty:
+                self.required.append(param_name)
+            else:
+                self.defaults[param_name] = param.default
+        
+        self.uses_input_data = 'input_data' in self.keyword_names
+        self.input_data_required = 'input_data' in self.required
+    
+    def bind(self, params: Dict[str, Any]):
+        """将参数字典绑定为 (args, kwargs)，不匹配时抛出 AgentBindingError"""
+        kwargs = self._bind_kwargs(params)
+        args = [kwargs.pop(name) for name in self.positional_only if name in kwargs]
+        return args, kwargs
+    
+    def batch_item(self, params: Dict[str, Any]) -> Any:
+        """
+        绑定为批量入口的单个输入项
+        
+        入口函数只有一个参数时（如 input_data），输入项就是该参数的值；否则为参数字典。
+        """
+        kwargs = self._bind_kwargs(params)
+        if len(self.keyword_names) == 1:
+            name = next(iter(self.keyword_names))
+            return kwargs.get(name, self.defaults.get(name))
+        return kwargs
+    
+    def _bind_kwargs(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = {}
+        extra = {}
+        for key, value in params.items():
+            if key in self.keyword_names or self.accepts_var_kwargs:
+                kwargs[key] = value
+            else:
+                extra[key] = value
+        
+        if self.uses_input_data and 'input_data' not in kwargs and (extra or self.input_data_required):
+            kwargs['input_data'] = extra
+            extra = {}
+        
+        if extra:
+            raise AgentBindingError(
+                f"Agent '{self.agent_name}' 不接受参数: {', '.join(sorted(extra))}"
+                f"（可用参数: {', '.join(sorted(self.keyword_names)) or '无'}）"
+            )
+        
+        missing = [name for name in self.required if name not in kwargs]
+        if missing:
+            raise AgentBindingError(f"Agent '{self.agent_name}' 缺少必填参数: {', '.join(missing)}")
+        
+        return kwargs
+    
+    def call(self, params: Dict[str, Any]) -> Any:
+        """绑定参数并调用入口函数"""
+        args, kwargs = self.bind(params)
+        return self.func(*args, **kwargs)
+
+
+def load_agent_entry_point(code: str, agent_name: str, entry_point: str = None,
+                           batch_entry_point: str = None) -> Callable:
+    """
+    执行Agent代码并选出入口函数
+    
+    选择顺序：显式指定的 entry_point → 与Agent同名的函数 → 代码中唯一定义的函数
+    → 未被其他函数调用的第一个函数。导入的模块/函数不会被当作入口；
+    批量入口（metadata 中的 batch_entry_point，或另一个函数 f 对应的 f_batch）也不会。
+    """
+    filename = f'<agent:{agent_name}>'
+    exec_globals = {}
+    exec(compile(code, filename, 'exec'), exec_globals)
+    
+    if entry_point:
+        func = exec_globals.get(entry_point)
+        if not callable(func):
+            raise ValueError(f"代码中未找到入口函数 '{entry_point}'")
+        return func
+    
+    # 只考虑本段代码中定义的顶层函数（按定义顺序）
+    defined = [
+        obj for name, obj in exec_globals.items()
+        if inspect.isfunction(obj) and not name.startswith('_')
+        and obj.__code__.co_filename == filename
+    ]
+    defined.sort(key=lambda f: f.__code__.co_firstlineno)
+    
+    # 排除批量入口：f_batch 通常循环调用 f，不排除的话会被当作未被引用的“根”函数
+    names = {func.__name__ for func in defined}
+    singles = [
+        func for func in defined
+        if func.__name__ != batch_entry_point
+        and not (func.__name__.endswith('_batch') and func.__name__[:-len('_batch')] in names)
+    ]
+    defined = singles or defined
+    
+    for func in defined:
+        if func.__name__ == agent_name:
+            return func
+    
+    if len(defined) == 1:
+        return defined[0]
+    
+    # 多个函数时，优先选择没有被其他函数引用的“根”函数
+    for func in defined:
+        if not any(func.__name__ in other.__code__.co_names for other in defined if other is not func):
+            return func
+    
+    if defined:
+        return defined[-1]
+    
+    raise ValueError("代码中未找到可调用的函数")
+
+
+def find_batch_entry_point(func: Callable, batch_entry_point: str = None) -> Optional[Callable]:
+    """查找Agent的批量入口：显式指定的函数名，或约定的 `<入口函数名>_batch`"""
+    namespace = getattr(func, '__globals__', {})
+    batch_func = namespace.get(batch_entry_point or f'{func.__name__}_batch')
+    return batch_func if callable(batch_func) else None
+
+
+def agent_fingerprint(code: str) -> str:
+    """Agent代码指纹 - 新版本或原地升级都会改变代码，从而改变指纹"""
+    return hashlib.sha256((code or '').encode('utf-8')).hexdigest()
+
 
 # ============================================================================
 # Agent 注册系统
@@ -26,49 +194,34 @@ class AgentRegistry:
         try:
             print("[AgentRegistry] 开始从数据库加载Agents...")
             
+            # 一次查询取回所有 Agent 的活跃版本代码
             with self.db.session_scope() as session:
-                db_agents = self.db.get_all_agents(session)
+                db_agents = self.db.get_agent_definitions(session)
             
             loaded_count = 0
             for db_agent in db_agents:
                 agent_name = db_agent['name']
                 
                 try:
-                    # 获取Agent的详细信息（包含代码）
-                    with self.db.session_scope() as session:
-                        agent_detail = self.db.get_agent(session, agent_name)
-                    
-                    if not agent_detail or 'code' not in agent_detail:
+                    if not db_agent.get('code'):
                         print(f"  ⚠️  跳过Agent '{agent_name}': 缺少代码")
                         continue
                     
-                    # 执行代码以获取函数对象
-                    code = agent_detail['code']
-                    exec_globals = {}
-                    exec(code, exec_globals)
-                    
-                    # 查找定义的函数
-                    agent_func = None
-                    for name, obj in exec_globals.items():
-                        if callable(obj) and not name.startswith('_'):
-                            agent_func = obj
-                            break
-                    
-                    if not agent_func:
-                        print(f"  ⚠️  跳过Agent '{agent_name}': 代码中未找到函数")
+                    # 执行代码并选出入口函数，存储到内存
+                    try:
+                        self.agents[agent_name] = self.build_agent_entry(
+                            name=agent_name,
+                            code=db_agent['code'],
+                            agent_type=db_agent.get('agent_type', 'processor'),
+                            description=db_agent.get('description', ''),
+                            category=db_agent.get('category', '其他'),
+                            icon=db_agent.get('icon', 'default'),
+                            metadata=db_agent.get('metadata')
+                        )
+                    except ValueError as e:
+                        print(f"  ⚠️  跳过Agent '{agent_name}': {e}")
                         continue
                     
-                    # 存储到内存
-                    self.agents[agent_name] = {
-                        'name': agent_name,
-                        'agent_type': db_agent.get('agent_type', 'processor'),
-                        'description': db_agent.get('description', ''),
-                        'function': agent_func,
-                        'code': code,
-                        'category': db_agent.get('category', '其他'),
-                        'icon': db_agent.get('icon', 'default')
-                    }
-                    
                     loaded_count += 1
                     print(f"  ✓ 加载Agent: {agent_name}")
                     
@@ -95,9 +248,17 @@ class AgentRegistry:
         output_schema: Dict = None,
         prompt_template: str = None,
         category: str = "其他",
-        icon: str = "🤖"
+        icon: str = "🤖",
+        pure: bool = False,
+        batch_function: Callable = None
     ):
-        """Agent 注册装饰器"""
+        """
+        Agent 注册装饰器
+        
+        pure=True 表示同样的参数总是得到同样的输出且无副作用，
+        工作流保存/发布时可对其字面量参数节点做常量折叠。
+        batch_function 为可选的批量入口，接收输入列表并返回等长结果列表。
+        """
         def decorator(func: Callable):
             try:
                 code = inspect.getsource(func)
@@ -138,12 +299,16 @@ class AgentRegistry:
                     'tools': tools or [],
                     'description': description,
                     'code': code,
+                    'fingerprint': agent_fingerprint(code),
+                    'pure': pure,
                     'input_parameters': input_params,
                     'output_parameters': output_params,
                     'prompt_template': prompt_template,
                     'category': category,
                     'icon': icon,
-                    'function': func
+                    'function': func,
+                    'call_plan': AgentCallPlan(func, name),
+                    'batch_function': batch_function
                 }
                 
                 # 存储到内存和数据库
@@ -160,7 +325,8 @@ class AgentRegistry:
                             'description': description,
                             'category': category,
                             'icon': icon,
-                            'prompt_template': prompt_template
+                            'prompt_template': prompt_template,
+                            'pure': pure
                         },
                         dependencies=[],
                         triggers=[],
@@ -186,34 +352,23 @@ class AgentRegistry:
         agent_type: str = 'processor',
         description: str = '',
         category: str = '其他',
-        icon: str = '🤖'
+        icon: str = '🤖',
+        entry_point: str = None,
+        pure: bool = False,
+        batch_entry_point: str = None
     ):
         """直接注册一个Agent（用于从数据库或AI创建的Agent）"""
         try:
-            # 执行代码以获取函数对象
-            exec_globals = {}
-            exec(code, exec_globals)
-            
-            # 查找定义的函数
-            agent_func = None
-            for func_name, obj in exec_globals.items():
-                if callable(obj) and not func_name.startswith('_'):
-                    agent_func = obj
-                    break
-            
-            if not agent_func:
-                raise ValueError(f"代码中未找到可调用的函数")
-            
             # 存储到内存
-            self.agents[name] = {
-                'name': name,
-                'agent_type': agent_type,
-                'description': description,
-                'function': agent_func,
-                'code': code,
-                'category': category,
-                'icon': icon
-            }
+            self.agents[name] = self.build_agent_entry(
+                name=name,
+                code=code,
+                agent_type=agent_type,
+                description=description,
+                category=category,
+                icon=icon,
+                metadata={'entry_point': entry_point, 'pure': pure, 'batch_entry_point': batch_entry_point}
+            )
             
             print(f"✓ Agent '{name}' 注册到内存成功")
             return True
@@ -224,6 +379,33 @@ class AgentRegistry:
             traceback.print_exc()
             return False
     
+    def build_agent_entry(
+        self,
+        name: str,
+        code: str,
+        agent_type: str = 'processor',
+        description: str = '',
+        category: str = '其他',
+        icon: str = '🤖',
+        metadata: Dict = None
+    ) -> Dict:
+        """执行代码并构建内存中的Agent条目（不注册），供注册和灰度版本加载共用"""
+        metadata = metadata or {}
+        agent_func = load_agent_entry_point(code, name, metadata.get('entry_point'), metadata.get('batch_entry_point'))
+        return {
+            'name': name,
+            'agent_type': agent_type,
+            'description': description,
+            'function': agent_func,
+            'call_plan': AgentCallPlan(agent_func, name),
+            'batch_function': find_batch_entry_point(agent_func, metadata.get('batch_entry_point')),
+            'code': code,
+            'fingerprint': agent_fingerprint(code),
+            'pure': bool(metadata.get('pure')),
+            'category': category,
+            'icon': icon
+        }
+    
     def get_agent(self, name: str) -> Optional[Dict]:
         return self.agents.get(name)
     
@@ -290,6 +472,60 @@ class LLMService:
         }
         return prices.get(model, 0) * tokens
 
+# ============================================================================
+# Agent 资源统计
+# ============================================================================
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+# 只有由这里启动的 tracemalloc 才由这里停止（PYTHONTRACEMALLOC、调试器等已开启的不受影响）
+_tracemalloc_owned = False
+# tracemalloc.reset_peak 需要 Python 3.9+，更低版本不记录峰值内存
+_HAS_RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+
+def _run_with_resource_profile(func: Callable, args, kwargs, resources: Dict[str, Any]) -> Any:
+    """
+    在工作线程中执行函数，记录线程CPU时间和 tracemalloc 峰值分配
+    
+    tracemalloc 是进程级的：peak_memory 是该Agent执行期间整个进程的峰值分配（相对开始时），
+    多个Agent并发执行时包含其他Agent的分配。峰值只在没有其他Agent正在统计时重置，
+    不会清掉并发执行中的峰值。
+    """
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_owned = True
+            if _HAS_RESET_PEAK:
+                tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+        baseline, _ = tracemalloc.get_traced_memory()
+    
+    cpu_start = time.thread_time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        resources['cpu_time'] = time.thread_time() - cpu_start
+        with _tracemalloc_lock:
+            if _HAS_RESET_PEAK:
+                _, peak = tracemalloc.get_traced_memory()
+                resources['peak_memory'] = max(0, peak - baseline)
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and _tracemalloc_owned:
+                tracemalloc.stop()
+                _tracemalloc_owned = False
+
+
+def _payload_size(value: Any) -> int:
+    """结果序列化为JSON后的字节数"""
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+
 # ============================================================================
 # Agent 执行器
 # ============================================================================
@@ -297,10 +533,18 @@ class LLMService:
 class AgentExecutor:
     """Agent 执行引擎"""
     
-    def __init__(self, db, registry: AgentRegistry, llm_service=None):
+    def __init__(self, db, registry: AgentRegistry, llm_service=None, batcher: MicroBatcher = None,
+                 stats: AgentStatsAggregator = None, profile_resources: bool = False, canary=None,
+                 log_sink: LogSink = None, blob_store: BlobStore = None):
         self.db = db
         self.registry = registry
         self.llm_service = llm_service
+        self.batcher = batcher if batcher is not None else MicroBatcher()
+        self.stats = stats if stats is not None else AgentStatsAggregator(db)
+        self.profile_resources = profile_resources
+        self.canary = canary
+        self.log_sink = log_sink
+        self.blob_store = blob_store
         self.execution_stack = []
     
     def execute(
@@ -309,11 +553,16 @@ class AgentExecutor:
         params: Dict[str, Any],
         context: Dict[str, Any] = None,
         execution_id: int = None,
-        timeout: int = 300  # 默认超时300秒（5分钟），适应LLM生成长内容
+        timeout: int = 300,  # 默认超时300秒（5分钟），适应LLM生成长内容
+        profile: bool = None
     ) -> Dict[str, Any]:
-        """执行 Agent（带超时机制）"""
+        """执行 Agent（带超时机制）；profile 为 True 时额外记录CPU时间、峰值内存和输出大小"""
         start_time = time.time()
         parent_log_id = self.execution_stack[-1] if self.execution_stack else None
+        agent = None
+        variant = None
+        profile = self.profile_resources if profile is None else profile
+        resources = {} if profile else None
         
         try:
             print(f"[AgentExecutor] 开始执行 Agent: {agent_name} (超时: {timeout}秒)")
@@ -322,6 +571,10 @@ class AgentExecutor:
             if not agent:
                 raise Exception(f"Agent '{agent_name}' 不存在")
             
+            # 灰度发布中的 Agent 按权重选择稳定版或灰度版
+            if self.canary:
+                agent, variant = self.canary.route(agent_name, agent)
+            
             # 解析参数
             print(f"[AgentExecutor] 解析参数中...")
             resolved_params = self._resolve_params(params, context or {})
@@ -330,16 +583,29 @@ class AgentExecutor:
             # 使用线程池执行，带超时
             from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
             
+            is_ai_agent = agent['agent_type'] == 'ai_analyzer' and agent.get('llm_model')
+            call_plan = None if is_ai_agent else (agent.get('call_plan') or AgentCallPlan(agent['function'], agent_name))
+            
             with ThreadPoolExecutor(max_workers=1) as executor:
                 print(f"[AgentExecutor] 提交Agent执行任务...")
                 
                 # 如果是 AI Agent，调用 LLM
-                if agent['agent_type'] == 'ai_analyzer' and agent.get('llm_model'):
-                    future = executor.submit(self._execute_ai_agent, agent, resolved_params)
+                if is_ai_agent:
+                    func, args, kwargs = self._execute_ai_agent, (agent, resolved_params), {}
+                elif agent.get('batch_function') and self.batcher:
+                    # 提供批量入口的 Agent，与其他并发执行的同名调用合并（CPU/内存计入批处理线程，不单独统计）
+                    func = None
+                    future = self.batcher.submit(agent_name, agent['batch_function'], call_plan.batch_item(resolved_params))
                 else:
-                    # 普通 Agent，直接调用函数
-                    func = agent['function']
-                    future = executor.submit(func, **resolved_params)
+                    # 普通 Agent，按注册时预计算的调用计划绑定参数（提交前即校验）
+                    func = call_plan.func
+                    args, kwargs = call_plan.bind(resolved_params)
+                
+                if func is not None:
+                    if profile:
+                        future = executor.submit(_run_with_resource_profile, func, args, kwargs, resources)
+                    else:
+                        future = executor.submit(func, *args, **kwargs)
                 
                 try:
                     # 等待执行结果，带超时
@@ -351,16 +617,25 @@ class AgentExecutor:
                     future.cancel()
                     raise Exception(f"Agent执行超时（{timeout}秒）。可能原因：\n1. LLM响应太慢\n2. Agent代码有死循环\n3. 网络连接问题")
             
-            # 记录日志
+            # 记录统计和日志
             execution_time = time.time() - start_time
+            self.stats.record(agent_name, execution_time, True)
+            if variant:
+                self.canary.record(agent_name, variant, execution_time, True, result)
+            if profile:
+                resources['output_size'] = _payload_size(result)
+            # 大输出写入 Blob 存储，日志、执行图和上下文持久化时共用同一个引用
+            stored_output = self.externalize(result)
             log_id = self._add_log(
                 agent_name=agent_name,
                 message=f"执行成功",
                 log_type='info',
-                params=resolved_params,
-                output=result,
+                params=self._externalize_params(resolved_params),
+                output=stored_output,
                 time_spent=execution_time,
-                parent_log_id=parent_log_id
+                parent_log_id=parent_log_id,
+                resources=resources,
+                execution_id=execution_id
             )
             
             self.execution_stack.append(log_id)
@@ -370,21 +645,30 @@ class AgentExecutor:
             return {
                 'success': True,
                 'output': result,
+                'stored_output': stored_output,
                 'execution_time': execution_time,
-                'error': None
+                'error': None,
+                'resources': resources
             }
             
         except Exception as e:
             execution_time = time.time() - start_time
             error_msg = f"{type(e).__name__}: {str(e)}"
             
+            if agent is not None:
+                self.stats.record(agent_name, execution_time, False)
+            if variant:
+                self.canary.record(agent_name, variant, execution_time, False)
+            
             self._add_log(
                 agent_name=agent_name,
                 message=f"执行失败: {error_msg}",
                 log_type='error',
                 params=params,
                 time_spent=execution_time,
-                parent_log_id=parent_log_id
+                parent_log_id=parent_log_id,
+                resources=resources,
+                execution_id=execution_id
             )
             
             print(f"[AgentExecutor] Agent '{agent_name}' 执行失败: {error_msg}")
@@ -394,9 +678,19 @@ class AgentExecutor:
                 'success': False,
                 'output': None,
                 'execution_time': execution_time,
-                'error': error_msg
+                'error': error_msg,
+                'resources': resources
             }
     
+    def externalize(self, value: Any) -> Any:
+        """未配置 Blob 存储时原样返回"""
+        return self.blob_store.externalize(value) if self.blob_store else value
+    
+    def _externalize_params(self, params: Dict) -> Dict:
+        if not self.blob_store or not isinstance(params, dict):
+            return params
+        return {key: self.blob_store.externalize(value) for key, value in params.items()}
+    
     def _execute_ai_agent(self, agent: Dict, params: Dict) -> Any:
         """执行 AI Agent"""
         if not self.llm_service:
@@ -441,9 +735,27 @@ class AgentExecutor:
         params: Dict = None,
         output: Any = None,
         time_spent: float = None,
-        parent_log_id: int = None
+        parent_log_id: int = None,
+        resources: Dict[str, Any] = None,
+        execution_id: int = None
     ) -> int:
-        """添加日志"""
+        """添加日志（配置了 log_sink 时异步批量写入，id 预分配后立即返回）"""
+        resources = resources or {}
+        if self.log_sink is not None:
+            return self.log_sink.add_log(
+                agent_name=agent_name,
+                message=message,
+                log_type=log_type,
+                params=params,
+                output=output,
+                time_spent=time_spent,
+                parent_log_id=parent_log_id,
+                cpu_time=resources.get('cpu_time'),
+                peak_memory=resources.get('peak_memory'),
+                output_size=resources.get('output_size'),
+                workflow_execution_id=execution_id
+            )
+        
         with self.db.session_scope() as session:
             log_id = self.db.add_log(
                 session=session,
@@ -454,7 +766,11 @@ class AgentExecutor:
                 output=output,
                 time_spent=time_spent,
                 parent_log_id=parent_log_id,
-                log_type=log_type
+                log_type=log_type,
+                cpu_time=resources.get('cpu_time'),
+                peak_memory=resources.get('peak_memory'),
+                output_size=resources.get('output_size'),
+                workflow_execution_id=execution_id
             )
             return log_id
 
@@ -465,9 +781,15 @@ class AgentExecutor:
 class WorkflowEngine:
     """工作流编排引擎"""
     
-    def __init__(self, db, agent_executor: AgentExecutor):
+    def __init__(self, db, agent_executor: AgentExecutor, fold_timeout: float = 5.0):
         self.db = db
         self.executor = agent_executor
+        # 常量折叠在后台线程中执行，不阻塞保存/发布请求；同一工作流排队中时不重复入队
+        self.fold_timeout = fold_timeout
+        self._fold_queue: 'queue.Queue' = queue.Queue()
+        self._fold_pending = set()
+        self._fold_lock = threading.Lock()
+        self._fold_thread = None
     
     def _extract_json_path(self, json_path: str, context: Dict, input_data: Dict) -> Any:
         """
@@ -539,7 +861,15 @@ class WorkflowEngine:
         workflow_id: int,
         input_data: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """执行工作流"""
+        """执行工作流（整个执行复用同一个 Session；节点调用耗时长，提交后即归还连接）"""
+        with self.db.unit_of_work(hold_connection=False):
+            return self._execute_workflow(workflow_id, input_data)
+    
+    def _execute_workflow(
+        self,
+        workflow_id: int,
+        input_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
         start_time = time.time()
         
         try:
@@ -549,6 +879,7 @@ class WorkflowEngine:
             
             with self.db.session_scope() as session:
                 workflow = self.db.get_workflow(session, workflow_id)
+                folded_outputs = self.db.get_folded_outputs(session, workflow_id) if workflow else {}
             
             if not workflow:
                 raise Exception(f"工作流 #{workflow_id} 不存在")
@@ -577,7 +908,10 @@ class WorkflowEngine:
             
             # 执行 Agent 链
             context = input_data.copy()
+            # 持久化用的上下文：大输出替换为 Blob 引用
+            stored_context = input_data.copy()
             execution_graph = []
+            profile_workflow = bool(workflow_def.get('profile'))
             
             for i, node in enumerate(execution_order, 1):
                 agent_name = node['agent']
@@ -614,26 +948,39 @@ class WorkflowEngine:
                     print(f"  使用上一个Agent输出")
                 
                 node_start = time.time()
-                result = self.executor.execute(
-                    agent_name=agent_name,
-                    params=params,
-                    context=context,
-                    execution_id=execution_id
-                )
+                folded = self._lookup_folded_output(node, folded_outputs)
+                if folded is not None:
+                    # 常量折叠命中：直接注入保存/发布时预先计算的输出
+                    print(f"  ⚡ 使用常量折叠结果")
+                    result = {'success': True, 'output': folded, 'execution_time': 0.0, 'error': None,
+                              'stored_output': self.executor.externalize(folded)}
+                else:
+                    result = self.executor.execute(
+                        agent_name=agent_name,
+                        params=params,
+                        context=context,
+                        execution_id=execution_id,
+                        profile=True if (profile_workflow or node.get('profile')) else None
+                    )
                 node_time = time.time() - node_start
                 
-                execution_graph.append({
+                graph_entry = {
                     'agent': agent_name,
                     'status': 'completed' if result['success'] else 'failed',
                     'execution_time': node_time,
-                    'output': result['output'],
-                    'error': result.get('error')
-                })
+                    'output': result.get('stored_output', result['output']),
+                    'error': result.get('error'),
+                    'folded': folded is not None
+                }
+                if result.get('resources'):
+                    graph_entry['resources'] = result['resources']
+                execution_graph.append(graph_entry)
                 
                 if not result['success']:
                     raise Exception(f"Agent '{agent_name}' 执行失败: {result['error']}")
                 
                 context[f"{agent_name}_result"] = result['output']
+                stored_context[f"{agent_name}_result"] = result.get('stored_output', result['output'])
                 
                 print(f"  ✓ 完成，耗时: {node_time:.2f}s\n")
             
@@ -645,7 +992,7 @@ class WorkflowEngine:
                     session=session,
                     execution_id=execution_id,
                     status='completed',
-                    output_data=context,
+                    output_data=stored_context,
                     completed_at=datetime.utcnow(),
                     execution_time=execution_time,
                     execution_graph=execution_graph
@@ -694,6 +1041,130 @@ class WorkflowEngine:
                 'error': error_msg
             }
     
+    # ========================================================================
+    # 常量折叠
+    # ========================================================================
+    
+    def _static_node_params(self, node: Dict) -> Optional[Dict]:
+        """节点只含字面量参数时返回参数，否则返回 None"""
+        params = node.get('params') or {}
+        if not params or node.get('input_mapping'):
+            return None
+        for value in params.values():
+            if isinstance(value, str) and value.startswith('$'):
+                return None
+        return params
+    
+    def _params_hash(self, params: Dict) -> Optional[str]:
+        try:
+            payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _lookup_folded_output(self, node: Dict, folded_outputs: Dict) -> Any:
+        """查找节点的常量折叠结果；Agent代码或参数变化后自动失效"""
+        if not folded_outputs:
+            return None
+        params = self._static_node_params(node)
+        if params is None:
+            return None
+        agent = self.executor.registry.get_agent(node['agent'])
+        if not agent or not agent.get('pure'):
+            return None
+        entry = folded_outputs.get((node['agent'], self._params_hash(params)))
+        if not entry or entry['agent_fingerprint'] != agent.get('fingerprint'):
+            return None
+        return entry['output']
+    
+    def schedule_fold_constants(self, workflow_id: int):
+        """把工作流的常量折叠放入后台队列（保存/发布请求不等待求值完成）"""
+        with self._fold_lock:
+            if workflow_id in self._fold_pending:
+                return
+            self._fold_pending.add(workflow_id)
+            if self._fold_thread is None:
+                self._fold_thread = threading.Thread(target=self._fold_worker, name='constant-fold', daemon=True)
+                self._fold_thread.start()
+        self._fold_queue.put(workflow_id)
+    
+    def _fold_worker(self):
+        while True:
+            workflow_id = self._fold_queue.get()
+            # 先移出待处理集合：折叠期间再次保存会重新入队，按最新定义再折叠一次
+            with self._fold_lock:
+                self._fold_pending.discard(workflow_id)
+            try:
+                self.fold_constants(workflow_id)
+            except Exception as e:
+                print(f"[常量折叠] ⚠️ 工作流 #{workflow_id} 折叠失败: {e}")
+    
+    def _evaluate_pure_node(self, agent_name: str, agent: Dict, params: Dict) -> Any:
+        """直接调用稳定版入口函数求值：不写执行日志、不计入统计、不经过灰度路由，超时即放弃"""
+        call_plan = agent.get('call_plan') or AgentCallPlan(agent['function'], agent_name)
+        outcome = {}
+        
+        def _run():
+            try:
+                outcome['output'] = call_plan.call(params)
+            except Exception as e:
+                outcome['error'] = e
+        
+        worker = threading.Thread(target=_run, name=f'constant-fold-{agent_name}', daemon=True)
+        worker.start()
+        worker.join(self.fold_timeout)
+        if worker.is_alive():
+            raise TimeoutError(f"求值超过 {self.fold_timeout} 秒")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['output']
+    
+    def fold_constants(self, workflow_id: int) -> int:
+        """
+        常量折叠：对“纯函数Agent + 字面量参数”的节点预先求值（保存/发布后由后台线程调用）
+        
+        Returns:
+            int: 折叠的节点数
+        """
+        with self.db.session_scope() as session:
+            workflow = self.db.get_workflow(session, workflow_id)
+        if not workflow:
+            return 0
+        
+        workflow_def = json.loads(workflow['workflow_definition']) if isinstance(workflow['workflow_definition'], str) else workflow['workflow_definition']
+        
+        entries = {}
+        for node in self._parse_workflow(workflow_def):
+            params = self._static_node_params(node)
+            agent = self.executor.registry.get_agent(node['agent'])
+            if params is None or not agent or not agent.get('pure') or not agent.get('function'):
+                continue
+            
+            params_hash = self._params_hash(params)
+            if params_hash is None or (node['agent'], params_hash) in entries:
+                continue
+            
+            try:
+                output = self._evaluate_pure_node(node['agent'], agent, params)
+                json.dumps(output)
+            except Exception as e:
+                print(f"[常量折叠] 跳过节点 {node['agent']}: {type(e).__name__}: {e}")
+                continue
+            
+            entries[(node['agent'], params_hash)] = {
+                'agent_name': node['agent'],
+                'params_hash': params_hash,
+                'agent_fingerprint': agent['fingerprint'],
+                'output': output
+            }
+        
+        with self.db.session_scope() as session:
+            self.db.replace_folded_outputs(session, workflow_id, list(entries.values()))
+        
+        if entries:
+            print(f"[WorkflowEngine] 工作流 #{workflow_id} 常量折叠 {len(entries)} 个节点")
+        return len(entries)
+    
     def _parse_workflow(self, workflow_def: Dict) -> List[Dict]:
         """解析工作流，支持两种格式"""
         
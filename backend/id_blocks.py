@@ -0,0 +1,64 @@
+# ============================================================================
+# 后端层 - ID 号段分配 (Backend - ID Blocks)
+# ============================================================================
+# 需要在写库前就确定 id 的场景（异步批量写入的日志，父子日志关联不等待写库）
+# 从 id_sequences 表按号段预留 id：每次原子地把 next_value 推进 block_size，
+# 本进程在内存中依次分配这一段。多个进程、多个 Database 实例各自预留互不重叠的号段，
+# 同一张表的所有写入方都必须经由分配器取 id（不能再依赖数据库自增）。
+# 进程重启后未用完的号段作废，id 会有空洞但不会重复。
+# ============================================================================
+
+from typing import Tuple
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+import threading
+
+from backend.models import IdSequence
+
+
+_table = IdSequence.__table__
+
+
+class IdBlockAllocator:
+    """按号段预留并分配 id（线程安全）"""
+
+    def __init__(self, engine, name: str, id_column, id_engine=None, block_size: int = 1000):
+        # engine：id_sequences 所在的库；id_engine：目标表所在的库（首次初始化时读取最大 id）
+        self.engine = engine
+        self.name = name
+        self.id_column = id_column
+        self.id_engine = id_engine or engine
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self) -> Tuple[int, int]:
+        """原子地预留 [start, end)；序列行不存在时从目标表当前最大 id 之后开始"""
+        # 使用独立连接和短事务，不加入调用方（请求工作单元）的事务，号段行的写锁立即释放
+        while True:
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    _table.update().where(_table.c.name == self.name)
+                    .values(next_value=_table.c.next_value + self.block_size)
+                )
+                if result.rowcount:
+                    end = conn.execute(select(_table.c.next_value).where(_table.c.name == self.name)).scalar()
+                    return end - self.block_size, end
+            with self.id_engine.connect() as conn:
+                start = (conn.execute(select(func.max(self.id_column))).scalar() or 0) + 1
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(_table.insert(), {'name': self.name, 'next_value': start + self.block_size})
+                return start, start + self.block_size
+            except IntegrityError:
+                # 其他进程同时完成了初始化，重新走预留
+                continue
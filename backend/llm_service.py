@@ -5,9 +5,65 @@
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, List, Any, Optional, Generator
+import threading
 import time
 
+from backend.config import Config
+
+
+def _create_http_adapter() -> HTTPAdapter:
+    """创建共享的连接池适配器：keep-alive 连接在请求间复用，省去每次 TCP/TLS 握手。
+    连接失败（请求尚未发出）以及 429/503（服务端未处理请求）按退避重试，遵循 Retry-After；
+    502/504 时 POST 可能已被处理，不重试以免重复生成和计费。
+    重试耗尽时返回最后一次响应，由调用方按状态码处理"""
+    retry = Retry(
+        total=Config.LLM_HTTP_RETRIES,
+        connect=Config.LLM_HTTP_RETRIES,
+        read=0,
+        status=Config.LLM_HTTP_RETRIES,
+        status_forcelist=(429, 503),
+        allowed_methods=frozenset(['GET', 'POST']),
+        backoff_factor=Config.LLM_HTTP_RETRY_BACKOFF,
+        raise_on_status=False
+    )
+    return HTTPAdapter(
+        pool_connections=Config.LLM_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=Config.LLM_HTTP_POOL_MAXSIZE,
+        max_retries=retry
+    )
+
+
+def _stream_content(response) -> Generator[str, None, None]:
+    """逐段产出 SSE 流中的增量文本。读到 [DONE] 后继续读完响应体，
+    连接才能放回连接池复用；调用方中途放弃时关闭响应"""
+    try:
+        done = False
+        for line in response.iter_lines():
+            if done or not line:
+                continue
+            line_str = line.decode('utf-8')
+            if not line_str.startswith('data: '):
+                continue
+            data_str = line_str[6:]
+            if data_str == '[DONE]':
+                done = True
+                continue
+            try:
+                data = json.loads(data_str)
+                if 'choices' in data and len(data['choices']) > 0:
+                    delta = data['choices'][0].get('delta', {})
+                    content = delta.get('content', '')
+                    if content:
+                        yield content
+            except json.JSONDecodeError:
+                continue
+    finally:
+        response.close()
+
+
 class DeepSeekLLM:
     """DeepSeek LLM 服务"""
     
@@ -23,6 +79,11 @@ class DeepSeekLLM:
         self.base_url = base_url
         self.model = "deepseek-chat"  # 默认使用deepseek-chat模型
         self._db = None
+        # requests.Session 不保证线程安全：每个线程使用自己的 Session，
+        # 所有 Session 挂载同一个适配器，共享连接池
+        self._adapter = None
+        self._adapter_lock = threading.Lock()
+        self._local = threading.local()
         
     def set_database(self, db):
         """设置数据库实例"""
@@ -33,11 +94,10 @@ class DeepSeekLLM:
         """获取API Key（优先从数据库读取）"""
         if self._db:
             try:
-                from backend.database import Database
-                with self._db.session_scope() as session:
-                    key = self._db.get_secret_key(session, 'deepseek_api_key')
-                    if key:
-                        return key
+                # 进程内缓存，命中时不查询数据库也不解密
+                key = self._db.get_cached_secret('deepseek_api_key')
+                if key:
+                    return key
             except:
                 pass
         return self._api_key
@@ -63,6 +123,19 @@ class DeepSeekLLM:
         """检查是否已配置API Key"""
         return bool(self.api_key)
     
+    def _http(self) -> requests.Session:
+        """当前线程的 HTTP Session（长期复用，连接池由所有线程共享）"""
+        http = getattr(self._local, 'session', None)
+        if http is None:
+            with self._adapter_lock:
+                if self._adapter is None:
+                    self._adapter = _create_http_adapter()
+            http = requests.Session()
+            http.mount('https://', self._adapter)
+            http.mount('http://', self._adapter)
+            self._local.session = http
+        return http
+    
     def chat(
         self,
         messages: List[Dict[str, str]],
@@ -124,7 +197,7 @@ class DeepSeekLLM:
             
             # 增加超时时间到60秒，并添加连接超时设置
             # 关键：如果是流式请求，requests也要设置stream=True
-            response = requests.post(
+            response = self._http().post(
                 f'{self.base_url}/chat/completions',
                 headers=headers,
                 json=data,
@@ -138,26 +211,9 @@ class DeepSeekLLM:
             if response.status_code == 200:
                 # 流式输出
                 if stream:
-                    def generate():
-                        for line in response.iter_lines():
-                            if line:
-                                line_str = line.decode('utf-8')
-                                if line_str.startswith('data: '):
-                                    data_str = line_str[6:]
-                                    if data_str == '[DONE]':
-                                        break
-                                    try:
-                                        data = json.loads(data_str)
-                                        if 'choices' in data and len(data['choices']) > 0:
-                                            delta = data['choices'][0].get('delta', {})
-                                            content = delta.get('content', '')
-                                            if content:
-                                                yield content
-                                    except json.JSONDecodeError:
-                                        continue
                     return {
                         'success': True,
-                        'stream': generate(),
+                        'stream': _stream_content(response),
                         'is_stream': True
                     }
                 else:
@@ -180,21 +236,26 @@ class DeepSeekLLM:
                     
                     return response_data
             elif response.status_code == 401:
+                # 错误响应也要关闭（流式请求不会自动读完响应体），连接才能放回连接池
+                response.close()
                 return {
                     'success': False,
                     'error': 'API Key 无效或已过期，请重新配置',
                     'error_type': 'auth_error'
                 }
             elif response.status_code == 429:
+                response.close()
                 return {
                     'success': False,
                     'error': 'API 请求频率过高，请稍后再试',
                     'error_type': 'rate_limit'
                 }
             else:
+                error = f'API请求失败: {response.status_code} - {response.text}'
+                response.close()
                 return {
                     'success': False,
-                    'error': f'API请求失败: {response.status_code} - {response.text}',
+                    'error': error,
                     'error_type': 'api_error'
                 }
                 
@@ -250,7 +311,7 @@ class DeepSeekLLM:
                 'stream': True
             }
             
-            response = requests.post(
+            response = self._http().post(
                 f'{self.base_url}/chat/completions',
                 headers=headers,
                 json=data,
@@ -259,23 +320,9 @@ class DeepSeekLLM:
             )
             
             if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            line = line[6:]
-                            if line == '[DONE]':
-                                break
-                            try:
-                                chunk = json.loads(line)
-                                if 'choices' in chunk and len(chunk['choices']) > 0:
-                                    delta = chunk['choices'][0].get('delta', {})
-                                    content = delta.get('content', '')
-                                    if content:
-                                        yield content
-                            except json.JSONDecodeError:
-                                continue
+                yield from _stream_content(response)
             else:
+                response.close()
                 yield json.dumps({
                     'success': False,
                     'error': f'API请求失败: {response.status_code}'
@@ -0,0 +1,232 @@
+# ============================================================================
+# 后端层 - 日志保留与汇总 (Backend - Log Retention)
+# ============================================================================
+# 后台压缩线程定期执行：
+#   1. 把已经结束的小时内的原始日志按 Agent 聚合进 log_rollups（period='hour'），
+#      再把已结束的天从小时汇总聚合为 period='day'；
+#   2. 按 log_type 配置的保留天数分批删除过期原始日志，只删除已经汇总过的时间段
+#      （配置了冷归档时先写入归档，执行日志写入所属工作流的归档目录）；
+#   3. 删除超过保留期的小时汇总（天汇总永久保留）。
+# ============================================================================
+
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import threading
+
+from backend.models import Log, LogRollup
+
+
+# 汇总只处理至少结束这么久的小时，给异步日志写入留出余量
+_ROLLUP_GRACE = timedelta(minutes=5)
+
+
+def parse_retention(spec: str) -> Dict[str, int]:
+    """解析 'info:7,error:30' 形式的按 log_type 保留天数配置"""
+    retention = {}
+    for part in (spec or '').split(','):
+        if ':' not in part:
+            continue
+        log_type, days = part.split(':', 1)
+        try:
+            retention[log_type.strip()] = int(days)
+        except ValueError:
+            print(f"[LogRetention] ⚠️ 忽略无效的保留配置: {part}")
+    return retention
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class LogCompactor:
+    """日志汇总与过期清理"""
+
+    def __init__(self, db, retention: Dict[str, int] = None, default_days: int = 30,
+                 hourly_rollup_days: int = 90, interval: float = 3600.0, chunk_size: int = 1000,
+                 archive=None):
+        self.db = db
+        self.retention = retention or {}
+        self.default_days = default_days
+        self.hourly_rollup_days = hourly_rollup_days
+        self.interval = interval
+        self.chunk_size = max(1, chunk_size)
+        # 配置冷归档时，过期日志删除前先追加到归档分段
+        self.archive = archive
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+
+    def start(self):
+        """启动后台压缩线程"""
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='log-compactor', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_once(self, now: datetime = None) -> Dict[str, int]:
+        """执行一轮汇总和清理，返回各步骤处理的行数"""
+        now = now or datetime.utcnow()
+        with self._run_lock:
+            hours, rolled_until = self.rollup_hours(now)
+            days = self.rollup_days(rolled_until)
+            deleted = self.delete_expired(now, rolled_until)
+            pruned = self.prune_hourly_rollups(now)
+
+        if hours or days or deleted or pruned:
+            print(f"[LogRetention] 汇总 {hours} 个小时桶 / {days} 个天桶，删除过期日志 {deleted} 条，清理小时汇总 {pruned} 条")
+        return {'hour_buckets': hours, 'day_buckets': days, 'deleted_logs': deleted, 'pruned_rollups': pruned}
+
+    # ------------------------------------------------------------------
+    # 汇总
+    # ------------------------------------------------------------------
+
+    def _watermark(self, session, period: str, step: timedelta) -> Optional[datetime]:
+        last = session.query(func.max(LogRollup.bucket_start)).filter(LogRollup.period == period).scalar()
+        return last + step if last else None
+
+    def rollup_hours(self, now: datetime) -> Tuple[int, Optional[datetime]]:
+        """把 [上次汇总的下一个小时, 当前已结束的小时) 内的原始日志聚合为小时汇总"""
+        end = _floor_hour(now - _ROLLUP_GRACE)
+        with self.db.session_scope() as session:
+            start = self._watermark(session, 'hour', timedelta(hours=1))
+            if start is None:
+                first = session.query(func.min(Log.timestamp)).scalar()
+                if first is None:
+                    return 0, end
+                start = _floor_hour(first)
+            if start >= end:
+                return 0, end
+
+            buckets: Dict[Tuple[datetime, str], list] = {}
+            rows = session.query(Log.agent_name, Log.timestamp, Log.log_type, Log.time_spent)\
+                .filter(Log.timestamp >= start, Log.timestamp < end)\
+                .yield_per(5000)
+            for agent_name, timestamp, log_type, time_spent in rows:
+                bucket = buckets.setdefault((_floor_hour(timestamp), agent_name), [0, 0, 0.0])
+                bucket[0] += 1
+                if log_type == 'error':
+                    bucket[1] += 1
+                bucket[2] += time_spent or 0.0
+
+            self._replace_rollups(session, 'hour', start, end, buckets)
+        return len(buckets), end
+
+    def rollup_days(self, until: datetime) -> int:
+        """把已完整汇总到小时的天聚合为天汇总"""
+        end = _floor_day(until)
+        with self.db.session_scope() as session:
+            start = self._watermark(session, 'day', timedelta(days=1))
+            if start is None:
+                first = session.query(func.min(LogRollup.bucket_start)).filter(LogRollup.period == 'hour').scalar()
+                if first is None:
+                    return 0
+                start = _floor_day(first)
+            if start >= end:
+                return 0
+
+            buckets: Dict[Tuple[datetime, str], list] = {}
+            rows = session.query(LogRollup).filter(
+                LogRollup.period == 'hour',
+                LogRollup.bucket_start >= start,
+                LogRollup.bucket_start < end
+            ).all()
+            for row in rows:
+                bucket = buckets.setdefault((_floor_day(row.bucket_start), row.agent_name), [0, 0, 0.0])
+                bucket[0] += row.count or 0
+                bucket[1] += row.error_count or 0
+                bucket[2] += row.time_sum or 0.0
+
+            self._replace_rollups(session, 'day', start, end, buckets)
+        return len(buckets)
+
+    def _replace_rollups(self, session, period, start, end, buckets):
+        # 先删后插保证重复执行幂等
+        session.query(LogRollup).filter(
+            LogRollup.period == period,
+            LogRollup.bucket_start >= start,
+            LogRollup.bucket_start < end
+        ).delete(synchronize_session=False)
+        if buckets:
+            session.execute(LogRollup.__table__.insert(), [
+                {
+                    'period': period,
+                    'bucket_start': bucket_start,
+                    'agent_name': agent_name,
+                    'count': count,
+                    'error_count': error_count,
+                    'time_sum': time_sum
+                } for (bucket_start, agent_name), (count, error_count, time_sum) in buckets.items()
+            ])
+
+    # ------------------------------------------------------------------
+    # 清理
+    # ------------------------------------------------------------------
+
+    def delete_expired(self, now: datetime, rolled_until: Optional[datetime]) -> int:
+        """按 log_type 分批删除过期日志；保留天数 <= 0 表示永久保留"""
+        if rolled_until is None:
+            return 0
+
+        with self.db.session_scope() as session:
+            log_types = [row[0] for row in session.query(Log.log_type).distinct()]
+
+        deleted = 0
+        for log_type in log_types:
+            days = self.retention.get(log_type, self.default_days)
+            if days <= 0:
+                continue
+            # 未汇总的日志即使过期也先保留，避免汇总数据缺失
+            cutoff = min(now - timedelta(days=days), rolled_until)
+            deleted += self._delete_chunks(Log.log_type == log_type, Log.timestamp < cutoff)
+        return deleted
+
+    def _delete_chunks(self, *criteria) -> int:
+        deleted = 0
+        while not self._stop.is_set():
+            with self.db.session_scope() as session:
+                ids = [row[0] for row in session.query(Log.id).filter(*criteria).limit(self.chunk_size)]
+                if not ids:
+                    break
+                if self.archive is not None:
+                    self.archive.archive_logs(session, ids)
+                # 解除其他日志对待删日志的引用（子日志可能属于保留期更长的 log_type）
+                session.query(Log).filter(Log.parent_log_id.in_(ids))\
+                    .update({Log.parent_log_id: None}, synchronize_session=False)
+                session.query(Log).filter(Log.triggered_by_log_id.in_(ids))\
+                    .update({Log.triggered_by_log_id: None}, synchronize_session=False)
+                session.query(Log).filter(Log.id.in_(ids)).delete(synchronize_session=False)
+            deleted += len(ids)
+            if len(ids) < self.chunk_size:
+                break
+        return deleted
+
+    def prune_hourly_rollups(self, now: datetime) -> int:
+        """删除超过保留期、且已聚合进天汇总的小时汇总"""
+        if self.hourly_rollup_days <= 0:
+            return 0
+        with self.db.session_scope() as session:
+            day_until = self._watermark(session, 'day', timedelta(days=1))
+            if day_until is None:
+                return 0
+            cutoff = min(now - timedelta(days=self.hourly_rollup_days), day_until)
+            return session.query(LogRollup).filter(
+                LogRollup.period == 'hour',
+                LogRollup.bucket_start < cutoff
+            ).delete(synchronize_session=False)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[LogRetention] ⚠️ 日志压缩失败: {e}")
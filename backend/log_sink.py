@@ -0,0 +1,152 @@
+# ============================================================================
+# 后端层 - 异步批量日志写入 (Backend - Log Sink)
+# ============================================================================
+# 节点日志先进入有界队列，由后台线程每攒够 batch_size 条或每隔
+# flush_interval_ms 毫秒以一次批量 INSERT 写入 logs 表，避免每次节点调用
+# 都单独开事务提交。日志 id 在入队时从 id_sequences 预留的号段中分配
+# （见 backend/id_blocks.py，多进程不冲突），父子日志关联不依赖写库。
+# ============================================================================
+
+from typing import Any, Dict, List
+from datetime import datetime
+import threading
+import queue
+import time
+
+from backend.models import Log
+
+
+_STOP = object()
+
+
+class LogSink:
+    """后台批量日志写入器（进程内，线程安全）"""
+
+    def __init__(self, db, batch_size: int = 200, flush_interval_ms: float = 200.0, max_queue: int = 10000):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000.0
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread = None
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker_loop, name='log-sink', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """停止后台线程，队列中剩余的日志全部写入数据库"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout=10)
+            self._thread = None
+        # 线程未启动或未能及时退出时，剩余日志在当前线程写入
+        self._write(self._drain())
+
+    def flush(self):
+        """阻塞直到当前已入队的日志全部写入（后台线程未启动时直接同步写入）"""
+        if self._thread is None:
+            self._write(self._drain())
+        else:
+            self._queue.join()
+
+    def allocate_id(self) -> int:
+        """预分配日志 id"""
+        return self.db.allocate_log_id()
+
+    def add_log(self, agent_name: str, message: str, log_type: str = 'info', params: Any = None,
+                output: Any = None, time_spent: float = None, parent_log_id: int = None,
+                triggered_by_log_id: int = None, cpu_time: float = None, peak_memory: int = None,
+                output_size: int = None, workflow_execution_id: int = None) -> int:
+        """日志入队并立即返回预分配的 id"""
+        record = {
+            'id': self.allocate_id(),
+            'workflow_execution_id': workflow_execution_id,
+            'agent_name': agent_name,
+            'message': message,
+            'timestamp': datetime.utcnow(),
+            'params': params,
+            'output': output,
+            'time_spent': time_spent,
+            'cpu_time': cpu_time,
+            'peak_memory': peak_memory,
+            'output_size': output_size,
+            'parent_log_id': parent_log_id,
+            'triggered_by_log_id': triggered_by_log_id,
+            'log_type': log_type
+        }
+
+        try:
+            self._queue.put(record, timeout=1.0)
+        except queue.Full:
+            # 队列持续满载说明写库跟不上，退化为调用方线程同步写入（反压）
+            print(f"[LogSink] ⚠️ 日志队列已满，同步写入")
+            self._write([record])
+        return record['id']
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        records = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return records
+            self._queue.task_done()
+            if item is not _STOP:
+                records.append(item)
+
+    def _worker_loop(self):
+        """攒批：拿到第一条日志后最多再等待 flush_interval 秒或凑满 batch_size"""
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                self._queue.task_done()
+                return
+
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stopping:
+                return
+
+    def _write(self, records: List[Dict[str, Any]]):
+        """一次 executemany 批量写入；失败时逐条重试，只丢弃本身无法写入的日志"""
+        if not records:
+            return
+
+        table = Log.__table__
+        try:
+            with self.db.session_scope() as session:
+                session.execute(table.insert(), records)
+            return
+        except Exception as e:
+            print(f"[LogSink] ⚠️ 批量写入 {len(records)} 条日志失败，改为逐条写入: {e}")
+
+        for record in records:
+            try:
+                with self.db.session_scope() as session:
+                    session.execute(table.insert(), [record])
+            except Exception as e:
+                print(f"[LogSink] ❌ 日志 #{record['id']} ({record['agent_name']}) 写入失败: {e}")
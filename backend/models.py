@@ -2,15 +2,16 @@
 # 后端层 - 数据模型 (Backend - Models)
 # ============================================================================
 
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Boolean, Table, Float, LargeBinary, Text
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Boolean, Table, Float, LargeBinary, Text, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from cryptography.fernet import Fernet
 from cryptography.fernet import InvalidToken
 from sqlalchemy.ext.hybrid import hybrid_property
 import os
 import json
 from datetime import datetime
+from backend.compression import CompressedJSON
 
 Base = declarative_base()
 
@@ -49,6 +50,10 @@ agent_version_tools = Table('agent_version_tools', Base.metadata,
 # AI Agent 表
 class AIAgent(Base):
     __tablename__ = 'ai_agents'
+    __table_args__ = (
+        # 列表按分类过滤并按 id 游标分页
+        Index('ix_ai_agents_category', 'category', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
@@ -69,12 +74,21 @@ class AIAgent(Base):
     rating = Column(Float, default=0.0)
     created_date = Column(DateTime, default=datetime.utcnow)
     updated_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 冗余的活跃版本指针，列表查询只需一次 JOIN（由 add_or_update_agent / 灰度转正维护）
+    active_version_id = Column(Integer, ForeignKey('agent_versions.id', use_alter=True,
+                                                   name='fk_ai_agents_active_version'), nullable=True)
     
-    versions = relationship("AgentVersion", back_populates="agent", cascade="all, delete-orphan")
+    versions = relationship("AgentVersion", back_populates="agent", cascade="all, delete-orphan",
+                            foreign_keys="AgentVersion.agent_id")
+    active_version = relationship("AgentVersion", foreign_keys=[active_version_id], post_update=True)
 
 # Agent 版本表
 class AgentVersion(Base):
     __tablename__ = 'agent_versions'
+    __table_args__ = (
+        # 每次读取 Agent 都按 (agent_id, is_active) 查活跃版本
+        Index('ix_agent_versions_agent_active', 'agent_id', 'is_active'),
+    )
     
     id = Column(Integer, primary_key=True)
     agent_id = Column(Integer, ForeignKey('ai_agents.id'))
@@ -93,16 +107,41 @@ class AgentVersion(Base):
     retry_times = Column(Integer, default=0)
     max_concurrent = Column(Integer, default=1)
     
-    agent = relationship("AIAgent", back_populates="versions")
+    agent = relationship("AIAgent", back_populates="versions", foreign_keys=[agent_id])
     dependencies = relationship('AIAgent', secondary=agent_dependency,
                               primaryjoin=(agent_dependency.c.agent_version_id == id),
                               secondaryjoin=(agent_dependency.c.dependency_id == AIAgent.id))
     imports = relationship('Import', secondary=agent_version_imports, back_populates='agent_versions')
     tools = relationship('AgentTool', secondary=agent_version_tools, back_populates='agent_versions')
 
+# Agent 灰度发布表（两个版本按权重分流）
+class AgentCanary(Base):
+    __tablename__ = 'agent_canaries'
+    
+    id = Column(Integer, primary_key=True)
+    agent_id = Column(Integer, ForeignKey('ai_agents.id'), nullable=False, index=True)
+    stable_version_id = Column(Integer, ForeignKey('agent_versions.id'), nullable=False)
+    canary_version_id = Column(Integer, ForeignKey('agent_versions.id'), nullable=False)
+    weight = Column(Float, default=0.1)             # 灰度版本的流量比例 (0-1)
+    p95_regression = Column(Float, default=0.2)     # 灰度 p95 超过稳定版 p95 的比例阈值，超过即自动回滚
+    min_samples = Column(Integer, default=50)       # 两个版本都达到该样本数后才开始比较
+    status = Column(String, default='running')      # running, promoted, rolled_back
+    reason = Column(Text)
+    report = Column(JSON)                           # 结束时的对比统计快照
+    created_date = Column(DateTime, default=datetime.utcnow)
+    ended_date = Column(DateTime)
+    
+    agent = relationship('AIAgent')
+    stable_version = relationship('AgentVersion', foreign_keys=[stable_version_id])
+    canary_version = relationship('AgentVersion', foreign_keys=[canary_version_id])
+
 # 工作流表
 class Workflow(Base):
     __tablename__ = 'workflows'
+    __table_args__ = (
+        Index('ix_workflows_category', 'category', 'id'),
+        Index('ix_workflows_status', 'status', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -119,6 +158,7 @@ class Workflow(Base):
     success_count = Column(Integer, default=0)
     fail_count = Column(Integer, default=0)
     avg_execution_time = Column(Float, default=0.0)
+    total_execution_time = Column(Float, default=0.0)  # 累计执行时间，平均值由它除以次数得到
     created_by = Column(String)
     shared_with = Column(JSON)
     created_date = Column(DateTime, default=datetime.utcnow)
@@ -127,21 +167,26 @@ class Workflow(Base):
     
     executions = relationship('WorkflowExecution', back_populates='workflow', cascade="all, delete-orphan")
     api_keys = relationship('WorkflowAPIKey', back_populates='workflow', cascade="all, delete-orphan")
+    folded_outputs = relationship('FoldedNodeOutput', back_populates='workflow', cascade="all, delete-orphan")
 
 # 工作流执行记录表
 class WorkflowExecution(Base):
     __tablename__ = 'workflow_executions'
+    __table_args__ = (
+        Index('ix_workflow_executions_workflow_started', 'workflow_id', 'started_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     workflow_id = Column(Integer, ForeignKey('workflows.id'))
     status = Column(String, default='pending')
-    input_data = Column(JSON)
-    output_data = Column(JSON)
+    # 大字段压缩存储，且默认延迟加载（列表查询不读取、不解压）
+    input_data = deferred(Column(CompressedJSON), group='payload')
+    output_data = deferred(Column(CompressedJSON), group='payload')
     started_at = Column(DateTime)
     completed_at = Column(DateTime)
     execution_time = Column(Float)
     error_message = Column(Text)
-    execution_graph = Column(JSON)
+    execution_graph = deferred(Column(CompressedJSON), group='payload')
     tokens_used = Column(Integer, default=0)
     cost = Column(Float, default=0.0)
     triggered_by = Column(String)
@@ -149,6 +194,20 @@ class WorkflowExecution(Base):
     
     workflow = relationship('Workflow', back_populates='executions')
 
+# 常量折叠结果表（纯函数Agent + 字面量参数的节点在保存/发布时预先计算）
+class FoldedNodeOutput(Base):
+    __tablename__ = 'folded_node_outputs'
+    
+    id = Column(Integer, primary_key=True)
+    workflow_id = Column(Integer, ForeignKey('workflows.id'), nullable=False, index=True)
+    agent_name = Column(String, nullable=False)
+    params_hash = Column(String(64), nullable=False)
+    agent_fingerprint = Column(String(64), nullable=False)  # Agent代码指纹，版本或代码变化即失效
+    output = Column(JSON)
+    created_date = Column(DateTime, default=datetime.utcnow)
+    
+    workflow = relationship('Workflow', back_populates='folded_outputs')
+
 # Agent 工具表
 class AgentTool(Base):
     __tablename__ = 'agent_tools'
@@ -183,15 +242,27 @@ class Import(Base):
 # 日志表
 class Log(Base):
     __tablename__ = 'logs'
+    __table_args__ = (
+        # get_logs 按 agent_name 过滤、按 timestamp 倒序；不带过滤时直接按 timestamp 倒序
+        Index('ix_logs_agent_timestamp', 'agent_name', 'timestamp'),
+        Index('ix_logs_timestamp', 'timestamp'),
+        # 日志保留按 log_type 分别删除过期数据
+        Index('ix_logs_type_timestamp', 'log_type', 'timestamp'),
+        # 删除/归档执行记录时查找其日志
+        Index('ix_logs_workflow_execution', 'workflow_execution_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     workflow_execution_id = Column(Integer, ForeignKey('workflow_executions.id'), nullable=True)
     agent_name = Column(String, nullable=False)
     message = Column(String, nullable=False)
     timestamp = Column(DateTime, nullable=False)
-    params = Column(JSON, nullable=True)
-    output = Column(JSON, nullable=True)
+    params = deferred(Column(CompressedJSON, nullable=True), group='payload')
+    output = deferred(Column(CompressedJSON, nullable=True), group='payload')
     time_spent = Column(Float, nullable=True)
+    cpu_time = Column(Float, nullable=True)        # 线程CPU时间（秒），仅在开启资源统计时记录
+    peak_memory = Column(Integer, nullable=True)   # 执行期间进程级 tracemalloc 峰值分配（字节，并发时含其他Agent）
+    output_size = Column(Integer, nullable=True)   # 输出结果序列化后的大小（字节）
     log_type = Column(String, nullable=False)
     level = Column(String, default='INFO')
     tags = Column(JSON)
@@ -202,6 +273,53 @@ class Log(Base):
     parent_log = relationship('Log', remote_side=[id], backref='child_logs', foreign_keys=[parent_log_id])
     triggered_by_log = relationship('Log', remote_side=[id], backref='triggered_logs', foreign_keys=[triggered_by_log_id])
 
+# 日志汇总表（按小时/天聚合，原始日志过期删除后仪表盘仍可查询）
+class LogRollup(Base):
+    __tablename__ = 'log_rollups'
+    __table_args__ = (
+        UniqueConstraint('period', 'bucket_start', 'agent_name', name='uq_log_rollup_bucket'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    period = Column(String(8), nullable=False)          # 'hour' 或 'day'
+    bucket_start = Column(DateTime, nullable=False)
+    agent_name = Column(String, nullable=False)
+    count = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    time_sum = Column(Float, default=0.0)                # 执行耗时总和（秒）
+
+# 已归档执行记录索引（记录本体在 gzip NDJSON 分段文件中，按偏移直接读取）
+class ArchivedExecution(Base):
+    __tablename__ = 'archived_executions'
+    __table_args__ = (
+        Index('ix_archived_executions_workflow_started', 'workflow_id', 'started_at'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # 原执行记录 ID
+    workflow_id = Column(Integer, nullable=False)                 # 不设外键：工作流删除后归档仍可查
+    status = Column(String)
+    started_at = Column(DateTime)
+    segment = Column(String, nullable=False)                      # 相对归档根目录的分段文件路径
+    byte_offset = Column(Integer, nullable=False)                 # gzip 成员在文件中的起始偏移
+    byte_length = Column(Integer, nullable=False)
+    log_count = Column(Integer, default=0)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+# 统计计数表（仪表盘汇总数据，随 Agent/工作流/执行变更增量维护）
+class StatCounter(Base):
+    __tablename__ = 'stat_counters'
+    
+    name = Column(String(64), primary_key=True)
+    value = Column(Float, nullable=False, default=0.0)
+    updated_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# ID 号段表（多个进程各自预留一段 id，见 backend/id_blocks.py）
+class IdSequence(Base):
+    __tablename__ = 'id_sequences'
+    
+    name = Column(String(64), primary_key=True)
+    next_value = Column(Integer, nullable=False)      # 下一个未被预留的 id
+
 # 用户表
 class User(Base):
     __tablename__ = 'users'
@@ -240,6 +358,10 @@ class User(Base):
 class ChatSession(Base):
     """AI对话会话"""
     __tablename__ = 'chat_sessions'
+    __table_args__ = (
+        Index('ix_chat_sessions_updated', 'updated_at'),
+        Index('ix_chat_sessions_user_updated', 'user_id', 'updated_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
@@ -251,6 +373,9 @@ class ChatSession(Base):
 class ChatMessage(Base):
     """AI对话消息"""
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        Index('ix_chat_messages_session_created', 'session_id', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('chat_sessions.id'), nullable=False)
@@ -0,0 +1,215 @@
+# ============================================================================
+# 后端层 - 全文搜索 (Backend - Full-Text Search)
+# ============================================================================
+# SQLite 上用 FTS5 虚拟表 search_index 索引：
+#   - Agent：名称（标题）+ 描述、分类、标签、活跃版本代码
+#   - 工作流：名称（标题）+ 描述、分类
+#   - 对话消息：内容（只返回当前用户自己的会话）
+# 索引由数据库触发器维护，ORM、Core 批量更新和集合删除都会同步。
+# rowid = 源表 id * 4 + 类型编号，更新和删除按 rowid 定位，不扫描索引。
+# 优先使用 trigram 分词（中文按子串匹配），不可用时退回 unicode61。
+# 非 SQLite 数据库或 FTS5 不可用、以及 trigram 下少于 3 个字符的查询词，
+# 退回到对源表的 LIKE 查询。
+# ============================================================================
+
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import or_, text
+
+from backend.models import AIAgent, Workflow, ChatMessage, ChatSession
+
+
+KINDS = ('agent', 'workflow', 'chat')
+SNIPPET_OPEN, SNIPPET_CLOSE = '【', '】'
+
+_AGENT_BODY = (
+    "coalesce({a}.description, '') || ' ' || coalesce({a}.category, '') || ' ' || "
+    "coalesce({a}.tags, '') || ' ' || "
+    "coalesce((SELECT code FROM agent_versions WHERE id = {a}.active_version_id), '')"
+)
+_AGENT_ROW = (
+    "INSERT INTO search_index(rowid, kind, ref_id, parent_id, owner, title, body) "
+    "SELECT {a}.id * 4 + 1, 'agent', {a}.id, NULL, {a}.author, {a}.name, " + _AGENT_BODY
+)
+_WORKFLOW_ROW = (
+    "INSERT INTO search_index(rowid, kind, ref_id, parent_id, owner, title, body) "
+    "SELECT {w}.id * 4 + 2, 'workflow', {w}.id, NULL, {w}.created_by, {w}.name, "
+    "coalesce({w}.description, '') || ' ' || coalesce({w}.category, '')"
+)
+_CHAT_ROW = (
+    "INSERT INTO search_index(rowid, kind, ref_id, parent_id, owner, title, body) "
+    "SELECT {m}.id * 4 + 3, 'chat', {m}.id, {m}.session_id, "
+    "(SELECT user_id FROM chat_sessions WHERE id = {m}.session_id), '', {m}.content"
+)
+
+_TRIGGERS = [
+    # Agent：只在影响索引内容的列变化时重建（执行统计刷盘不触发）
+    "CREATE TRIGGER IF NOT EXISTS search_agent_insert AFTER INSERT ON ai_agents BEGIN "
+    + _AGENT_ROW.format(a='new') + "; END",
+    "CREATE TRIGGER IF NOT EXISTS search_agent_update "
+    "AFTER UPDATE OF name, description, category, tags, author, active_version_id ON ai_agents BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; "
+    + _AGENT_ROW.format(a='new') + "; END",
+    "CREATE TRIGGER IF NOT EXISTS search_agent_delete AFTER DELETE ON ai_agents BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS search_agent_code_update AFTER UPDATE OF code ON agent_versions BEGIN "
+    "DELETE FROM search_index WHERE rowid IN (SELECT id * 4 + 1 FROM ai_agents WHERE active_version_id = new.id); "
+    + _AGENT_ROW.format(a='a') + " FROM ai_agents a WHERE a.active_version_id = new.id; END",
+    # 工作流
+    "CREATE TRIGGER IF NOT EXISTS search_workflow_insert AFTER INSERT ON workflows BEGIN "
+    + _WORKFLOW_ROW.format(w='new') + "; END",
+    "CREATE TRIGGER IF NOT EXISTS search_workflow_update "
+    "AFTER UPDATE OF name, description, category, created_by ON workflows BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; "
+    + _WORKFLOW_ROW.format(w='new') + "; END",
+    "CREATE TRIGGER IF NOT EXISTS search_workflow_delete AFTER DELETE ON workflows BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; END",
+    # 对话消息
+    "CREATE TRIGGER IF NOT EXISTS search_chat_insert AFTER INSERT ON chat_messages BEGIN "
+    + _CHAT_ROW.format(m='new') + "; END",
+    "CREATE TRIGGER IF NOT EXISTS search_chat_update AFTER UPDATE OF content ON chat_messages BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; "
+    + _CHAT_ROW.format(m='new') + "; END",
+    "CREATE TRIGGER IF NOT EXISTS search_chat_delete AFTER DELETE ON chat_messages BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; END",
+]
+
+
+def ensure_search_index(engine) -> Optional[str]:
+    """创建 FTS5 索引表和触发器（首次创建时从源表全量填充）；返回分词器名，不可用时返回 None"""
+    if engine.dialect.name != 'sqlite':
+        return None
+
+    with engine.begin() as conn:
+        existing = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).scalar()
+    if existing:
+        tokenizer = 'trigram' if 'trigram' in existing else 'unicode61'
+    else:
+        tokenizer = None
+        for candidate in ('trigram', 'unicode61'):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "CREATE VIRTUAL TABLE search_index USING fts5("
+                        "kind UNINDEXED, ref_id UNINDEXED, parent_id UNINDEXED, owner UNINDEXED, "
+                        f"title, body, tokenize='{candidate}')"
+                    ))
+                tokenizer = candidate
+                break
+            except Exception:
+                continue
+        if tokenizer is None:
+            print("  ⚠️ SQLite 不支持 FTS5，搜索将使用 LIKE 查询")
+            return None
+
+    with engine.begin() as conn:
+        for trigger in _TRIGGERS:
+            conn.execute(text(trigger))
+        if not existing:
+            conn.execute(text(_AGENT_ROW.format(a='a') + " FROM ai_agents a"))
+            conn.execute(text(_WORKFLOW_ROW.format(w='w') + " FROM workflows w"))
+            conn.execute(text(_CHAT_ROW.format(m='m') + " FROM chat_messages m"))
+            print(f"  ✓ 全文索引已建立 (tokenizer: {tokenizer})")
+    return tokenizer
+
+
+def _terms(query: str) -> List[str]:
+    return [term for term in (query or '').split() if term]
+
+
+def _match_expression(terms: Sequence[str], tokenizer: str) -> str:
+    # 每个词作为短语加引号，避免用户输入被解析成 FTS5 运算符；多个词为 AND
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    if tokenizer == 'unicode61':
+        quoted = [term + '*' for term in quoted]
+    return ' '.join(quoted)
+
+
+def search(session, query: str, tokenizer: Optional[str], kinds: Sequence[str] = KINDS,
+           user_id: Optional[int] = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    """按相关度排序搜索；对话消息只在 user_id 给定时搜索其本人的会话"""
+    terms = _terms(query)
+    kinds = [kind for kind in kinds if kind in KINDS and (kind != 'chat' or user_id is not None)]
+    if not terms or not kinds:
+        return []
+
+    if tokenizer is None or (tokenizer == 'trigram' and any(len(term) < 3 for term in terms)):
+        return _search_like(session, terms, kinds, user_id, limit, offset)
+
+    kind_params = {f'kind{i}': kind for i, kind in enumerate(kinds)}
+    rows = session.execute(text(
+        "SELECT kind, ref_id, parent_id, title, "
+        f"snippet(search_index, 5, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 48) AS snippet, "
+        # 标题命中的权重是正文的 10 倍；bm25 越小越相关
+        "bm25(search_index, 0, 0, 0, 0, 10.0, 1.0) AS score "
+        "FROM search_index WHERE search_index MATCH :query "
+        f"AND kind IN ({', '.join(':' + name for name in kind_params)}) "
+        "AND (kind != 'chat' OR owner = :user_id) "
+        "ORDER BY score LIMIT :limit OFFSET :offset"
+    ), {
+        'query': _match_expression(terms, tokenizer),
+        'user_id': user_id,
+        'limit': limit,
+        'offset': offset,
+        **kind_params
+    }).all()
+
+    results = []
+    for row in rows:
+        item = {'kind': row.kind, 'id': row.ref_id, 'title': row.title, 'snippet': row.snippet,
+                'score': -row.score}
+        if row.kind == 'chat':
+            item['session_id'] = row.parent_id
+        results.append(item)
+    return results
+
+
+def _excerpt(content: Optional[str], terms: Sequence[str], width: int = 48) -> str:
+    content = content or ''
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - width // 2) if positions else 0
+    excerpt = content[start:start + width * 2]
+    return ('…' if start > 0 else '') + excerpt + ('…' if start + width * 2 < len(content) else '')
+
+
+def _search_like(session, terms, kinds, user_id, limit, offset) -> List[Dict[str, Any]]:
+    """LIKE 回退：每个词都需命中任一字段；标题命中的排在前面，其次按 id 倒序"""
+    candidates = []
+    fetch = offset + limit
+
+    def _matches(columns):
+        return [or_(*[column.ilike(f'%{term}%') for column in columns]) for term in terms]
+
+    if 'agent' in kinds:
+        for agent in session.query(AIAgent.id, AIAgent.name, AIAgent.description)\
+                .filter(*_matches([AIAgent.name, AIAgent.description, AIAgent.category]))\
+                .order_by(AIAgent.id.desc()).limit(fetch):
+            candidates.append(({'kind': 'agent', 'id': agent.id, 'title': agent.name,
+                                'snippet': _excerpt(agent.description, terms)}, agent.name))
+    if 'workflow' in kinds:
+        for workflow in session.query(Workflow.id, Workflow.name, Workflow.description)\
+                .filter(*_matches([Workflow.name, Workflow.description, Workflow.category]))\
+                .order_by(Workflow.id.desc()).limit(fetch):
+            candidates.append(({'kind': 'workflow', 'id': workflow.id, 'title': workflow.name,
+                                'snippet': _excerpt(workflow.description, terms)}, workflow.name))
+    if 'chat' in kinds:
+        for message in session.query(ChatMessage.id, ChatMessage.session_id, ChatMessage.content)\
+                .join(ChatSession, ChatSession.id == ChatMessage.session_id)\
+                .filter(ChatSession.user_id == user_id, *_matches([ChatMessage.content]))\
+                .order_by(ChatMessage.id.desc()).limit(fetch):
+            candidates.append(({'kind': 'chat', 'id': message.id, 'title': '', 'session_id': message.session_id,
+                                'snippet': _excerpt(message.content, terms)}, ''))
+
+    def _title_hits(candidate):
+        title = (candidate[1] or '').lower()
+        return sum(1 for term in terms if term.lower() in title)
+
+    candidates.sort(key=_title_hits, reverse=True)
+    results = []
+    for item, _ in candidates[offset:offset + limit]:
+        item['score'] = None
+        results.append(item)
+    return results
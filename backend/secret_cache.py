@@ -0,0 +1,63 @@
+# ============================================================================
+# 后端层 - 密钥缓存 (Backend - Secret Cache)
+# ============================================================================
+# 解密后的密钥保存在进程内存中，避免每次读取都查询数据库并做 Fernet 解密。
+# 写入密钥时递增版本号并清空缓存（事务提交后再递增一次）：读取方在查询
+# 数据库前记下版本号，放入缓存时版本号已变化则丢弃，不会把并发写入前的旧值写回缓存。
+# 可选 TTL 兜底其他进程写入的变更（本进程无法感知）。
+# ============================================================================
+
+from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+
+
+_MISSING = object()
+
+
+class SecretCache:
+    """带版本号失效和可选 TTL 的密钥缓存（线程安全）"""
+
+    def __init__(self, ttl: float = 300.0):
+        # ttl <= 0 表示只按版本号失效，不过期
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[Optional[str], float]] = {}
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def get(self, name: str) -> Any:
+        """命中时返回缓存值（可能是 None，表示密钥不存在），未命中返回 _MISSING"""
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is not None and (self.ttl <= 0 or time.monotonic() - entry[1] < self.ttl):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return _MISSING
+
+    def put(self, name: str, value: Optional[str], version: int):
+        """放入缓存；读取期间发生过写入（版本号变化）时丢弃"""
+        with self._lock:
+            if version == self._version:
+                self._values[name] = (value, time.monotonic())
+
+    def invalidate(self, *_):
+        with self._lock:
+            self._version += 1
+            self._values.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._values), 'version': self._version,
+                    'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+
+def is_missing(value: Any) -> bool:
+    return value is _MISSING
@@ -0,0 +1,145 @@
+# ============================================================================
+# 后端层 - SQL 分析 (Backend - SQL Profiler)
+# ============================================================================
+# 通过 SQLAlchemy 引擎事件统计每个请求执行的 SQL 条数和耗时：
+#   - 请求开始时 begin()，结束时 end() 返回本次请求的统计（由 app.py 写入响应头）
+#   - 同一语句模板（参数占位、IN 列表折叠后）在一个请求内重复超过阈值时
+#     打印 N+1 警告
+#   - 保留最近的请求记录和按接口累计的统计，供调试接口查询
+# 只统计请求线程上执行的 SQL；后台线程（日志写入、统计刷盘等）不计入。
+# 执行历史使用独立数据库时同时监听两个 Engine。
+# ============================================================================
+
+from typing import Any, Dict, List, Optional
+from collections import Counter, deque
+from datetime import datetime
+from sqlalchemy import event
+import re
+import threading
+import time
+
+
+_WHITESPACE = re.compile(r'\s+')
+# IN (?, ?, ?) / IN (%s, %s) / IN (:p1, :p2) 折叠成一个模板，参数个数不同的同一查询视为同一语句
+_PARAM_LIST = re.compile(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))+\s*\)')
+
+
+def statement_template(statement: str) -> str:
+    return _PARAM_LIST.sub('(?...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class _RequestStats:
+    __slots__ = ('label', 'queries', 'seconds', 'templates')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.queries = 0
+        self.seconds = 0.0
+        self.templates = Counter()
+
+
+class SQLProfiler:
+    """按请求统计 SQL 条数与耗时，并检测 N+1 查询"""
+
+    def __init__(self, engines, n_plus_one_threshold: int = 10, history: int = 100):
+        self.engines = list(engines) if isinstance(engines, (list, tuple)) else [engines]
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=max(1, history))
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def close(self):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # ========================================================================
+    # 引擎事件
+    # ========================================================================
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'stats', None) is not None:
+            conn.info.setdefault('sql_profiler_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(self._local, 'stats', None)
+        starts = conn.info.get('sql_profiler_start')
+        if stats is None or not starts:
+            return
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - starts.pop()
+        stats.templates[statement_template(statement)] += 1
+
+    # ========================================================================
+    # 请求生命周期
+    # ========================================================================
+
+    def begin(self, label: str):
+        """开始统计当前线程上的请求"""
+        self._local.stats = _RequestStats(label)
+
+    def end(self, status: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """结束统计，返回本次请求的汇总；未调用 begin 时返回 None"""
+        stats = getattr(self._local, 'stats', None)
+        self._local.stats = None
+        if stats is None:
+            return None
+
+        repeated = [
+            {'statement': template, 'count': count}
+            for template, count in stats.templates.most_common()
+            if count > self.n_plus_one_threshold
+        ]
+        for item in repeated:
+            print(f"[SQLProfiler] ⚠️ 疑似 N+1: {stats.label} 中同一语句执行了 {item['count']} 次: "
+                  f"{item['statement'][:200]}")
+
+        summary = {
+            'request': stats.label,
+            'status': status,
+            'queries': stats.queries,
+            'time_ms': round(stats.seconds * 1000, 3),
+            'distinct_statements': len(stats.templates),
+            'repeated': repeated,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        with self._lock:
+            self._recent.append(summary)
+            endpoint = self._endpoints.setdefault(stats.label, {
+                'requests': 0, 'queries': 0, 'time_ms': 0.0, 'max_queries': 0, 'n_plus_one': 0
+            })
+            endpoint['requests'] += 1
+            endpoint['queries'] += stats.queries
+            endpoint['time_ms'] += summary['time_ms']
+            endpoint['max_queries'] = max(endpoint['max_queries'], stats.queries)
+            if repeated:
+                endpoint['n_plus_one'] += 1
+        return summary
+
+    # ========================================================================
+    # 查询
+    # ========================================================================
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+    def endpoints(self) -> List[Dict[str, Any]]:
+        """按接口累计的统计，平均查询数多的在前"""
+        with self._lock:
+            rows = [
+                dict(values, request=label,
+                     avg_queries=values['queries'] / values['requests'],
+                     avg_time_ms=values['time_ms'] / values['requests'])
+                for label, values in self._endpoints.items()
+            ]
+        return sorted(rows, key=lambda row: row['avg_queries'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._endpoints.clear()
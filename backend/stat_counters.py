@@ -0,0 +1,124 @@
+# ============================================================================
+# 后端层 - 统计计数 (Backend - Stat Counters)
+# ============================================================================
+# /api/stats 和各页面仪表盘读取 stat_counters 表中的少量计数行，
+# 不再加载全部 Agent 和工作流。计数在同一事务内增量维护：
+#   - Agent / 工作流 / 用户的新增和删除：ORM mapper 事件（覆盖所有删除入口）
+#   - 工作流执行完成：update_workflow_execution 中显式累加
+#   - Agent 成功率：AgentStatsAggregator 刷盘时按受影响的 Agent 累加差值
+# 启动时计数行缺失（新库或首次升级）则按全表聚合重建。
+# ============================================================================
+
+from typing import Dict
+from sqlalchemy import event, func, select
+
+from backend.models import AIAgent, Workflow, User, StatCounter
+
+
+COUNTERS = (
+    'agent_count',
+    'workflow_count',
+    'user_count',
+    'total_executions',          # 所有工作流的执行次数之和
+    'agent_success_rate_sum',    # 所有 Agent 成功率（百分比）之和，除以 agent_count 即平均值
+    'workflow_success_rate_sum', # 所有工作流成功率（百分比）之和，除以 workflow_count 即平均值
+)
+
+_table = StatCounter.__table__
+
+
+def increment(connection, name: str, delta: float):
+    """原子累加计数；connection 可以是 Session 或 Connection"""
+    if not delta:
+        return
+    connection.execute(
+        _table.update()
+        .where(_table.c.name == name)
+        .values(value=_table.c.value + delta, updated_date=func.now())
+    )
+
+
+def read(session) -> Dict[str, float]:
+    rows = session.execute(select(_table.c.name, _table.c.value)).all()
+    values = {name: 0.0 for name in COUNTERS}
+    values.update({name: value for name, value in rows})
+    return values
+
+
+def workflow_success_rate(success_count, total_executions) -> float:
+    return success_count / total_executions * 100 if total_executions else 0.0
+
+
+def rebuild(connection):
+    """按全表聚合重建全部计数（O(N)，只在启动缺失或手动修复时调用）"""
+    workflows = connection.execute(select(
+        func.count(Workflow.id),
+        func.coalesce(func.sum(Workflow.total_executions), 0)
+    )).one()
+    workflow_rates = connection.execute(select(Workflow.success_count, Workflow.total_executions)).all()
+
+    values = {
+        'agent_count': connection.execute(select(func.count(AIAgent.id))).scalar(),
+        'workflow_count': workflows[0],
+        'user_count': connection.execute(select(func.count(User.id))).scalar(),
+        'total_executions': workflows[1],
+        'agent_success_rate_sum': connection.execute(
+            select(func.coalesce(func.sum(AIAgent.success_rate), 0.0))
+        ).scalar(),
+        'workflow_success_rate_sum': sum(
+            workflow_success_rate(success or 0, total or 0) for success, total in workflow_rates
+        ),
+    }
+
+    connection.execute(_table.delete())
+    connection.execute(_table.insert(), [{'name': name, 'value': float(value or 0)} for name, value in values.items()])
+    return values
+
+
+def ensure(engine):
+    """计数行不完整时重建"""
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(select(_table.c.name))}
+        if set(COUNTERS) - existing:
+            rebuild(conn)
+            print("  ✓ 统计计数已重建")
+
+
+# ============================================================================
+# ORM 事件：新增/删除时在同一事务内维护计数
+# ============================================================================
+
+@event.listens_for(AIAgent, 'after_insert')
+def _agent_inserted(mapper, connection, target):
+    increment(connection, 'agent_count', 1)
+    increment(connection, 'agent_success_rate_sum', target.success_rate or 0.0)
+
+
+@event.listens_for(AIAgent, 'after_delete')
+def _agent_deleted(mapper, connection, target):
+    increment(connection, 'agent_count', -1)
+    increment(connection, 'agent_success_rate_sum', -(target.success_rate or 0.0))
+
+
+@event.listens_for(Workflow, 'after_insert')
+def _workflow_inserted(mapper, connection, target):
+    increment(connection, 'workflow_count', 1)
+    increment(connection, 'total_executions', target.total_executions or 0)
+
+
+@event.listens_for(Workflow, 'after_delete')
+def _workflow_deleted(mapper, connection, target):
+    increment(connection, 'workflow_count', -1)
+    increment(connection, 'total_executions', -(target.total_executions or 0))
+    increment(connection, 'workflow_success_rate_sum',
+              -workflow_success_rate(target.success_count or 0, target.total_executions or 0))
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    increment(connection, 'user_count', 1)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    increment(connection, 'user_count', -1)
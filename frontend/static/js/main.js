@@ -6,30 +6,14 @@
 // 加载统计数据
 async function loadStats() {
     try {
-        // 加载 Agent 数量
-        const agentsResp = await fetch('/api/agents');
-        if (agentsResp.ok) {
-            const agents = await agentsResp.json();
-            document.getElementById('agent-count').textContent = agents.length;
-        }
-        
-        // 加载工作流数量
-        const workflowsResp = await fetch('/api/workflows');
-        if (workflowsResp.ok) {
-            const workflows = await workflowsResp.json();
-            document.getElementById('workflow-count').textContent = workflows.length;
-            
-            // 计算总执行次数和成功率
-            let totalExec = workflows.reduce((sum, w) => sum + (w.total_executions || 0), 0);
-            document.getElementById('execution-count').textContent = totalExec;
-            
-            if (workflows.length > 0 && totalExec > 0) {
-                let avgSuccess = workflows.reduce((sum, w) => sum + (w.success_rate || 0), 0) / workflows.length;
-                document.getElementById('success-rate').textContent = avgSuccess.toFixed(1) + '%';
-            } else {
-                document.getElementById('success-rate').textContent = '0%';
-            }
-        }
+        const resp = await fetch('/api/stats');
+        if (!resp.ok) return;
+        const stats = await resp.json();
+        document.getElementById('agent-count').textContent = stats.agent_count;
+        document.getElementById('workflow-count').textContent = stats.workflow_count;
+        document.getElementById('execution-count').textContent = stats.total_executions;
+        document.getElementById('success-rate').textContent =
+            stats.total_executions > 0 ? stats.workflow_avg_success_rate.toFixed(1) + '%' : '0%';
     } catch (error) {
         console.error('加载统计数据失败:', error);
     }
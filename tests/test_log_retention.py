@@ -0,0 +1,41 @@
+# ============================================================================
+# 测试 - 日志保留与冷归档 (Tests - Log Retention)
+# ============================================================================
+
+from datetime import datetime, timedelta
+import os
+
+from backend.archive import ExecutionArchive
+from backend.database import Database
+from backend.log_retention import LogCompactor
+from backend.models import Log
+
+
+def test_node_logs_follow_log_type_ttl_with_archive(tmp_path):
+    """开启冷归档时，执行日志仍按 log_type 的保留天数删除，并写入所属工作流的归档目录"""
+    db = Database(f"sqlite:///{tmp_path / 'agentflow.db'}")
+    archive = ExecutionArchive(db, root=str(tmp_path / 'archive'), after_days=90, interval=0)
+    compactor = LogCompactor(db, retention={'info': 7}, interval=0, archive=archive)
+    now = datetime.utcnow()
+
+    with db.session_scope() as session:
+        workflow_id = db.create_workflow(session, 'w', '', {'agents': []})
+    with db.session_scope() as session:
+        execution_id = db.create_workflow_execution(session, workflow_id, {}, 'completed', now - timedelta(days=8))
+    with db.session_scope() as session:
+        expired = db.add_log(session, 'a', 'old', now - timedelta(days=8), {}, {}, 0.1,
+                             workflow_execution_id=execution_id)
+        kept = db.add_log(session, 'a', 'new', now - timedelta(days=3), {}, {}, 0.1,
+                          workflow_execution_id=execution_id)
+
+    assert compactor.run_once(now)['deleted_logs'] == 1
+    with db.session_scope() as session:
+        assert [row[0] for row in session.query(Log.id)] == [kept]
+    assert expired != kept
+
+    workflow_dir = tmp_path / 'archive' / 'workflows' / str(workflow_id)
+    assert os.listdir(workflow_dir) == [f"logs-{(now - timedelta(days=8)).strftime('%Y-%m')}.ndjson.gz"]
+    assert not (tmp_path / 'archive' / 'logs').exists()
+
+    archive.drop_workflow(workflow_id)
+    assert not workflow_dir.exists()